@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Simulación del límite de concurrencia adaptativo frente a un backend con "codo" de capacidad.
+
+El backend falso atiende `--knee` llamadas en paralelo con latencia base; por
+encima del codo la latencia crece en proporción a la carga y, con más del
+triple, responde 503. `--clients` clientes en bucle cerrado llaman a través del
+limitador; se muestra cómo converge el límite y el throughput/latencia finales
+de cada algoritmo frente a un tope estático.
+
+Uso:
+    python benchmarks/bench_adaptive_concurrency.py --clients 200 --knee 40 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from google.genai import errors as genai_errors  # noqa: E402
+from concurrency_limit import AdaptiveConcurrencyLimiter, AIMDLimit, GradientLimit  # noqa: E402
+from logging_config import setup_logging  # noqa: E402
+
+
+class StaticLimit:
+    """Tope fijo, como el semáforo MAX_CONCURRENT_REQUESTS"""
+
+    name = "static"
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.min_limit = self.max_limit = limit
+
+    def update(self, rtt, in_flight, dropped):
+        return self.limit
+
+    def stats(self):
+        return {}
+
+
+class KneeBackend:
+    """Backend con capacidad `knee`: más carga = más latencia y, al final, 503"""
+
+    def __init__(self, knee: int, base_latency: float):
+        self.knee = knee
+        self.base_latency = base_latency
+        self.active = 0
+
+    async def call(self):
+        self.active += 1
+        try:
+            if self.active > 3 * self.knee:
+                await asyncio.sleep(self.base_latency / 10)
+                raise genai_errors.APIError(503, {"error": {"message": "overloaded", "status": "UNAVAILABLE"}})
+            await asyncio.sleep(self.base_latency * max(1.0, self.active / self.knee))
+        finally:
+            self.active -= 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+async def simulate(algorithm, args) -> dict:
+    limiter = AdaptiveConcurrencyLimiter(algorithm)
+    backend = KneeBackend(args.knee, args.base_latency)
+    latencies, errors = [], 0
+    timeline = []
+    deadline = time.monotonic() + args.seconds
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            try:
+                async with limiter.slot():
+                    start = time.monotonic()
+                    await backend.call()
+                    latencies.append(time.monotonic() - start)
+            except genai_errors.APIError:
+                errors += 1
+
+    async def sample():
+        while time.monotonic() < deadline:
+            timeline.append(limiter.limit)
+            await asyncio.sleep(args.seconds / 10)
+
+    await asyncio.gather(sample(), *[client() for _ in range(args.clients)])
+    tail = latencies[len(latencies) // 2:]  # latencia del backend en la segunda mitad (ya convergido)
+    return {
+        "algorithm": algorithm.name,
+        "timeline": timeline,
+        "final_limit": limiter.limit,
+        "throughput": len(latencies) / args.seconds,
+        "errors": errors,
+        "p50_ms": percentile(tail, 50) * 1000,
+        "p99_ms": percentile(tail, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=200, help="Clientes concurrentes en bucle cerrado")
+    parser.add_argument("--knee", type=int, default=40, help="Capacidad del backend antes de degradarse")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="Latencia sin carga (s)")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--max-limit", type=int, default=256)
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    algorithms = [
+        StaticLimit(args.max_limit),
+        AIMDLimit(initial=10, max_limit=args.max_limit, rtt_threshold=args.base_latency * 2),
+        GradientLimit(initial=10, max_limit=args.max_limit),
+    ]
+    print(f"knee={args.knee}, clients={args.clients}, base latency={args.base_latency * 1000:.0f}ms\n")
+    print(f"{'algorithm':<10} {'limit':>6} {'req/s':>8} {'errors':>7} {'p50_ms':>8} {'p99_ms':>8}  limit timeline (upstream latency)")
+    for algorithm in algorithms:
+        result = asyncio.run(simulate(algorithm, args))
+        print(
+            f"{result['algorithm']:<10} {result['final_limit']:>6} {result['throughput']:>8.1f} "
+            f"{result['errors']:>7} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}  "
+            f"{' '.join(str(limit) for limit in result['timeline'])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
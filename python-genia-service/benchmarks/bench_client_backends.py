@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los backends del cliente de Gemini (async vs thread).
+
+Lanza N consultas concurrentes contra un cliente falso local cuya llamada tarda
+un tiempo fijo, y mide peticiones por segundo, threads vivos y memoria pico.
+
+Uso:
+    python benchmarks/bench_client_backends.py --concurrency 500 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from logging_config import setup_logging  # noqa: E402
+from models import QueryRequest  # noqa: E402
+from services import GeniaAPIService  # noqa: E402
+
+
+class FakeResponse:
+    """Respuesta mínima con la interfaz que usa el servicio"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+        self.candidates = None
+
+
+class FakeModels:
+    """Equivalente síncrono de client.models con latencia fija"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.delay)
+        return FakeResponse("ok")
+
+
+class FakeAsyncModels:
+    """Equivalente asíncrono de client.aio.models con latencia fija"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.delay)
+        return FakeResponse("ok")
+
+
+class FakeClient:
+    """Cliente falso con las superficies síncrona y asíncrona del SDK"""
+
+    def __init__(self, delay: float):
+        self.models = FakeModels(delay)
+        self.aio = type("Aio", (), {})()
+        self.aio.models = FakeAsyncModels(delay)
+
+
+async def run_backend(backend: str, concurrency: int, delay: float) -> dict:
+    service = GeniaAPIService()
+    service.client = FakeClient(delay)
+    service.backend = backend
+    service.cache = None
+    service.single_flight = None
+    service.max_concurrency = concurrency
+    service._concurrency = asyncio.Semaphore(concurrency)
+
+    requests = [QueryRequest(prompt=f"Prompt {i}", temperature=0.0) for i in range(concurrency)]
+    peak_threads = threading.active_count()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while True:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.ensure_future(sample_threads())
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*[service.query(r) for r in requests])
+    elapsed = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sampler.cancel()
+    service.close()
+
+    return {
+        "backend": backend,
+        "requests": concurrency,
+        "elapsed_s": elapsed,
+        "req_per_s": concurrency / elapsed,
+        "peak_threads": peak_threads,
+        "peak_memory_mb": peak_memory / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--delay", type=float, default=0.5, help="Latencia falsa por llamada (s)")
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    print(f"{'backend':<8} {'requests':>8} {'elapsed_s':>10} {'req/s':>10} {'threads':>8} {'mem_MB':>8}")
+    for backend in ("async", "thread"):
+        result = asyncio.run(run_backend(backend, args.concurrency, args.delay))
+        print(
+            f"{result['backend']:<8} {result['requests']:>8} {result['elapsed_s']:>10.2f} "
+            f"{result['req_per_s']:>10.1f} {result['peak_threads']:>8} {result['peak_memory_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
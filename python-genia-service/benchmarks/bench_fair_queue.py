@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Carga mixta de tenants: FIFO compartido frente a la cola justa ponderada (DRR).
+
+Un tenant "batch" con muchos clientes en bucle cerrado y un tenant
+"interactive" con pocos clientes y tiempo de reflexión compiten por
+`--capacity` huecos frente a un backend falso de latencia fija. Con FIFO las
+peticiones interactivas esperan detrás de toda la cola del lote; con DRR cada
+tenant recibe huecos según su peso. Se muestra el throughput y la espera en
+cola (p50/p99) por tenant, y el histograma que exporta el planificador.
+
+Uso:
+    python benchmarks/bench_fair_queue.py --batch-clients 64 --interactive-clients 4 --capacity 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fair_queue import FairScheduler  # noqa: E402
+from logging_config import setup_logging  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+async def simulate(mode: str, args) -> dict:
+    weights = {"interactive": args.interactive_weight, "batch": 1.0}
+    scheduler = FairScheduler(capacity=args.capacity, weights=weights, max_queue_per_tenant=10_000)
+    waits = {"batch": [], "interactive": []}
+    deadline = time.monotonic() + args.seconds
+
+    async def client(tenant: str, think: float):
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            # FIFO: todas las llamadas comparten una sola cola
+            async with scheduler.slot(tenant if mode == "drr" else "shared"):
+                waits[tenant].append(time.monotonic() - start)
+                await asyncio.sleep(args.latency)
+            if think:
+                await asyncio.sleep(think)
+
+    await asyncio.gather(
+        *[client("batch", 0.0) for _ in range(args.batch_clients)],
+        *[client("interactive", args.think) for _ in range(args.interactive_clients)]
+    )
+    return {"waits": waits, "stats": scheduler.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-clients", type=int, default=64, help="Clientes del tenant de lotes")
+    parser.add_argument("--interactive-clients", type=int, default=4, help="Clientes del tenant interactivo")
+    parser.add_argument("--interactive-weight", type=float, default=4.0)
+    parser.add_argument("--capacity", type=int, default=8, help="Huecos de concurrencia hacia el backend")
+    parser.add_argument("--latency", type=float, default=0.02, help="Latencia del backend (s)")
+    parser.add_argument("--think", type=float, default=0.05, help="Pausa entre peticiones interactivas (s)")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    print(
+        f"capacity={args.capacity}, batch clients={args.batch_clients}, "
+        f"interactive clients={args.interactive_clients} (weight {args.interactive_weight:g})\n"
+    )
+    print(f"{'mode':<6} {'tenant':<12} {'req/s':>8} {'wait_p50_ms':>12} {'wait_p99_ms':>12}")
+    for mode in ("fifo", "drr"):
+        result = asyncio.run(simulate(mode, args))
+        for tenant, waits in result["waits"].items():
+            print(
+                f"{mode:<6} {tenant:<12} {len(waits) / args.seconds:>8.1f} "
+                f"{percentile(waits, 50) * 1000:>12.1f} {percentile(waits, 99) * 1000:>12.1f}"
+            )
+
+    print("\nExported wait histogram (drr, cumulative counts per bucket):")
+    for tenant, tenant_stats in result["stats"]["tenants"].items():
+        print(f"  {tenant}: {tenant_stats['wait_seconds']['buckets']}")
+
+
+if __name__ == "__main__":
+    main()
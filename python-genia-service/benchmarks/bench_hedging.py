@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark de peticiones hedged frente a una latencia de cola pesada.
+
+Lanza N consultas contra un cliente falso cuya latencia es casi siempre baja,
+pero con una fracción de llamadas varias veces más lentas, y compara p50/p99
+y la carga extra enviada a Gemini con y sin hedging.
+
+Uso:
+    python benchmarks/bench_hedging.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from hedging import HedgePolicy  # noqa: E402
+from logging_config import setup_logging  # noqa: E402
+from models import QueryRequest  # noqa: E402
+from services import GeniaAPIService  # noqa: E402
+
+
+class FakeResponse:
+    """Respuesta mínima con la interfaz que usa el servicio"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+        self.candidates = None
+
+
+class HeavyTailModels:
+    """client.aio.models falso: lognormal en torno a `median` y una cola `slow_factor` veces más lenta"""
+
+    def __init__(self, median: float, slow_fraction: float, slow_factor: float, seed: int):
+        self.median = median
+        self.slow_fraction = slow_fraction
+        self.slow_factor = slow_factor
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        delay = self.median * self.random.lognormvariate(0, 0.25)
+        if self.random.random() < self.slow_fraction:
+            delay *= self.slow_factor
+        await asyncio.sleep(delay)
+        return FakeResponse("ok")
+
+
+class FakeClient:
+    def __init__(self, models: HeavyTailModels):
+        self.aio = type("Aio", (), {})()
+        self.aio.models = models
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args, hedged: bool) -> dict:
+    models = HeavyTailModels(args.median, args.slow_fraction, args.slow_factor, args.seed)
+    service = GeniaAPIService()
+    service.client = FakeClient(models)
+    service.backend = "async"
+    service.cache = None
+    service.single_flight = None
+    service.hedge_policy = HedgePolicy(
+        percentile=args.percentile,
+        budget_percent=args.budget,
+        min_delay=0.0
+    ) if hedged else None
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await service.query(QueryRequest(prompt=f"Prompt {i}", temperature=0.7))
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one(i) for i in range(args.requests)])
+    service.close()
+
+    return {
+        "mode": "hedged" if hedged else "plain",
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "upstream_calls": models.calls,
+        "extra_load_pct": (models.calls - args.requests) / args.requests * 100,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--median", type=float, default=0.05, help="Latencia mediana falsa (s)")
+    parser.add_argument("--slow-fraction", type=float, default=0.03, help="Fracción de llamadas lentas")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="Multiplicador de las llamadas lentas")
+    parser.add_argument("--percentile", type=float, default=95.0, help="Percentil que dispara el hedge")
+    parser.add_argument("--budget", type=float, default=10.0, help="Presupuesto de hedges (%% del tráfico)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    print(f"{'mode':<8} {'p50_ms':>8} {'p90_ms':>8} {'p99_ms':>8} {'upstream':>9} {'extra_%':>8}")
+    for hedged in (False, True):
+        result = asyncio.run(run(args, hedged))
+        print(
+            f"{result['mode']:<8} {result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+            f"{result['upstream_calls']:>9} {result['extra_load_pct']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
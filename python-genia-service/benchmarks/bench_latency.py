@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Coste de registrar latencias: histogramas HDR en ventanas vs guardar cada muestra.
+
+Registra latencias log-normales (como las de Gemini) repartidas entre varias
+operaciones y compara, por registro:
+
+- hdr: LatencyRecorder (índice del bucket + incremento en un array preasignado)
+- list: añadir cada muestra a una lista por operación, la forma ingenua de
+  calcular percentiles exactos
+
+y el tiempo de un resumen de /stats frente a ordenar las listas para sacar
+los mismos percentiles, además de la memoria que ocupa cada opción.
+
+Uso:
+    python benchmarks/bench_latency.py --records 500000 --operations 8
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from latency import LatencyRecorder, PERCENTILES  # noqa: E402
+from logging_config import setup_logging  # noqa: E402
+
+
+def sorted_percentiles(samples: dict) -> dict:
+    # Percentil por rango más cercano (ceil), la misma definición que LatencyRecorder
+    result = {}
+    for name, values in samples.items():
+        ordered = sorted(values)
+        result[name] = {key: ordered[max(1, math.ceil(len(ordered) * pct / 100)) - 1] for pct, key in PERCENTILES}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=500000)
+    parser.add_argument("--operations", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    generator = random.Random(args.seed)
+    names = [f"http GET /route/{i}" for i in range(args.operations)]
+    workload = [(generator.choice(names), generator.lognormvariate(-3, 1)) for _ in range(args.records)]
+
+    recorder = LatencyRecorder()
+    start = time.perf_counter()
+    for name, seconds in workload:
+        recorder.record(name, seconds)
+    hdr_record = (time.perf_counter() - start) / args.records
+
+    samples = {name: [] for name in names}
+    start = time.perf_counter()
+    for name, seconds in workload:
+        samples[name].append(seconds)
+    list_record = (time.perf_counter() - start) / args.records
+
+    start = time.perf_counter()
+    stats = recorder.stats()
+    hdr_summary = time.perf_counter() - start
+    start = time.perf_counter()
+    exact = sorted_percentiles(samples)
+    list_summary = time.perf_counter() - start
+
+    worst = max(
+        abs(stats["operations"][name]["15m"][key] - exact[name][key]) / exact[name][key]
+        for name in names for _, key in PERCENTILES
+    )
+    windows = next(iter(recorder._operations.values()))
+    hdr_bytes = args.operations * sum(slot.counts.itemsize * len(slot.counts) for slot in windows.slots)
+    list_bytes = args.records * 8 + args.records * sys.getsizeof(0.1)
+
+    print(f"{args.records} records, {args.operations} operations, worst percentile error {worst:.2%}")
+    print(f"{'mode':<6} {'ns/record':>10} {'summary (ms)':>13} {'memory (KB)':>12}")
+    print(f"{'hdr':<6} {hdr_record * 1e9:>10.0f} {hdr_summary * 1000:>13.2f} {hdr_bytes / 1024:>12.0f}")
+    print(f"{'list':<6} {list_record * 1e9:>10.0f} {list_summary * 1000:>13.2f} {list_bytes / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Latencia del event loop con mucho logging: handlers directos vs cola.
+
+Varias tareas simulan peticiones que escriben unos pocos logs cada una (a una
+consola lenta, como una tubería con contrapresión, y a un archivo con rotación
+pequeña) mientras una sonda duerme 1 ms en bucle y mide cuánto se retrasa cada
+despertar. Con los handlers directos la E/S y la rotación ocurren en el thread
+del event loop; con la cola (QueueHandler + QueueListener) solo se encola y la
+escritura va en otro thread.
+
+Uso:
+    python benchmarks/bench_logging.py --seconds 3 --writers 32 --flush-us 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from logging_config import get_logger, queue_stats, setup_logging, shutdown_logging  # noqa: E402
+
+PROBE_INTERVAL = 0.001
+RECORDS_PER_REQUEST = 4
+
+
+class SlowStream:
+    """Consola que tarda en vaciar cada escritura (terminal o tubería lenta)"""
+
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        time.sleep(self.flush_seconds)
+
+
+async def writer(logger, stop: asyncio.Event, counter: list) -> None:
+    while not stop.is_set():
+        for _ in range(RECORDS_PER_REQUEST):
+            logger.info(f"📝 Request processed: POST /query - Status: 200 - Time: 0.123s - tokens: {counter[0]}")
+            counter[0] += 1
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def probe(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run(use_queue: bool, args, log_dir: str) -> dict:
+    setup_logging(
+        log_level="INFO",
+        log_dir=log_dir,
+        log_file=f"bench-{'queue' if use_queue else 'direct'}.log",
+        max_bytes=args.max_kb * 1024,
+        backup_count=2,
+        enable_console=True,
+        enable_file=True,
+        use_queue=use_queue,
+        queue_size=args.queue_size,
+        queue_policy=args.policy
+    )
+    logger = get_logger("bench")
+    stop = asyncio.Event()
+    lags, counter = [], [0]
+    tasks = [asyncio.create_task(writer(logger, stop, counter)) for _ in range(args.writers)]
+    tasks.append(asyncio.create_task(probe(stop, lags)))
+
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    dropped = queue_stats().get("dropped", 0)
+    flush_start = time.perf_counter()
+    shutdown_logging()
+    flush = time.perf_counter() - flush_start
+
+    lags.sort()
+    return {
+        "mode": "queue" if use_queue else "direct",
+        "records": counter[0],
+        "dropped": dropped,
+        "p50": statistics.median(lags),
+        "p99": lags[int(len(lags) * 0.99)],
+        "max": lags[-1],
+        "flush": flush
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--writers", type=int, default=32, help="Peticiones simultáneas que escriben logs")
+    parser.add_argument("--flush-us", type=float, default=100, help="Lo que tarda la consola en vaciar cada registro (µs)")
+    parser.add_argument("--max-kb", type=int, default=256, help="Tamaño del archivo antes de rotar (KB)")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--policy", choices=("drop", "block"), default="drop")
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    # La consola de los logs es la consola lenta simulada, no el terminal
+    stdout, sys.stdout = sys.stdout, SlowStream(args.flush_us / 1e6)
+    results = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        for use_queue in (False, True):
+            results.append(asyncio.run(run(use_queue, args, log_dir)))
+    sys.stdout = stdout
+
+    print(f"{'mode':<8} {'records':>9} {'dropped':>9} {'lag p50 (ms)':>13} {'p99 (ms)':>9} {'max (ms)':>9} {'flush (ms)':>11}")
+    for result in results:
+        print(
+            f"{result['mode']:<8} {result['records']:>9} {result['dropped']:>9} {result['p50'] * 1000:>13.3f} "
+            f"{result['p99'] * 1000:>9.3f} {result['max'] * 1000:>9.3f} {result['flush'] * 1000:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Coste por petición de la instrumentación de /metrics.
+
+Llama N veces a una app ASGI mínima (sin red ni FastAPI) desnuda y envuelta en
+MetricsMiddleware, y mide aparte las observaciones que el servicio hace en
+cada llamada a Gemini (espera de dispatch, en curso, latencia y tokens). La
+diferencia por petición es lo que cuesta la instrumentación; también se
+muestra el tiempo de un scrape completo de /metrics.
+
+Uso:
+    python benchmarks/bench_metrics.py --requests 50000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from prometheus_client import generate_latest  # noqa: E402
+from logging_config import setup_logging  # noqa: E402
+import metrics  # noqa: E402
+
+MODEL = "gemini-1.5-flash"
+
+
+class Route:
+    """Ruta resuelta como la deja FastAPI en el scope"""
+    path = "/query"
+
+
+async def bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    return None
+
+
+async def time_app(app, requests: int) -> float:
+    scope = {"type": "http", "method": "POST", "path": "/query", "route": Route()}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope, receive, send)
+    return time.perf_counter() - start
+
+
+def time_upstream_observations(requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        metrics.dispatch_wait.observe(0.001)
+        in_flight = metrics.upstream_requests_in_flight.labels(MODEL)
+        in_flight.inc()
+        in_flight.dec()
+        metrics.observe_upstream(MODEL, 0.8, "success")
+        metrics.record_tokens(MODEL, 120, 40)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=50000)
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    bare = asyncio.run(time_app(bare_app, args.requests))
+    wrapped = asyncio.run(time_app(metrics.MetricsMiddleware(bare_app), args.requests))
+    upstream = time_upstream_observations(args.requests)
+
+    start = time.perf_counter()
+    body = generate_latest(metrics.registry)
+    scrape = time.perf_counter() - start
+
+    per_request = lambda seconds: seconds / args.requests * 1e9  # noqa: E731
+    print(f"{'case':<28} {'ns/request':>12}")
+    print(f"{'bare ASGI app':<28} {per_request(bare):>12.0f}")
+    print(f"{'with MetricsMiddleware':<28} {per_request(wrapped):>12.0f}")
+    print(f"{'middleware overhead':<28} {per_request(wrapped - bare):>12.0f}")
+    print(f"{'upstream observations':<28} {per_request(upstream):>12.0f}")
+    print(f"\nscrape: {scrape * 1000:.2f} ms, {len(body)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Bytes enviados a Gemini con y sin caché de prefijos.
+
+Lanza N consultas que comparten una instrucción larga contra un cliente falso
+local (client.aio.models y client.aio.caches). Sin caché la instrucción viaja
+completa en cada llamada; con el prefijo registrado se crea un único cached
+content y cada llamada envía solo el sufijo. El cliente falso tarda un tiempo
+fijo más un coste por byte de entrada, para reflejar el procesamiento del prefijo.
+
+Uso:
+    python benchmarks/bench_prefix_cache.py --requests 200 --prefix-kb 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from logging_config import setup_logging  # noqa: E402
+from models import QueryRequest  # noqa: E402
+from services import GeniaAPIService  # noqa: E402
+
+
+class FakeResponse:
+    """Respuesta mínima con la interfaz que usa el servicio"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+        self.candidates = None
+
+
+class FakeAsyncModels:
+    """client.aio.models: cuenta los bytes recibidos y tarda según su tamaño"""
+
+    def __init__(self, base_delay: float, seconds_per_kb: float):
+        self.base_delay = base_delay
+        self.seconds_per_kb = seconds_per_kb
+        self.bytes_received = 0
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        received = len(contents.encode("utf-8"))
+        if config is not None and config.system_instruction:
+            received += len(str(config.system_instruction).encode("utf-8"))
+        self.bytes_received += received
+        self.calls += 1
+        await asyncio.sleep(self.base_delay + received / 1024 * self.seconds_per_kb)
+        return FakeResponse("ok")
+
+
+class FakeAsyncCaches:
+    """client.aio.caches: guarda los cached contents creados"""
+
+    def __init__(self):
+        self.created = 0
+
+    async def create(self, model, config=None):
+        self.created += 1
+        return type("CachedContent", (), {"name": f"cachedContents/{self.created}"})()
+
+    async def update(self, name, config=None):
+        return None
+
+    async def delete(self, name, config=None):
+        return None
+
+
+class FakeClient:
+    def __init__(self, base_delay: float, seconds_per_kb: float):
+        self.aio = type("Aio", (), {})()
+        self.aio.models = FakeAsyncModels(base_delay, seconds_per_kb)
+        self.aio.caches = FakeAsyncCaches()
+
+
+async def run(mode: str, requests: int, prefix: str, base_delay: float, seconds_per_kb: float) -> dict:
+    service = GeniaAPIService()
+    client = FakeClient(base_delay, seconds_per_kb)
+    service.client = client
+    service.backend = "async"
+    service.cache = None
+    service.single_flight = None
+    service.prefix_cache.min_tokens = 0  # el backend falso cachea prefijos de cualquier tamaño
+
+    if mode == "cached":
+        await service.prefix_cache.register("bench", prefix)
+        queries = [QueryRequest(prompt=f"Pregunta {i}", quality="fast", prefix="bench") for i in range(requests)]
+    else:
+        queries = [QueryRequest(prompt=f"{prefix}\n\nPregunta {i}", quality="fast") for i in range(requests)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(service.query(query) for query in queries))
+    elapsed = time.perf_counter() - start
+
+    service.close()
+    return {
+        "mode": mode,
+        "bytes": client.aio.models.bytes_received,
+        "caches": client.aio.caches.created,
+        "elapsed": elapsed
+    }
+
+
+async def main_async(args) -> None:
+    prefix = ("Instrucciones de soporte: responde en español, con tono cordial y conciso. " * 1000)[
+        :args.prefix_kb * 1024
+    ]
+    print(f"{'mode':<8} {'bytes sent':>12} {'per request':>12} {'cached contents':>16} {'elapsed (s)':>12}")
+    for mode in ("inline", "cached"):
+        result = await run(mode, args.requests, prefix, args.base_delay, args.seconds_per_kb)
+        print(
+            f"{result['mode']:<8} {result['bytes']:>12} {result['bytes'] // args.requests:>12} "
+            f"{result['caches']:>16} {result['elapsed']:>12.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--prefix-kb", type=int, default=16, help="Tamaño de la instrucción compartida (KB)")
+    parser.add_argument("--base-delay", type=float, default=0.05, help="Latencia fija de cada llamada (s)")
+    parser.add_argument("--seconds-per-kb", type=float, default=0.002, help="Coste por KB de entrada (s)")
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Coste por petición del logging: f-strings de siempre vs eventos (texto y JSON).
+
+Reproduce los logs que escribe una consulta a /query (middleware, endpoint y
+servicio) con cabeceras y configuración de generación realistas, y mide el
+tiempo medio por petición:
+
+- eager: las f-strings anteriores, que formatean cabeceras y configuración
+  aunque DEBUG esté desactivado
+- text / json: eventos con comprobación de nivel y campos Lazy, en modo texto
+  y en modo JSON (structlog)
+
+Los handlers escriben en una consola nula; con --queue se mide solo lo que
+paga el event loop (encolar), sin el formateo del thread del listener. Con
+--sampling se muestrean log_api_call y log_performance (p. ej. "1/100").
+
+Uso:
+    python benchmarks/bench_structured_logging.py --requests 20000 --level INFO
+    python benchmarks/bench_structured_logging.py --requests 20000 --level INFO --sampling 1/100
+"""
+import argparse
+import os
+import sys
+import time
+from starlette.datastructures import Headers
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("GENIA_API_KEY", "benchmark-fake-key")
+
+from logging_config import (  # noqa: E402
+    Lazy, get_event_logger, get_logger, log_api_call, log_performance, setup_logging, shutdown_logging
+)
+
+HEADERS = Headers({
+    "host": "genia.internal:8000",
+    "user-agent": "python-httpx/0.28.1",
+    "accept": "application/json",
+    "content-type": "application/json",
+    "content-length": "412",
+    "x-tenant-id": "tenant-42",
+    "x-request-timeout": "30",
+    "traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+})
+GENERATION_CONFIG = {"max_output_tokens": 1024, "temperature": 0.2, "top_p": 0.95, "top_k": 40}
+PROMPT = "Resume el siguiente ticket de soporte y propone una respuesta al cliente. " * 20
+
+logger = get_logger("bench")
+events = get_event_logger("bench")
+
+
+class NullStream:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        return None
+
+
+def eager_request(i: int) -> None:
+    """Logs de una consulta tal y como se escribían antes (f-strings)"""
+    logger.info("🌐 Incoming request: POST /query")
+    logger.debug(f"Request headers: {dict(HEADERS)}")
+    request_id = f"query_{i}"
+    logger.info(f"🤖 [{request_id}] Processing Gemini query - Prompt: '{PROMPT[:50]}...'")
+    logger.debug(f"[{request_id}] Query parameters: max_tokens=1024, temperature=0.2")
+    call_id = f"gemini_{i}"
+    logger.info(f"🚀 [{call_id}] Calling Google Gemini API (gemini-1.5-flash, route: default)")
+    logger.debug(f"[{call_id}] Prompt preview: '{PROMPT[:100]}...'")
+    logger.debug(f"[{call_id}] Prompt length: {len(PROMPT)} characters")
+    logger.debug(f"[{call_id}] Generation config: {GENERATION_CONFIG}")
+    logger.debug(f"[{call_id}] Executing API call (async backend)...")
+    log_performance(f"gemini_api_call_{call_id}", 0.8, {"model": "gemini-1.5-flash", "prompt_length": len(PROMPT)})
+    logger.info(f"✅ [{request_id}] Gemini query successful - Tokens: 120, Time: 0.812s")
+    log_api_call("POST", "/query", 200, 0.812)
+
+
+def event_request(i: int) -> None:
+    """Los mismos logs con eventos, comprobación de nivel y campos Lazy"""
+    logger.info("🌐 Incoming request: POST /query")
+    events.debug("request_headers", headers=Lazy(dict, HEADERS))
+    request_id = f"query_{i}"
+    logger.info(f"🤖 [{request_id}] Processing Gemini query - Prompt: '{PROMPT[:50]}...'")
+    events.debug("query_parameters", request_id=request_id, max_tokens=1024, temperature=0.2)
+    call_id = f"gemini_{i}"
+    logger.info(f"🚀 [{call_id}] Calling Google Gemini API (gemini-1.5-flash, route: default)")
+    events.debug(
+        "gemini_request",
+        call_id=call_id,
+        backend="async",
+        prompt_length=len(PROMPT),
+        prompt_preview=Lazy(lambda: PROMPT[:100]),
+        generation_config=GENERATION_CONFIG
+    )
+    log_performance(f"gemini_api_call_{call_id}", 0.8, {"model": "gemini-1.5-flash", "prompt_length": len(PROMPT)})
+    logger.info(f"✅ [{request_id}] Gemini query successful - Tokens: 120, Time: 0.812s")
+    log_api_call("POST", "/query", 200, 0.812)
+
+
+def run(mode: str, args) -> float:
+    setup_logging(
+        log_level=args.level,
+        enable_console=True,
+        enable_file=False,
+        use_queue=args.queue,
+        queue_policy="block",
+        log_format="json" if mode == "json" else "text",
+        sampling={"api_calls": args.sampling, "performance": args.sampling}
+    )
+    request = eager_request if mode == "eager" else event_request
+    start = time.perf_counter()
+    for i in range(args.requests):
+        request(i)
+    elapsed = time.perf_counter() - start
+    shutdown_logging()
+    return elapsed / args.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--level", choices=("DEBUG", "INFO", "WARNING"), default="INFO")
+    parser.add_argument("--queue", action="store_true", help="Handlers en el thread del listener")
+    parser.add_argument("--sampling", default="", help='Muestreo de los helpers: "1/N" o "R/s"')
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+
+    # La consola de los logs es una consola nula, no el terminal
+    stdout, sys.stdout = sys.stdout, NullStream()
+    results = {mode: run(mode, args) for mode in ("eager", "text", "json")}
+    sys.stdout = stdout
+
+    print(f"level {args.level}, queue: {args.queue}, sampling: {args.sampling or 'none'}")
+    print(f"{'mode':<8} {'us/request':>11}")
+    for mode, seconds in results.items():
+        print(f"{mode:<8} {seconds * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del conteo local de tokens sobre prompts de 32k caracteres.
+
+Mide el coste por llamada de la heurística, del tokenizador (si la codificación
+de tiktoken está disponible localmente) y de los aciertos de la caché LRU.
+
+Uso:
+    python benchmarks/bench_token_counting.py --chars 32000 --iterations 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from logging_config import setup_logging  # noqa: E402
+from tokens import TokenCounter  # noqa: E402
+
+WORDS = (
+    "la inteligencia artificial permite generar texto código def return 12345 "
+    "análisis de datos, modelos de lenguaje y respuestas en español e inglés"
+).split()
+
+
+def make_prompt(chars: int, seed: int) -> str:
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)[:chars]
+
+
+def per_call_us(counter: TokenCounter, prompts, method: str) -> float:
+    func = getattr(counter, method)
+    start = time.perf_counter()
+    for prompt in prompts:
+        func(prompt)
+    return (time.perf_counter() - start) / len(prompts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chars", type=int, default=32000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_logging(log_level="WARNING", enable_console=False, enable_file=False)
+    prompts = [make_prompt(args.chars, seed) for seed in range(args.iterations)]
+
+    heuristic = TokenCounter(encoding_name=None)
+    tokenizer = TokenCounter()
+    has_tokenizer = tokenizer.warm_up()
+
+    print(f"{'mode':<28} {'us/call':>10}")
+    print(f"{'heuristic (uncached)':<28} {per_call_us(heuristic, prompts, 'count_uncached'):>10.1f}")
+    if has_tokenizer:
+        print(f"{'tiktoken sampled (uncached)':<28} {per_call_us(tokenizer, prompts, 'count_uncached'):>10.1f}")
+        full = TokenCounter(sample_chars=args.chars + 1)
+        full.warm_up()
+        print(f"{'tiktoken full (uncached)':<28} {per_call_us(full, prompts, 'count_uncached'):>10.1f}")
+    else:
+        print(f"{'tiktoken':<28} {'n/a (encoding not available locally)':>10}")
+
+    counter = tokenizer if has_tokenizer else heuristic
+    for prompt in prompts:
+        counter.count(prompt)
+    print(f"{'LRU cache hit':<28} {per_call_us(counter, prompts, 'count'):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Script de entrada para el procesamiento masivo de prompts (JSONL/CSV/XLSX)
+Reanudable: relanzar con los mismos argumentos continúa donde se quedó
+
+Uso:
+    python bulk_run.py prompts.csv resultados.xlsx --workers 16 --rate 10
+"""
+import sys
+import os
+
+# Agregar el directorio src al path para las importaciones
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+if __name__ == "__main__":
+    from config import settings
+    from logging_config import configure_for_environment
+    from bulk import main
+
+    # Configurar logging antes de iniciar el procesamiento
+    configure_for_environment(settings.ENVIRONMENT)
+
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Control de admisión y descarte de carga para los endpoints de consulta.
+
+Cuenta las peticiones en curso y estima la espera en cola con la ley de
+Little: (peticiones por encima de la capacidad) × latencia media / capacidad.
+La capacidad es la del despacho a Gemini (límite adaptativo si está activo),
+la latencia media solo se mide con respuestas correctas de /query y un lote
+cuenta como tantas peticiones como consultas trae.
+Si la espera estimada supera el SLO, o se alcanza el máximo de peticiones en
+curso, la petición se rechaza de inmediato con 429 y Retry-After en lugar de
+acumularse hasta que todo expire a la vez.
+"""
+import json
+import math
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from config import settings
+from models import ErrorResponse
+from logging_config import get_logger
+from services import genia_service
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Rutas sujetas a admisión (prefijos) y excepciones que siempre pasan
+ADMISSION_PATH_PREFIXES = ("/query",)
+ADMISSION_EXEMPT_PATHS = ("/query/mock",)
+# Ruta cuya duración alimenta la latencia media (una llamada, sin streaming)
+ADMISSION_LATENCY_PATH = "/query"
+# Rutas cuyo peso es el número de consultas del cuerpo
+ADMISSION_BATCH_PATHS = ("/query/batch",)
+
+
+class AdmissionController:
+    """
+    Admisión por profundidad de cola estimada
+    """
+
+    def __init__(
+        self,
+        capacity: Union[int, Callable[[], int]] = 256,
+        max_in_flight: int = 1024,
+        queue_slo_seconds: float = 5.0,
+        latency_alpha: float = 0.2
+    ):
+        self._capacity = capacity if callable(capacity) else (lambda: capacity)
+        self.max_in_flight = max_in_flight
+        self.queue_slo_seconds = queue_slo_seconds
+        self.latency_alpha = latency_alpha
+
+        self.in_flight = 0
+        self.avg_latency: Optional[float] = None
+
+        self.admitted = 0
+        self.shed = 0
+        self.shed_by_reason: Dict[str, int] = {"max_in_flight": 0, "queue_slo": 0}
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self._capacity())
+
+    def weight_of(self, items: int) -> int:
+        """Peso de una petición con `items` consultas, acotado para que cualquier lote pueda entrar"""
+        return min(max(1, items), max(1, self.max_in_flight))
+
+    def estimated_wait(self, weight: int = 1) -> float:
+        """Espera estimada en cola para una petición nueva de peso `weight` (segundos)"""
+        if self.avg_latency is None:
+            return 0.0
+        capacity = self.capacity
+        queued = max(0, self.in_flight + weight - capacity)
+        return queued * self.avg_latency / capacity
+
+    def try_admit(self, weight: int = 1) -> Tuple[bool, float]:
+        """
+        Intentar admitir una petición
+
+        Args:
+            weight: Peticiones que representa (consultas de un lote)
+
+        Returns:
+            (admitida, retry_after): si se rechaza, segundos sugeridos para reintentar
+        """
+        if self.in_flight + weight > self.max_in_flight:
+            return self._shed("max_in_flight", self.avg_latency or 1.0)
+
+        wait = self.estimated_wait(weight)
+        if wait > self.queue_slo_seconds:
+            return self._shed("queue_slo", wait - self.queue_slo_seconds)
+
+        self.in_flight += weight
+        self.admitted += 1
+        return True, 0.0
+
+    def release(self, latency: Optional[float] = None, weight: int = 1) -> None:
+        """
+        Marcar como terminada una petición admitida; `latency` (si se da)
+        actualiza la latencia media
+        """
+        self.in_flight -= weight
+        if latency is None:
+            return
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency += self.latency_alpha * (latency - self.avg_latency)
+
+    def _shed(self, reason: str, retry_after: float) -> Tuple[bool, float]:
+        self.shed += 1
+        self.shed_by_reason[reason] += 1
+        return False, retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de cola y contadores de descarte"""
+        capacity = self.capacity
+        return {
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - capacity),
+            "capacity": capacity,
+            "max_in_flight": self.max_in_flight,
+            "queue_slo_seconds": self.queue_slo_seconds,
+            "estimated_wait_seconds": round(self.estimated_wait(), 3),
+            "avg_latency_seconds": self.avg_latency,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "shed_by_reason": dict(self.shed_by_reason)
+        }
+
+
+def is_admission_path(path: str) -> bool:
+    """Si la ruta pasa por el control de admisión (/health y el resto nunca)"""
+    return path.startswith(ADMISSION_PATH_PREFIXES) and path not in ADMISSION_EXEMPT_PATHS
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI: la petición cuenta como en curso hasta que se envía el
+    último byte de la respuesta, también en los endpoints de streaming
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_admission_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        weight = 1
+        if scope["path"] in ADMISSION_BATCH_PATHS:
+            weight, receive = await self._batch_weight(receive)
+
+        admitted, retry_after = self.controller.try_admit(weight)
+        if not admitted:
+            logger.warning(
+                f"🚦 Shedding {scope['method']} {scope['path']} - in flight: {self.controller.in_flight}, "
+                f"estimated wait: {self.controller.estimated_wait():.2f}s"
+            )
+            await self._reject(send, retry_after)
+            return
+
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Streams, lotes y errores (422, 5xx) no representan lo que tarda una consulta
+            sampled = scope["path"] == ADMISSION_LATENCY_PATH and status is not None and status < 400
+            self.controller.release(time.monotonic() - start if sampled else None, weight)
+
+    async def _batch_weight(self, receive):
+        """
+        Leer el cuerpo de un lote para contar sus consultas; devuelve el peso y
+        un `receive` que vuelve a entregar el cuerpo a la aplicación
+        """
+        messages = []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                break
+
+        try:
+            items = len(json.loads(b"".join(m.get("body", b"") for m in messages))["items"])
+        except (ValueError, KeyError, TypeError):
+            items = 1  # La validación de FastAPI responderá con 422
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return self.controller.weight_of(items), replay
+
+    @staticmethod
+    async def _reject(send, retry_after: float) -> None:
+        body = json.dumps({
+            "detail": ErrorResponse(
+                error="overloaded",
+                message="Service overloaded, retry later",
+                details={"retry_after": retry_after}
+            ).model_dump()
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Instancia global del control de admisión
+admission_controller = AdmissionController(
+    capacity=genia_service.dispatch_capacity,
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    queue_slo_seconds=settings.ADMISSION_QUEUE_SLO_SECONDS
+)
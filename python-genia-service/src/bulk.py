@@ -0,0 +1,398 @@
+"""
+Procesamiento masivo offline de prompts desde archivos JSONL, CSV o XLSX.
+
+Lee la entrada en streaming, procesa las filas con un pool de workers async y
+limitación de tasa, y registra cada resultado en un diario JSONL que sirve de
+checkpoint: si el proceso muere, al relanzarlo se saltan las filas ya
+completadas. Al terminar, el archivo de salida se genera a partir del diario.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Union
+from pydantic import ValidationError
+from models import QueryRequest
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+SUPPORTED_FORMATS = (".jsonl", ".csv", ".xlsx")
+REQUEST_FIELDS = ("max_tokens", "temperature", "top_p", "top_k")
+OUTPUT_COLUMNS = ["row", "id", "success", "response", "tokens_used", "model", "processing_time", "error"]
+
+
+def _file_format(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported file format '{suffix}'. Use one of: {', '.join(SUPPORTED_FORMATS)}")
+    return suffix
+
+
+class InvalidRow:
+    """Fila de entrada que no se pudo leer; se registra como fallo sin detener el trabajo"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+def iter_rows(path: Path) -> Iterator[Union[Dict[str, Any], InvalidRow]]:
+    """
+    Iterar las filas de un archivo de entrada sin cargarlo completo en memoria
+
+    Args:
+        path: Archivo .jsonl, .csv o .xlsx (la primera fila es la cabecera)
+
+    Yields:
+        Dict[str, Any]: Fila como diccionario columna -> valor, o InvalidRow
+        si una línea JSONL no es un objeto JSON válido
+    """
+    file_format = _file_format(path)
+
+    if file_format == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield InvalidRow(f"malformed JSON: {e.msg}")
+                    continue
+                yield row if isinstance(row, dict) else InvalidRow(f"expected a JSON object, got {type(row).__name__}")
+
+    elif file_format == ".csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+
+    else:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell) if cell is not None else "" for cell in next(rows, [])]
+            for values in rows:
+                if any(value is not None for value in values):
+                    yield dict(zip(header, values))
+        finally:
+            workbook.close()
+
+
+def build_request(row: Dict[str, Any], prompt_column: str = "prompt") -> QueryRequest:
+    """
+    Construir un QueryRequest desde una fila; las columnas vacías usan los valores por defecto
+    """
+    fields = {"prompt": row.get(prompt_column)}
+    for name in REQUEST_FIELDS:
+        value = row.get(name)
+        if value not in (None, ""):
+            fields[name] = value
+    return QueryRequest(**fields)
+
+
+class RateLimiter:
+    """
+    Limitador de tasa simple (peticiones por segundo) compartido por los workers
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Checkpoint:
+    """
+    Diario JSONL de resultados. Una línea por fila procesada, escrita y volcada
+    a disco en cuanto termina, de modo que sirve para reanudar el trabajo.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.completed: Set[int] = set()
+        if path.exists():
+            for record in self.records():
+                if record["success"]:
+                    self.completed.add(record["row"])
+        self._file = None
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Iterar los registros del diario, ignorando una última línea truncada"""
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping truncated checkpoint line in {self.path}")
+
+    def record(self, result: Dict[str, Any]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        if result["success"]:
+            self.completed.add(result["row"])
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Progress:
+    """Contador de avance con throughput y ETA"""
+
+    def __init__(self, total: int, already_done: int):
+        self.total = total
+        self.already_done = already_done
+        self.processed = 0
+        self.failed = 0
+        self.start_time = time.monotonic()
+
+    def update(self, success: bool) -> None:
+        self.processed += 1
+        if not success:
+            self.failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.start_time
+        throughput = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.already_done - self.processed)
+        return {
+            "done": self.already_done + self.processed,
+            "total": self.total,
+            "failed": self.failed,
+            "rows_per_second": throughput,
+            "eta_seconds": remaining / throughput if throughput > 0 else None,
+            "elapsed_seconds": elapsed
+        }
+
+    def log(self) -> None:
+        stats = self.snapshot()
+        eta = f"{stats['eta_seconds']:.0f}s" if stats["eta_seconds"] is not None else "?"
+        logger.info(
+            f"📊 Bulk progress: {stats['done']}/{stats['total']} rows, "
+            f"{stats['failed']} failed, {stats['rows_per_second']:.2f} rows/s, ETA {eta}"
+        )
+
+
+async def process_file(
+    service,
+    input_path: Path,
+    output_path: Path,
+    workers: int = 8,
+    rate: float = 0.0,
+    prompt_column: str = "prompt",
+    progress_interval: float = 5.0,
+    use_mock: bool = False
+) -> Dict[str, Any]:
+    """
+    Procesar un archivo de prompts de forma reanudable
+
+    Args:
+        service: Servicio con `query` / `query_mock` (GeniaAPIService)
+        input_path: Archivo de entrada (.jsonl, .csv, .xlsx)
+        output_path: Archivo de salida (.jsonl, .csv, .xlsx)
+        workers: Número de workers concurrentes
+        rate: Peticiones por segundo como máximo (0 = sin límite)
+        prompt_column: Columna que contiene el prompt
+        progress_interval: Segundos entre reportes de progreso
+        use_mock: Usar query_mock en lugar de llamar a Gemini
+
+    Returns:
+        Dict[str, Any]: Resumen final (filas, fallos, throughput)
+    """
+    _file_format(input_path)
+    _file_format(output_path)
+
+    checkpoint = Checkpoint(output_path.with_name(output_path.name + ".checkpoint.jsonl"))
+    total = sum(1 for _ in iter_rows(input_path))
+    progress = Progress(total, already_done=len(checkpoint.completed))
+    limiter = RateLimiter(rate)
+    query = service.query_mock if use_mock else service.query
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+
+    if checkpoint.completed:
+        logger.info(f"♻️  Resuming bulk job: {len(checkpoint.completed)}/{total} rows already completed")
+
+    async def produce():
+        for row_index, row in enumerate(iter_rows(input_path)):
+            if row_index not in checkpoint.completed:
+                await queue.put((row_index, row))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            row_index, row = item
+            result = await _process_row(query, limiter, row_index, row, prompt_column)
+            checkpoint.record(result)
+            progress.update(result["success"])
+
+    async def report():
+        while True:
+            await asyncio.sleep(progress_interval)
+            progress.log()
+
+    reporter = asyncio.ensure_future(report())
+    try:
+        await asyncio.gather(produce(), *[work() for _ in range(workers)])
+    finally:
+        reporter.cancel()
+        checkpoint.close()
+
+    progress.log()
+    written = write_output(checkpoint, output_path)
+    logger.info(f"✅ Bulk job finished: {written} rows written to {output_path}")
+    return {**progress.snapshot(), "written": written}
+
+
+async def _process_row(query, limiter: RateLimiter, row_index: int, row: Union[Dict[str, Any], InvalidRow],
+                       prompt_column: str) -> Dict[str, Any]:
+    """Procesar una fila y devolver su registro de resultado"""
+    if isinstance(row, InvalidRow):
+        return {"row": row_index, "id": None, "success": False, "response": None,
+                "tokens_used": None, "model": None, "processing_time": None, "error": f"Invalid row: {row.error}"}
+
+    result = {"row": row_index, "id": row.get("id"), "success": False, "response": None,
+              "tokens_used": None, "model": None, "processing_time": None, "error": None}
+    try:
+        request = build_request(row, prompt_column)
+    except ValidationError as e:
+        result["error"] = f"Invalid row: {e.errors()[0]['msg']}"
+        return result
+
+    await limiter.acquire()
+    try:
+        response = await query(request)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    result.update(
+        success=True,
+        response=response.response,
+        tokens_used=response.tokens_used,
+        model=response.model,
+        processing_time=response.processing_time
+    )
+    return result
+
+
+def _final_records(checkpoint: Checkpoint) -> Iterator[Dict[str, Any]]:
+    """
+    Registros definitivos del diario: el éxito de cada fila, o su último fallo
+    si nunca terminó bien. Dos pasadas en streaming, solo se guardan índices.
+    """
+    last_failure: Dict[int, int] = {}
+    for position, record in enumerate(checkpoint.records()):
+        if not record["success"]:
+            last_failure[record["row"]] = position
+
+    emitted: Set[int] = set()
+    for position, record in enumerate(checkpoint.records()):
+        row = record["row"]
+        if row in emitted:
+            continue
+        if record["success"] or (row not in checkpoint.completed and last_failure.get(row) == position):
+            emitted.add(row)
+            yield record
+
+
+def write_output(checkpoint: Checkpoint, output_path: Path) -> int:
+    """
+    Escribir el archivo de salida a partir del diario, en streaming
+
+    Returns:
+        int: Número de filas escritas
+    """
+    if not checkpoint.path.exists():
+        return 0
+
+    file_format = _file_format(output_path)
+    written = 0
+
+    if file_format == ".jsonl":
+        with open(output_path, "w", encoding="utf-8") as f:
+            for record in _final_records(checkpoint):
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                written += 1
+
+    elif file_format == ".csv":
+        with open(output_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
+            writer.writeheader()
+            for record in _final_records(checkpoint):
+                writer.writerow(record)
+                written += 1
+
+    else:
+        from openpyxl import Workbook
+
+        # Modo write-only: las filas se vuelcan sin mantener la hoja en memoria
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("results")
+        sheet.append(OUTPUT_COLUMNS)
+        for record in _final_records(checkpoint):
+            sheet.append([record.get(column) for column in OUTPUT_COLUMNS])
+            written += 1
+        workbook.save(output_path)
+
+    return written
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Procesa prompts desde JSONL/CSV/XLSX con GeniaAPIService (reanudable)"
+    )
+    parser.add_argument("input", type=Path, help="Archivo de entrada (.jsonl, .csv, .xlsx)")
+    parser.add_argument("output", type=Path, help="Archivo de salida (.jsonl, .csv, .xlsx)")
+    parser.add_argument("--workers", type=int, default=8, help="Workers concurrentes (default: 8)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Peticiones por segundo, 0 = sin límite")
+    parser.add_argument("--prompt-column", default="prompt", help="Columna con el prompt (default: prompt)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Segundos entre reportes")
+    parser.add_argument("--mock", action="store_true", help="Usar query_mock (sin llamar a Gemini)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list] = None) -> int:
+    """
+    Punto de entrada de la CLI
+
+    Returns:
+        int: Código de salida (1 si alguna fila falló en esta ejecución)
+    """
+    from services import genia_service
+
+    args = parse_args(argv)
+    try:
+        summary = asyncio.run(process_file(
+            genia_service,
+            args.input,
+            args.output,
+            workers=args.workers,
+            rate=args.rate,
+            prompt_column=args.prompt_column,
+            progress_interval=args.progress_interval,
+            use_mock=args.mock
+        ))
+    finally:
+        genia_service.close()
+    return 1 if summary["failed"] else 0
@@ -0,0 +1,202 @@
+"""
+Caché en memoria de respuestas de Google Gemini.
+
+Caché de coincidencia exacta: la clave es un hash del modelo, el prompt
+normalizado y los parámetros de generación. La expulsión es LRU por número de
+entradas y por presupuesto de bytes, con TTL y una ventana adicional en la que
+las entradas vencidas pueden servirse si la API falla (stale-if-error).
+"""
+import hashlib
+import json
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from models import QueryRequest, QueryResponse
+
+# Bytes estimados por entrada además del texto de la respuesta (clave, metadatos)
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizar un prompt para la clave de caché: forma Unicode NFC y
+    espacios en blanco colapsados.
+    """
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def request_fingerprint(model_name: str, request: QueryRequest, prefix_digest: Optional[str] = None) -> str:
+    """
+    Huella estable de una consulta: identifica peticiones equivalentes
+
+    Args:
+        model_name: Modelo al que va dirigida la consulta
+        request: Datos de la consulta
+        prefix_digest: Hash del contenido del prefijo referenciado (si lo cambian, cambia la huella)
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    payload = json.dumps(
+        [
+            model_name,
+            normalize_prompt(request.prompt),
+            request.max_tokens,
+            request.temperature,
+            request.top_p,
+            request.top_k,
+            request.quality.value if request.quality else None,
+            request.prefix,
+            prefix_digest,
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BaseResponseCache(ABC):
+    """
+    Interfaz de caché de respuestas. Cualquier subclase que implemente estos
+    métodos puede asignarse a `GeniaAPIService.cache`.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[QueryResponse]:
+        """Obtener una respuesta vigente o None"""
+
+    @abstractmethod
+    def get_stale(self, key: str) -> Optional[QueryResponse]:
+        """Obtener una respuesta vencida pero dentro de la ventana stale-if-error"""
+
+    @abstractmethod
+    def set(self, key: str, response: QueryResponse) -> None:
+        """Guardar una respuesta"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Vaciar la caché"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+
+
+class _CacheEntry:
+    """Entrada interna de la caché"""
+
+    __slots__ = ("response", "size", "stored_at")
+
+    def __init__(self, response: QueryResponse, size: int, stored_at: float):
+        self.response = response
+        self.size = size
+        self.stored_at = stored_at
+
+
+class ResponseCache(BaseResponseCache):
+    """
+    Caché LRU en proceso con límite de entradas, presupuesto de bytes y TTL
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 300.0,
+        stale_ttl_seconds: float = 3600.0
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[QueryResponse]:
+        entry = self._lookup(key)
+        if entry is None or self._age(entry) > self.ttl_seconds:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.response
+
+    def get_stale(self, key: str) -> Optional[QueryResponse]:
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+
+        self.stale_hits += 1
+        return entry.response
+
+    def set(self, key: str, response: QueryResponse) -> None:
+        size = self._estimate_size(response)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = _CacheEntry(response, size, time.monotonic())
+        self._bytes += size
+
+        # Expulsar las entradas menos usadas hasta respetar ambos límites
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _lookup(self, key: str) -> Optional[_CacheEntry]:
+        """Buscar una entrada descartando las que superan TTL + ventana stale"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if self._age(entry) > self.ttl_seconds + self.stale_ttl_seconds:
+            self._remove(key)
+            self.expirations += 1
+            return None
+
+        return entry
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    @staticmethod
+    def _age(entry: _CacheEntry) -> float:
+        return time.monotonic() - entry.stored_at
+
+    @staticmethod
+    def _estimate_size(response: QueryResponse) -> int:
+        return len(response.response.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
@@ -0,0 +1,225 @@
+"""
+Circuit breaker para las llamadas a Google Gemini.
+
+Cerrado: las llamadas pasan y se mide la tasa de errores y de llamadas lentas
+en una ventana deslizante. Si alguna supera su umbral, el circuito se abre y
+las llamadas se rechazan al instante (503 + Retry-After) durante
+`open_seconds`. Después pasa a semiabierto: deja pasar unas pocas llamadas de
+prueba; si todas van bien se cierra, si alguna falla vuelve a abrirse.
+"""
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, List
+from retry import DeadlineExceededError, is_retryable
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+
+class CircuitState(str, Enum):
+    """Estados del circuit breaker"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin contactar a Gemini"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Google Gemini circuit open, retry after {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker con ventana deslizante por segundos (cerrado / abierto / semiabierto)
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate_threshold: float = 0.8,
+        window_seconds: int = 30,
+        min_calls: int = 10,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 3,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        # Ventana: un cubo [segundo, llamadas, fallos, lentas] por segundo con tráfico
+        self._buckets: Deque[List[int]] = deque()
+        self._calls = 0
+        self._failures = 0
+        self._slow = 0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """Estado actual (un circuito abierto pasa a semiabierto al vencer la espera)"""
+        if self._state is CircuitState.OPEN and self.retry_after() <= 0:
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        """Segundos hasta que el circuito abierto admita llamadas de prueba"""
+        if self._state is not CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def check(self) -> None:
+        """
+        Rechazar si el circuito está abierto, sin ocupar un hueco de prueba
+
+        Raises:
+            CircuitOpenError: El circuito está abierto
+        """
+        if self.state is CircuitState.OPEN:
+            self.rejected += 1
+            raise CircuitOpenError(self.retry_after())
+
+    def acquire(self) -> None:
+        """
+        Pedir permiso para una llamada; en semiabierto ocupa un hueco de prueba
+
+        Raises:
+            CircuitOpenError: El circuito está abierto o no quedan huecos de prueba
+        """
+        self.check()
+        if self._state is CircuitState.HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(1.0)
+            self._probes_in_flight += 1
+
+    def release(self) -> None:
+        """Liberar el permiso de una llamada cancelada sin resultado"""
+        if self._state is CircuitState.HALF_OPEN and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def record(self, latency: float, failed: bool) -> None:
+        """Registrar el resultado de una llamada autorizada con acquire()"""
+        slow = latency >= self.slow_call_seconds
+
+        if self._state is CircuitState.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed or slow:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._transition(CircuitState.CLOSED)
+            return
+
+        if self._state is CircuitState.OPEN:
+            return
+
+        now = int(self._clock())
+        self._evict(now)
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += slow
+        self._calls += 1
+        self._failures += failed
+        self._slow += slow
+
+        if self._calls >= self.min_calls and (
+            self._failures / self._calls >= self.failure_rate_threshold
+            or self._slow / self._calls >= self.slow_call_rate_threshold
+        ):
+            self._open()
+
+    async def call(self, operation: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar `operation()` bajo el circuito
+
+        Solo cuentan como fallo los errores transitorios de Gemini (5xx, 429,
+        timeouts, red); un 400 significa que Gemini respondió.
+
+        Raises:
+            CircuitOpenError: El circuito rechazó la llamada
+        """
+        self.acquire()
+        start = self._clock()
+        try:
+            result = await operation()
+        except DeadlineExceededError:
+            # Descartada por el deadline del llamante antes de llegar a Gemini: no cuenta
+            self.release()
+            raise
+        except asyncio.CancelledError:
+            # Un intento cortado por timeout cuenta como llamada lenta
+            latency = self._clock() - start
+            if latency >= self.slow_call_seconds:
+                self.record(latency, failed=False)
+            else:
+                self.release()
+            raise
+        except Exception as e:
+            self.record(self._clock() - start, failed=is_retryable(e))
+            raise
+        self.record(self._clock() - start, failed=False)
+        return result
+
+    def _evict(self, now: int) -> None:
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+            _, calls, failures, slow = self._buckets.popleft()
+            self._calls -= calls
+            self._failures -= failures
+            self._slow -= slow
+
+    def _reset_window(self) -> None:
+        self._buckets.clear()
+        self._calls = self._failures = self._slow = 0
+
+    def _open(self) -> None:
+        self._opened_at = self._clock()
+        self.times_opened += 1
+        self._transition(CircuitState.OPEN)
+
+    def _transition(self, state: CircuitState) -> None:
+        previous, self._state = self._state, state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state is not CircuitState.HALF_OPEN:
+            self._reset_window()
+        if state is CircuitState.OPEN:
+            logger.warning(f"🔌 Gemini circuit {previous.value} -> open for {self.open_seconds:.0f}s")
+        else:
+            logger.info(f"🔌 Gemini circuit {previous.value} -> {state.value}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del circuito y tasas de la ventana actual"""
+        state = self.state
+        self._evict(int(self._clock()))
+        return {
+            "state": state.value,
+            "retry_after": round(self.retry_after(), 3),
+            "window_calls": self._calls,
+            "failure_rate": self._failures / self._calls if self._calls else 0.0,
+            "slow_call_rate": self._slow / self._calls if self._calls else 0.0,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened
+        }
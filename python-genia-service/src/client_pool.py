@@ -0,0 +1,213 @@
+"""
+Pool de clientes de Google Gemini, uno por API key.
+
+La cuota de Gemini es por key: con varias keys configuradas (GENIA_API_KEYS)
+cada llamada toma el cliente menos cargado en proporción a su peso
+(peticiones en curso / peso; a igualdad, el que lleva más tiempo sin usarse),
+lo que con carga uniforme equivale a un round robin ponderado.
+
+Por key se registran peticiones y tokens del último minuto, errores y 429.
+Una key que recibe 429 entra en enfriamiento (Retry-After si Gemini lo indica;
+si no, un backoff que se duplica con cada 429 seguido) y no se elige mientras
+haya otra disponible. Lo mismo ocurre con la cuota opcional por key
+(CLIENT_POOL_KEY_RPM / CLIENT_POOL_KEY_TPM). Si ninguna key está disponible se
+usa la que antes sale del enfriamiento: con una sola key el servicio se
+comporta igual que sin pool.
+"""
+import itertools
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from google.genai import errors as genai_errors
+from retry import retry_after_seconds
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Ventana (segundos) de la cuota por key
+QUOTA_WINDOW_SECONDS = 60.0
+
+
+def parse_api_keys(primary: Optional[str], extra: str) -> List[Tuple[str, float]]:
+    """
+    Keys configuradas con su peso: GENIA_API_KEY primero y después GENIA_API_KEYS
+    ("key1,key2:3" → key2 con peso 3), sin duplicados
+
+    Raises:
+        ValueError: Peso no numérico o no positivo
+    """
+    keys: Dict[str, float] = {}
+    for position, item in enumerate(filter(None, (part.strip() for part in [primary or ""] + extra.split(",")))):
+        key, separator, weight = item.rpartition(":") if ":" in item else (item, "", "1")
+        try:
+            value = float(weight)
+        except ValueError:
+            value = 0.0
+        if value <= 0:
+            # No incluir la key en el mensaje: acabaría en los logs
+            raise ValueError(f"Invalid weight for API key #{position + 1}. Use 'key:weight' with weight > 0")
+        keys.setdefault(key, value)
+    return list(keys.items())
+
+
+class PooledClient:
+    """Un cliente del pool con su key, su peso y sus contadores"""
+
+    def __init__(self, key_id: str, client: Any, weight: float = 1.0, preview: Optional[str] = None):
+        self.key_id = key_id
+        self.client = client
+        self.weight = weight
+        self.preview = preview
+
+        self.in_flight = 0
+        self.last_used = 0
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+        # (instante, tokens) de las llamadas del último minuto
+        self._window: Deque[Tuple[float, int]] = deque()
+        self._window_tokens = 0
+
+    def window(self, now: float) -> Tuple[int, int]:
+        """Peticiones y tokens del último minuto"""
+        while self._window and self._window[0][0] <= now - QUOTA_WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+        return len(self._window), self._window_tokens
+
+    def record_request(self, now: float) -> None:
+        self.requests += 1
+        self._window.append((now, 0))
+
+    def record_tokens(self, now: float, tokens: int) -> None:
+        # Los tokens se conocen al terminar: se suman a la última petición registrada
+        if not self._window:
+            self._window.append((now, 0))
+        last_time, last_tokens = self._window[-1]
+        self._window[-1] = (last_time, last_tokens + tokens)
+        self._window_tokens += tokens
+
+
+class ClientPool:
+    """
+    Reparte las llamadas entre varios clientes de Gemini (uno por API key)
+    """
+
+    def __init__(
+        self,
+        clients: List[PooledClient],
+        cooldown_seconds: float = 30.0,
+        max_cooldown_seconds: float = 300.0,
+        key_rpm: int = 0,
+        key_tpm: int = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.clients = clients
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.key_rpm = key_rpm
+        self.key_tpm = key_tpm
+        self._clock = clock
+        self._sequence = itertools.count(1)
+        self.exhausted = 0
+
+    @classmethod
+    def single(cls, client: Any, **kwargs) -> "ClientPool":
+        """Pool de un único cliente (o vacío si client es None)"""
+        return cls([PooledClient("key-1", client)] if client is not None else [], **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    @property
+    def primary(self) -> Any:
+        """Cliente de la primera key (None si el pool está vacío)"""
+        return self.clients[0].client if self.clients else None
+
+    def _available(self, entry: PooledClient, now: float) -> bool:
+        if entry.cooldown_until > now:
+            return False
+        requests, tokens = entry.window(now)
+        if self.key_rpm and requests >= self.key_rpm:
+            return False
+        return not (self.key_tpm and tokens >= self.key_tpm)
+
+    def select(self) -> PooledClient:
+        """
+        Elegir el cliente de la próxima llamada
+
+        Raises:
+            LookupError: El pool está vacío
+        """
+        if not self.clients:
+            raise LookupError("Client pool is empty")
+        now = self._clock()
+        candidates = [entry for entry in self.clients if self._available(entry, now)]
+        if candidates:
+            return min(candidates, key=lambda entry: (entry.in_flight / entry.weight, entry.last_used))
+
+        # Ninguna disponible: la que antes sale del enfriamiento (mejor intentar que fallar)
+        self.exhausted += 1
+        return min(self.clients, key=lambda entry: (entry.cooldown_until, entry.in_flight / entry.weight))
+
+    @contextmanager
+    def lease(self) -> Iterator[PooledClient]:
+        """
+        Cliente para una llamada; registra el resultado y enfría la key si recibe 429
+        """
+        entry = self.select()
+        entry.in_flight += 1
+        entry.last_used = next(self._sequence)
+        entry.record_request(self._clock())
+        try:
+            yield entry
+        except Exception as e:
+            entry.failures += 1
+            if isinstance(e, genai_errors.APIError) and e.code == 429:
+                self._cool_down(entry, retry_after_seconds(e))
+            raise
+        else:
+            entry.consecutive_throttles = 0
+        finally:
+            entry.in_flight -= 1
+
+    def record_usage(self, entry: PooledClient, tokens: int) -> None:
+        """Tokens consumidos por la última llamada de `entry` (cuota TPM por key)"""
+        entry.record_tokens(self._clock(), tokens)
+
+    def _cool_down(self, entry: PooledClient, retry_after: Optional[float]) -> None:
+        entry.throttled += 1
+        entry.consecutive_throttles += 1
+        if retry_after is None:
+            retry_after = self.cooldown_seconds * 2 ** (entry.consecutive_throttles - 1)
+        cooldown = min(retry_after, self.max_cooldown_seconds)
+        entry.cooldown_until = self._clock() + cooldown
+        logger.warning(f"🔑 API key {entry.key_id} throttled (429): cooling down for {cooldown:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Carga, cuota del último minuto, 429 y enfriamiento de cada key"""
+        now = self._clock()
+        keys = {}
+        for entry in self.clients:
+            requests, tokens = entry.window(now)
+            keys[entry.key_id] = {
+                "preview": entry.preview,
+                "weight": entry.weight,
+                "in_flight": entry.in_flight,
+                "requests": entry.requests,
+                "failures": entry.failures,
+                "throttled": entry.throttled,
+                "requests_last_minute": requests,
+                "tokens_last_minute": tokens,
+                "cooldown_remaining": round(max(0.0, entry.cooldown_until - now), 3)
+            }
+        return {
+            "size": len(self.clients),
+            "key_rpm": self.key_rpm,
+            "key_tpm": self.key_tpm,
+            "exhausted": self.exhausted,
+            "keys": keys
+        }
@@ -0,0 +1,236 @@
+"""
+Límite de concurrencia adaptativo para las llamadas a Google Gemini.
+
+En lugar de un tope fijo, el límite se ajusta con la latencia (RTT) observada
+y las señales de error:
+
+- "aimd": suma 1 por cada ventana de llamadas exitosas y multiplica por un
+  factor < 1 ante un error transitorio o una llamada más lenta que el umbral.
+- "gradient": compara el RTT reciente con el RTT de referencia (sin carga);
+  si la latencia sube, el gradiente < 1 reduce el límite, y se deja un margen
+  de sqrt(límite) para seguir sondeando capacidad.
+
+Las llamadas que superan el límite esperan en orden de llegada.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from retry import is_retryable
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Cambios de límite que se conservan en el historial
+HISTORY_SIZE = 120
+
+
+class AIMDLimit:
+    """Incremento aditivo / decremento multiplicativo"""
+
+    name = "aimd"
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        backoff_ratio: float = 0.9,
+        rtt_threshold: float = 5.0
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.rtt_threshold = rtt_threshold
+        self._last_decrease = 0.0
+
+    def update(self, rtt: float, in_flight: int, dropped: bool) -> float:
+        if dropped or rtt > self.rtt_threshold:
+            # Un solo decremento por RTT: las llamadas que ya estaban en curso no cuentan otra vez
+            now = time.monotonic()
+            if now - self._last_decrease >= rtt:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self._last_decrease = now
+        elif in_flight * 2 >= self.limit:
+            # Solo crecer si el límite se está usando (no limitado por la aplicación)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        return self.limit
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rtt_threshold": self.rtt_threshold, "backoff_ratio": self.backoff_ratio}
+
+
+class GradientLimit:
+    """
+    Límite por gradiente de latencia (estilo Vegas / Gradient2). Se actualiza
+    una vez por ventana de ~`limit` muestras (aprox. un RTT) con su RTT medio.
+    """
+
+    name = "gradient"
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        tolerance: float = 1.5,
+        smoothing: float = 0.5,
+        reference_drift: float = 0.01,
+        backoff_ratio: float = 0.9
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.reference_drift = reference_drift
+        self.backoff_ratio = backoff_ratio
+        self.window_rtt: Optional[float] = None
+        self.reference_rtt: Optional[float] = None
+        self._window_sum = 0.0
+        self._window_samples = 0
+        self._window_dropped = False
+        self._window_saturated = False
+        self._last_update = time.monotonic()
+
+    def update(self, rtt: float, in_flight: int, dropped: bool) -> float:
+        self._window_sum += rtt
+        self._window_samples += 1
+        self._window_dropped |= dropped
+        self._window_saturated |= in_flight * 2 >= self.limit
+        if self._window_samples < max(10, int(self.limit)):
+            return self.limit
+
+        now = time.monotonic()
+        self.window_rtt = self._window_sum / self._window_samples
+        if self.reference_rtt is None:
+            self.reference_rtt = self.window_rtt
+        # Referencia = RTT sin carga: sigue los mínimos al instante y solo sube
+        # despacio (reference_drift por segundo) si la latencia base de Gemini cambia
+        drifted = self.reference_rtt * (1 + self.reference_drift * (now - self._last_update))
+        self.reference_rtt = min(drifted, self.window_rtt)
+        self._last_update = now
+
+        if self._window_dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        elif self._window_saturated:
+            gradient = max(0.5, min(1.0, self.tolerance * self.reference_rtt / self.window_rtt))
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+            self.limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+            self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+        self._window_sum = 0.0
+        self._window_samples = 0
+        self._window_dropped = self._window_saturated = False
+        return self.limit
+
+    def stats(self) -> Dict[str, Any]:
+        return {"window_rtt": self.window_rtt, "reference_rtt": self.reference_rtt, "tolerance": self.tolerance}
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Puerta de concurrencia cuyo límite fija un algoritmo (AIMD o gradiente)
+    """
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+        self._record_history()
+
+        self.completed = 0
+        self.dropped = 0
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.algorithm.limit))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Ocupar un hueco durante una llamada y alimentar el algoritmo con su RTT
+
+        Los errores transitorios (429, 5xx, timeouts) cuentan como señal de
+        sobrecarga; las cancelaciones y los errores de cliente no cuentan.
+        """
+        await self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._release()
+            raise
+        except Exception as e:
+            self._release(time.monotonic() - start, dropped=is_retryable(e))
+            raise
+        else:
+            self._release(time.monotonic() - start, dropped=False)
+
+    async def _acquire(self) -> None:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Ya se nos había cedido el hueco: devolverlo
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self, rtt: Optional[float] = None, dropped: bool = False) -> None:
+        self.in_flight -= 1
+        if rtt is not None:
+            previous = self.limit
+            self.algorithm.update(rtt, self.in_flight + 1, dropped)
+            self.completed += 1
+            self.dropped += dropped
+            if self.limit != previous:
+                self._record_history()
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _record_history(self) -> None:
+        self.history.append({"timestamp": time.time(), "limit": self.limit})
+
+    def stats(self) -> Dict[str, Any]:
+        """Límite actual, uso e historial reciente de cambios"""
+        return {
+            "algorithm": self.algorithm.name,
+            "limit": self.limit,
+            "min_limit": self.algorithm.min_limit,
+            "max_limit": self.algorithm.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "completed": self.completed,
+            "dropped": self.dropped,
+            **self.algorithm.stats(),
+            "history": list(self.history)
+        }
+
+
+def create_limit_algorithm(name: str, initial: int, min_limit: int, max_limit: int, rtt_threshold: float):
+    """Construir el algoritmo de límite por nombre ("aimd" o "gradient")"""
+    if name == "aimd":
+        return AIMDLimit(initial, min_limit, max_limit, rtt_threshold=rtt_threshold)
+    if name == "gradient":
+        return GradientLimit(initial, min_limit, max_limit)
+    raise ValueError(f"Unknown adaptive concurrency algorithm '{name}'. Use 'aimd' or 'gradient'")
@@ -20,18 +20,134 @@ class Settings:
 
     # Configuración de Google Gemini API
     GENIA_API_KEY: str = os.getenv("GENIA_API_KEY")
+    GENIA_API_KEYS: str = os.getenv("GENIA_API_KEYS", "")  # keys adicionales del pool: "key1,key2:peso"
+    GENIA_CLIENT_BACKEND: str = os.getenv("GENIA_CLIENT_BACKEND", "async")  # async | thread
+    MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))
+    THREAD_POOL_SIZE: int = int(os.getenv("THREAD_POOL_SIZE", "32"))  # solo backend "thread"
+    STREAM_BUFFER_CHUNKS: int = int(os.getenv("STREAM_BUFFER_CHUNKS", "8"))
 
     # Configuración de logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # text | json (structlog)
+    LOG_QUEUE_ENABLED: bool = os.getenv("LOG_QUEUE_ENABLED", "true").lower() == "true"  # handlers en un thread aparte
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_QUEUE_POLICY: str = os.getenv("LOG_QUEUE_POLICY", "drop")  # drop | block con la cola llena
+    # Muestreo de log_api_call / log_performance: "" = todo, "1/N" = uno de cada N, "R/s" = R por segundo
+    LOG_SAMPLING_API_CALLS: str = os.getenv("LOG_SAMPLING_API_CALLS", "")
+    LOG_SAMPLING_PERFORMANCE: str = os.getenv("LOG_SAMPLING_PERFORMANCE", "")
+    LOG_SAMPLING_REPORT_INTERVAL: float = float(os.getenv("LOG_SAMPLING_REPORT_INTERVAL", "60"))  # informe de suprimidos
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
 
     # Configuración de desarrollo
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
     RELOAD: bool = os.getenv("RELOAD", "false").lower() == "true"
 
-    # Timeouts y límites (para la app, no para Google API)
-    API_TIMEOUT: int = int(os.getenv("API_TIMEOUT", "30"))
+    # Timeouts y reintentos de las llamadas a Google Gemini
+    API_TIMEOUT: int = int(os.getenv("API_TIMEOUT", "30"))  # deadline total por consulta
     MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
+    ATTEMPT_TIMEOUT: float = float(os.getenv("ATTEMPT_TIMEOUT", "15"))  # timeout de cada intento
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "8"))
+
+    # Hedging: intento de respaldo cuando el primero supera un percentil de latencia
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_BUDGET_PERCENT: float = float(os.getenv("HEDGE_BUDGET_PERCENT", "5"))  # % del tráfico
+    HEDGE_MIN_DELAY: float = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+    # Circuit breaker: corta las llamadas a Gemini durante una caída
+    CIRCUIT_BREAKER_ENABLED: bool = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    CIRCUIT_FAILURE_RATE: float = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+    CIRCUIT_SLOW_CALL_SECONDS: float = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "10"))
+    CIRCUIT_SLOW_CALL_RATE: float = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+    CIRCUIT_WINDOW_SECONDS: int = int(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+    CIRCUIT_MIN_CALLS: int = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+    CIRCUIT_OPEN_SECONDS: float = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+    CIRCUIT_HALF_OPEN_CALLS: int = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "3"))
+
+    # Cuota RPM/TPM hacia Gemini (0 = sin límite)
+    RATE_LIMIT_RPM: int = int(os.getenv("RATE_LIMIT_RPM", "0"))
+    RATE_LIMIT_TPM: int = int(os.getenv("RATE_LIMIT_TPM", "0"))
+    RATE_LIMIT_MAX_QUEUE: int = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "1000"))  # llamadas esperando cuota
+    RATE_LIMIT_MAX_WAIT: float = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+    RATE_LIMIT_STATE_FILE: str = os.getenv("RATE_LIMIT_STATE_FILE", "")  # compartir cuota entre workers
+
+    # Control de admisión: 429 inmediato si la espera estimada en cola supera el SLO
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "1024"))
+    ADMISSION_QUEUE_SLO_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_SLO_SECONDS", "5"))
+
+    # Límite de concurrencia adaptativo hacia Gemini (el máximo es MAX_CONCURRENT_REQUESTS)
+    ADAPTIVE_CONCURRENCY_ENABLED: bool = os.getenv("ADAPTIVE_CONCURRENCY_ENABLED", "false").lower() == "true"
+    ADAPTIVE_CONCURRENCY_ALGORITHM: str = os.getenv("ADAPTIVE_CONCURRENCY_ALGORITHM", "gradient")  # gradient | aimd
+    ADAPTIVE_CONCURRENCY_INITIAL: int = int(os.getenv("ADAPTIVE_CONCURRENCY_INITIAL", "20"))
+    ADAPTIVE_CONCURRENCY_MIN: int = int(os.getenv("ADAPTIVE_CONCURRENCY_MIN", "1"))
+    ADAPTIVE_CONCURRENCY_RTT_THRESHOLD: float = float(os.getenv("ADAPTIVE_CONCURRENCY_RTT_THRESHOLD", "5"))  # aimd
+
+    # Cola justa ponderada entre tenants (deficit round robin) hacia Gemini
+    TENANT_HEADER: str = os.getenv("TENANT_HEADER", "X-Tenant-ID")  # la reenvía el gateway
+    FAIR_QUEUE_ENABLED: bool = os.getenv("FAIR_QUEUE_ENABLED", "true").lower() == "true"
+    FAIR_QUEUE_WEIGHTS: str = os.getenv("FAIR_QUEUE_WEIGHTS", "")  # "interactive=4,batch=1"
+    FAIR_QUEUE_DEFAULT_WEIGHT: float = float(os.getenv("FAIR_QUEUE_DEFAULT_WEIGHT", "1"))
+    FAIR_QUEUE_MAX_PER_TENANT: int = int(os.getenv("FAIR_QUEUE_MAX_PER_TENANT", "256"))
+
+    # Deadline del llamante: abandonar el trabajo que el gateway ya no espera
+    DEADLINE_HEADER: str = os.getenv("DEADLINE_HEADER", "X-Request-Deadline")  # epoch absoluto (s o ms)
+    TIMEOUT_HEADER: str = os.getenv("TIMEOUT_HEADER", "X-Request-Timeout")  # presupuesto relativo
+
+    # Modelos y enrutado por petición (flash / pro) con fallback
+    GEMINI_PRIMARY_MODEL: str = os.getenv("GEMINI_PRIMARY_MODEL", "gemini-1.5-flash")
+    GEMINI_SECONDARY_MODEL: str = os.getenv("GEMINI_SECONDARY_MODEL", "")  # vacío = sin enrutado (opt-in)
+    ROUTER_LONG_PROMPT_TOKENS: int = int(os.getenv("ROUTER_LONG_PROMPT_TOKENS", "6000"))  # 0 = no enrutar por prompt
+    ROUTER_LONG_OUTPUT_TOKENS: int = int(os.getenv("ROUTER_LONG_OUTPUT_TOKENS", "4096"))  # 0 = no enrutar por max_tokens
+    ROUTER_LATENCY_SLO: float = float(os.getenv("ROUTER_LATENCY_SLO", "10"))  # p95 máximo antes de desviar
+    ROUTER_ERROR_RATE: float = float(os.getenv("ROUTER_ERROR_RATE", "0.2"))
+    ROUTER_HEALTH_WINDOW: int = int(os.getenv("ROUTER_HEALTH_WINDOW", "20"))  # últimas llamadas evaluadas
+
+    # Pool de API keys: enfriamiento tras un 429 y cuota opcional por key (0 = sin límite)
+    CLIENT_POOL_COOLDOWN_SECONDS: float = float(os.getenv("CLIENT_POOL_COOLDOWN_SECONDS", "30"))  # sin Retry-After
+    CLIENT_POOL_MAX_COOLDOWN_SECONDS: float = float(os.getenv("CLIENT_POOL_MAX_COOLDOWN_SECONDS", "300"))
+    CLIENT_POOL_KEY_RPM: int = int(os.getenv("CLIENT_POOL_KEY_RPM", "0"))
+    CLIENT_POOL_KEY_TPM: int = int(os.getenv("CLIENT_POOL_KEY_TPM", "0"))
+
+    # Salud de Gemini en memoria: sondeo en segundo plano + resultado del tráfico real
+    HEALTH_CHECK_INTERVAL: float = float(os.getenv("HEALTH_CHECK_INTERVAL", "30"))  # 0 = sin sondeo activo
+    HEALTH_CHECK_JITTER: float = float(os.getenv("HEALTH_CHECK_JITTER", "0.1"))  # ±10% del intervalo
+    HEALTH_FAILURE_THRESHOLD: int = int(os.getenv("HEALTH_FAILURE_THRESHOLD", "3"))  # fallos seguidos del tráfico
+
+    # Prefijos compartidos cacheados en Gemini (cached content)
+    PREFIX_CACHE_MAX_ENTRIES: int = int(os.getenv("PREFIX_CACHE_MAX_ENTRIES", "32"))  # LRU
+    PREFIX_CACHE_TTL_SECONDS: int = int(os.getenv("PREFIX_CACHE_TTL_SECONDS", "3600"))
+    PREFIX_CACHE_REFRESH_MARGIN: float = float(os.getenv("PREFIX_CACHE_REFRESH_MARGIN", "300"))  # renovar antes de caducar
+    PREFIX_CACHE_MIN_TOKENS: int = int(os.getenv("PREFIX_CACHE_MIN_TOKENS", "32768"))  # mínimo de Gemini 1.5; más cortos van completos
+
+    # Métricas Prometheus en /metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # Histogramas de latencia en memoria para /stats (ventanas de 1, 5 y 15 minutos)
+    LATENCY_SLOT_SECONDS: float = float(os.getenv("LATENCY_SLOT_SECONDS", "20"))  # granularidad de las ventanas
+    LATENCY_MAX_OPERATIONS: int = int(os.getenv("LATENCY_MAX_OPERATIONS", "64"))  # el resto cuenta como "_other"
+
+    # Conteo local de tokens (cuando la respuesta no trae usage_metadata)
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "cl100k_base")  # vacío = heurística
+    TOKENIZER_SAMPLE_CHARS: int = int(os.getenv("TOKENIZER_SAMPLE_CHARS", "8192"))
+    TOKEN_COUNT_CACHE_SIZE: int = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096"))
+
+    # Caché de respuestas (coincidencia exacta)
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_DETERMINISTIC_ONLY: bool = os.getenv("CACHE_DETERMINISTIC_ONLY", "true").lower() == "true"
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+    CACHE_STALE_TTL_SECONDS: float = float(os.getenv("CACHE_STALE_TTL_SECONDS", "3600"))
+
+    # Consultas en lote (POST /query/batch)
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+    # Coalescencia de peticiones idénticas en curso (single-flight)
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
 
 
     @property
@@ -0,0 +1,173 @@
+"""
+Propagación del deadline del llamante (gateway) a las llamadas a Google Gemini.
+
+El gateway indica cuánto tiempo le queda con una cabecera:
+
+- X-Request-Deadline: instante absoluto (epoch Unix en segundos o milisegundos)
+- X-Request-Timeout: presupuesto relativo ("2.5", "2.5s" o "2500ms")
+
+El deadline se guarda como instante de time.monotonic() en una ContextVar.
+Las peticiones que llegan vencidas se rechazan sin trabajo; las que vencen
+esperando turno salen de la cola sin llamar a Gemini; el presupuesto restante
+acota el timeout de cada intento y el timeout HTTP de la llamada.
+"""
+import json
+import math
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from config import settings
+from models import ErrorResponse
+from retry import DeadlineExceededError
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Un epoch por encima de este valor viene en milisegundos
+_EPOCH_MILLIS_THRESHOLD = 1e11
+
+_TIMEOUT_PATTERN = re.compile(r"\s*(\d+(?:\.\d+)?)\s*(ms|s)?\s*", re.IGNORECASE)
+
+# Deadline (time.monotonic) de la petición en curso; None = sin deadline del llamante
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def parse_deadline(
+    deadline: Optional[str],
+    timeout: Optional[str],
+    now: Optional[float] = None,
+    wall_now: Optional[float] = None
+) -> Optional[float]:
+    """
+    Deadline (time.monotonic) a partir de las cabeceras; si vienen las dos, la más estricta
+
+    Los valores mal formados se ignoran (el gateway no debe poder tumbar la petición).
+    """
+    now = time.monotonic() if now is None else now
+    wall_now = time.time() if wall_now is None else wall_now
+    candidates = []
+
+    if deadline:
+        try:
+            epoch = float(deadline)
+        except ValueError:
+            epoch = math.nan
+        if math.isfinite(epoch):
+            if epoch > _EPOCH_MILLIS_THRESHOLD:
+                epoch /= 1000
+            candidates.append(now + (epoch - wall_now))
+        else:
+            # float() acepta "nan", "inf" y "-inf": tampoco son un deadline
+            logger.debug(f"Ignoring malformed deadline header: {deadline!r}")
+
+    if timeout:
+        match = _TIMEOUT_PATTERN.fullmatch(timeout)
+        if match and math.isfinite(float(match.group(1))):
+            seconds = float(match.group(1))
+            if (match.group(2) or "s").lower() == "ms":
+                seconds /= 1000
+            candidates.append(now + seconds)
+        else:
+            logger.debug(f"Ignoring malformed timeout header: {timeout!r}")
+
+    return min(candidates) if candidates else None
+
+
+def remaining_budget() -> Optional[float]:
+    """Segundos que le quedan a la petición en curso (None si no trae deadline)"""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def ensure_budget(stage: str) -> None:
+    """
+    Abandonar el trabajo si el llamante ya no espera la respuesta
+
+    Raises:
+        DeadlineExceededError: El deadline de la petición ya pasó
+    """
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= 0:
+        deadline_tracker.expired_before_upstream += 1
+        raise DeadlineExceededError(f"Request deadline exceeded {-remaining:.3f}s ago, before {stage}")
+
+
+class DeadlineTracker:
+    """Contadores de peticiones con deadline y del trabajo descartado"""
+
+    def __init__(self):
+        self.with_deadline = 0
+        self.expired_on_arrival = 0
+        self.expired_before_upstream = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "deadline_header": settings.DEADLINE_HEADER,
+            "timeout_header": settings.TIMEOUT_HEADER,
+            "with_deadline": self.with_deadline,
+            "expired_on_arrival": self.expired_on_arrival,
+            "expired_before_upstream": self.expired_before_upstream
+        }
+
+
+class DeadlineMiddleware:
+    """
+    Middleware ASGI: fija el deadline de la petición y rechaza con 504 las que llegan vencidas
+    """
+
+    def __init__(self, app, tracker: "DeadlineTracker", deadline_header: str, timeout_header: str):
+        self.app = app
+        self.tracker = tracker
+        self.deadline_header = deadline_header.lower().encode("latin-1")
+        self.timeout_header = timeout_header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline_value = timeout_value = None
+        for key, value in scope["headers"]:
+            if key == self.deadline_header:
+                deadline_value = value.decode("latin-1")
+            elif key == self.timeout_header:
+                timeout_value = value.decode("latin-1")
+
+        deadline = parse_deadline(deadline_value, timeout_value)
+        if deadline is not None:
+            self.tracker.with_deadline += 1
+            if deadline <= time.monotonic():
+                self.tracker.expired_on_arrival += 1
+                logger.info(f"⌛ Dropping {scope['method']} {scope['path']}: caller deadline already passed")
+                await self._reject(send)
+                return
+
+        token = request_deadline.set(deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+    @staticmethod
+    async def _reject(send) -> None:
+        body = json.dumps({
+            "detail": ErrorResponse(
+                error="deadline_exceeded",
+                message="Request deadline already passed"
+            ).model_dump()
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Instancia global de contadores de deadline
+deadline_tracker = DeadlineTracker()
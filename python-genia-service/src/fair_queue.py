@@ -0,0 +1,327 @@
+"""
+Cola justa ponderada entre tenants para las llamadas a Google Gemini.
+
+Cada petición lleva un tenant (cabecera que reenvía el gateway, por defecto
+X-Tenant-ID). Cuando no hay huecos de concurrencia libres, las llamadas esperan
+en una cola por tenant y un planificador deficit round robin (DRR) reparte los
+huecos que se liberan según el peso de cada tenant: un tenant de lotes con
+cientos de peticiones en cola no deja sin servicio a uno interactivo.
+
+Dentro de cada tenant se despacha primero el deadline más cercano (EDF). Las
+llamadas sin deadline del llamante se ordenan con el presupuesto propio del
+servicio (API_TIMEOUT), y las que vencen esperando salen de la cola sin
+llegar a llamar a Gemini.
+
+El tenant de la petición en curso viaja en una ContextVar, de modo que no hay
+que pasarlo por cada capa del servicio (caché, single-flight, reintentos...);
+lo mismo ocurre con el deadline (ver deadline.py).
+"""
+import asyncio
+import bisect
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Union
+from deadline import request_deadline
+from rate_limit import RateLimitExceededError
+from retry import DeadlineExceededError
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+DEFAULT_TENANT = "default"
+
+# Los nombres de tenant vienen de una cabecera: longitud acotada
+MAX_TENANT_LENGTH = 64
+
+# Tenants con histograma propio; el resto se agrega en OTHER_TENANTS
+MAX_TRACKED_TENANTS = 64
+OTHER_TENANTS = "_other"
+
+# Límites superiores (segundos) de los buckets del histograma de espera en cola
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tenant de la petición en curso
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+
+class TenantQueueFullError(RateLimitExceededError):
+    """La cola del tenant está llena: se rechaza en vez de esperar"""
+
+    def __init__(self, tenant: str, retry_after: float):
+        self.tenant = tenant
+        super().__init__(f"Queue for tenant '{tenant}' is full", retry_after)
+
+
+def normalize_tenant(value: Optional[str]) -> str:
+    """Tenant a partir del valor de la cabecera (vacío = DEFAULT_TENANT)"""
+    tenant = (value or "").strip()[:MAX_TENANT_LENGTH]
+    return tenant or DEFAULT_TENANT
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """
+    Pesos por tenant en formato "interactive=4,batch=1"
+
+    Raises:
+        ValueError: Entrada sin "=" o peso no positivo
+    """
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        tenant, separator, weight = item.partition("=")
+        if not separator or float(weight) <= 0:
+            raise ValueError(f"Invalid tenant weight '{item}'. Use 'tenant=weight' with weight > 0")
+        weights[normalize_tenant(tenant)] = float(weight)
+    return weights
+
+
+class WaitHistogram:
+    """Histograma acumulativo (estilo Prometheus) de la espera en cola"""
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(WAIT_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        buckets, cumulative = {}, 0
+        for bound, count in zip(WAIT_BUCKETS + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": buckets}
+
+
+class _Waiter:
+    __slots__ = ("tenant", "future", "enqueued_at", "deadline", "sort_key")
+
+    def __init__(self, tenant: str, future: asyncio.Future, enqueued_at: float, deadline: Optional[float], sort_key):
+        self.tenant = tenant
+        self.future = future
+        self.enqueued_at = enqueued_at
+        self.deadline = deadline
+        self.sort_key = sort_key
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.sort_key < other.sort_key
+
+
+class FairScheduler:
+    """
+    Huecos de concurrencia repartidos entre tenants con deficit round robin
+
+    Cada llamada cuesta 1; en su turno un tenant suma su peso al déficit y
+    despacha mientras el déficit llegue a 1. Con pesos 4 y 1, el primer tenant
+    recibe 4 huecos por cada hueco del segundo mientras ambos tengan cola.
+    La cola de cada tenant es un heap por deadline (EDF, FIFO a igual deadline).
+    """
+
+    def __init__(
+        self,
+        capacity: Union[int, Callable[[], int]],
+        weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+        max_queue_per_tenant: int = 256,
+        default_timeout: float = 30.0
+    ):
+        # La capacidad puede ser dinámica (p. ej. el límite adaptativo)
+        self._capacity = capacity if callable(capacity) else (lambda: capacity)
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.default_timeout = default_timeout
+
+        self.in_flight = 0
+        self._queues: Dict[str, List[_Waiter]] = {}
+        self._sequence = itertools.count()
+        self._deficit: Dict[str, float] = {}
+        self._active: Deque[str] = deque()
+
+        self._histograms: Dict[str, WaitHistogram] = {}
+        self.dispatched: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+        self.expired: Dict[str, int] = {}
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self._capacity())
+
+    def weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, self.default_weight)
+
+    @asynccontextmanager
+    async def slot(self, tenant: Optional[str] = None, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Ocupar un hueco durante una llamada
+
+        Tenant y deadline (time.monotonic) por defecto: los de la petición en curso.
+
+        Raises:
+            TenantQueueFullError: La cola del tenant ya tiene max_queue_per_tenant llamadas
+            DeadlineExceededError: El deadline venció antes de conseguir hueco
+        """
+        await self._acquire(tenant or current_tenant.get(), deadline or request_deadline.get())
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._dispatch()
+
+    async def _acquire(self, tenant: str, deadline: Optional[float]) -> None:
+        now = time.monotonic()
+        if deadline is not None and deadline <= now:
+            self._record_expired(tenant)
+            raise DeadlineExceededError("Request deadline exceeded before dispatch")
+
+        if self.in_flight < self.capacity and not self._active:
+            self.in_flight += 1
+            self._record_dispatch(tenant, 0.0)
+            return
+
+        queue = self._queues.get(tenant)
+        if queue is None:
+            queue = self._queues[tenant] = []
+        if len(queue) >= self.max_queue_per_tenant:
+            key = self._stats_key(tenant)
+            self.rejected[key] = self.rejected.get(key, 0) + 1
+            logger.warning(f"🚦 Tenant '{tenant}' queue full ({len(queue)} waiting)")
+            raise TenantQueueFullError(tenant, self._retry_after(tenant))
+
+        sort_key = (deadline if deadline is not None else now + self.default_timeout, next(self._sequence))
+        waiter = _Waiter(tenant, asyncio.get_running_loop().create_future(), now, deadline, sort_key)
+        heapq.heappush(queue, waiter)
+        if tenant not in self._deficit:
+            self._deficit[tenant] = 0.0
+            self._active.append(tenant)
+        self._dispatch()
+
+        try:
+            if deadline is None:
+                await waiter.future
+            else:
+                await asyncio.wait_for(waiter.future, timeout=deadline - now)
+        except asyncio.TimeoutError:
+            # Venció esperando turno: sale de la cola sin llegar a Gemini
+            self._forget(queue, waiter)
+            self._record_expired(tenant)
+            raise DeadlineExceededError(f"Request deadline exceeded after {time.monotonic() - now:.3f}s in queue")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Ya se nos había cedido el hueco: devolverlo
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                self._forget(queue, waiter)
+            raise
+
+    @staticmethod
+    def _forget(queue: List[_Waiter], waiter: _Waiter) -> None:
+        if waiter in queue:
+            queue.remove(waiter)
+            heapq.heapify(queue)
+
+    def _dispatch(self) -> None:
+        """Ceder los huecos libres a los tenants en cola, por turnos DRR"""
+        while self.in_flight < self.capacity and self._active:
+            tenant = self._active[0]
+            queue = self._queues[tenant]
+            while queue and queue[0].future.done():
+                heapq.heappop(queue)
+            if not queue:
+                # Tenant sin cola: sale de la ronda y pierde el déficit acumulado
+                self._active.popleft()
+                del self._queues[tenant], self._deficit[tenant]
+                continue
+
+            if self._deficit[tenant] < 1:
+                # Inicio de turno: sumar el peso (los pesos < 1 acumulan durante varias rondas)
+                self._deficit[tenant] += self.weight(tenant)
+                if self._deficit[tenant] < 1:
+                    self._active.rotate(-1)
+                    continue
+
+            waiter = heapq.heappop(queue)
+            self._deficit[tenant] -= 1
+            self.in_flight += 1
+            waiter.future.set_result(None)
+            self._record_dispatch(tenant, time.monotonic() - waiter.enqueued_at)
+            if self._deficit[tenant] < 1:
+                self._active.rotate(-1)
+
+    def _retry_after(self, tenant: str) -> float:
+        """Espera sugerida: la media de espera en cola del tenant (mínimo 1s)"""
+        histogram = self._histograms[self._stats_key(tenant)]
+        if not histogram.count:
+            return 1.0
+        return max(1.0, histogram.sum / histogram.count)
+
+    def _stats_key(self, tenant: str) -> str:
+        """Clave de métricas del tenant (registra su histograma la primera vez)"""
+        if tenant not in self._histograms:
+            if len(self._histograms) >= MAX_TRACKED_TENANTS:
+                tenant = OTHER_TENANTS
+            self._histograms.setdefault(tenant, WaitHistogram())
+        return tenant
+
+    def _record_dispatch(self, tenant: str, wait: float) -> None:
+        key = self._stats_key(tenant)
+        self._histograms[key].observe(wait)
+        self.dispatched[key] = self.dispatched.get(key, 0) + 1
+
+    def _record_expired(self, tenant: str) -> None:
+        key = self._stats_key(tenant)
+        self.expired[key] = self.expired.get(key, 0) + 1
+
+    def queued(self, tenant: str) -> int:
+        return len(self._queues.get(tenant, ()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Uso, colas por tenant e histogramas de espera"""
+        tenants = {}
+        for tenant, histogram in self._histograms.items():
+            tenants[tenant] = {
+                "weight": self.weight(tenant),
+                "queued": self.queued(tenant),
+                "dispatched": self.dispatched.get(tenant, 0),
+                "rejected": self.rejected.get(tenant, 0),
+                "expired": self.expired.get(tenant, 0),
+                "wait_seconds": histogram.stats()
+            }
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "max_queue_per_tenant": self.max_queue_per_tenant,
+            "default_weight": self.default_weight,
+            "tenants": tenants
+        }
+
+
+class TenantMiddleware:
+    """
+    Middleware ASGI: fija el tenant de la petición a partir de la cabecera del gateway
+    """
+
+    def __init__(self, app, header: str):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = next((v for k, v in scope["headers"] if k == self.header), b"")
+        token = current_tenant.set(normalize_tenant(value.decode("latin-1")))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(token)
@@ -0,0 +1,179 @@
+"""
+Estado de salud de Google Gemini mantenido en memoria.
+
+Los health checks (Docker, balanceador, gateway) no llaman a Gemini: responden
+con la última observación guardada. Esa observación se actualiza de dos formas:
+
+- pasiva: el resultado de las consultas reales (una respuesta correcta prueba
+  que Gemini está sano; varios fallos seguidos, que no lo está),
+- activa: una tarea en segundo plano sondea Gemini cada HEALTH_CHECK_INTERVAL
+  segundos (con jitter), salvo que el tráfico real ya lo haya confirmado en ese
+  intervalo; así un servicio con tráfico no gasta tokens en sondas.
+
+Si no hay observación todavía (o la tarea dejó de refrescarla), el health
+check detallado sondea bajo demanda; las sondas concurrentes se comparten.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+UNKNOWN = "unknown"
+
+
+class UpstreamHealthMonitor:
+    """
+    Última observación de la salud de Gemini, refrescada por tráfico y por sondas
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], Awaitable[bool]],
+        interval: float = 30.0,
+        jitter: float = 0.1,
+        failure_threshold: int = 3,
+        probe_timeout: float = 15.0
+    ):
+        self.probe = probe
+        self.interval = interval
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.probe_timeout = probe_timeout
+
+        self._task: Optional[asyncio.Task] = None
+        self._refreshing: Optional[asyncio.Future] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Olvidar la observación actual (el estado vuelve a ser desconocido)"""
+        self.status = UNKNOWN
+        self.source: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._checked_monotonic: Optional[float] = None
+        self._last_traffic_success: Optional[float] = None
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.probes = 0
+        self.probes_failed = 0
+        self.probes_skipped = 0
+
+    def _set(self, status: str, source: str) -> None:
+        if status != self.status and self.status != UNKNOWN:
+            log = logger.info if status == HEALTHY else logger.warning
+            log(f"🩺 Google Gemini is now {status} (from {source})")
+        self.status = status
+        self.source = source
+        self.checked_at = time.time()
+        self._checked_monotonic = time.monotonic()
+
+    def record_traffic(self, success: bool, error: Optional[str] = None) -> None:
+        """
+        Resultado de una consulta real a Gemini (inferencia pasiva)
+
+        Un éxito basta para marcar a Gemini como sano; para marcarlo como caído
+        hacen falta `failure_threshold` fallos seguidos.
+        """
+        if success:
+            self.consecutive_failures = 0
+            self._last_traffic_success = time.monotonic()
+            self._set(HEALTHY, "traffic")
+            return
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.consecutive_failures >= self.failure_threshold:
+            self._set(UNHEALTHY, "traffic")
+
+    def record_probe(self, healthy: bool, error: Optional[str] = None) -> None:
+        """Resultado de una sonda activa"""
+        self.probes += 1
+        if healthy:
+            self.consecutive_failures = 0
+        else:
+            self.probes_failed += 1
+            self.last_error = error or self.last_error
+        self._set(HEALTHY if healthy else UNHEALTHY, "probe")
+
+    @property
+    def age(self) -> Optional[float]:
+        """Segundos desde la última observación (None si no hay)"""
+        if self._checked_monotonic is None:
+            return None
+        return time.monotonic() - self._checked_monotonic
+
+    @property
+    def fresh(self) -> bool:
+        """Hay observación y no es más antigua que tres intervalos de sondeo"""
+        age = self.age
+        return age is not None and (not self.interval or age <= 3 * self.interval)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado actual, sin E/S"""
+        age = self.age
+        return {
+            "status": self.status,
+            "source": self.source,
+            "checked_at": self.checked_at,
+            "age_seconds": round(age, 3) if age is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "probes": self.probes,
+            "probes_failed": self.probes_failed,
+            "probes_skipped": self.probes_skipped,
+            "interval": self.interval
+        }
+
+    async def refresh(self) -> str:
+        """
+        Sondear Gemini ahora; si ya hay una sonda en curso, esperar su resultado
+
+        Returns:
+            str: Estado resultante
+        """
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._run_probe())
+        # shield: si quien espera se cancela, la sonda compartida sigue para los demás
+        await asyncio.shield(self._refreshing)
+        return self.status
+
+    async def _run_probe(self) -> None:
+        try:
+            healthy = await asyncio.wait_for(self.probe(), timeout=self.probe_timeout)
+            self.record_probe(bool(healthy))
+        except Exception as e:
+            self.record_probe(False, error=f"{type(e).__name__}: {e}")
+
+    def _next_delay(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def _run(self) -> None:
+        while True:
+            # La primera sonda espera un intervalo: al arrancar no se paga una llamada
+            await asyncio.sleep(self._next_delay())
+            last_success = self._last_traffic_success
+            if last_success is not None and time.monotonic() - last_success < self.interval:
+                self.probes_skipped += 1
+                continue
+            await self.refresh()
+
+    def start(self) -> None:
+        """Arrancar el sondeo en segundo plano (interval 0 = solo inferencia pasiva)"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+            logger.debug(f"Background health probe every {self.interval}s (±{self.jitter:.0%})")
+
+    async def stop(self) -> None:
+        """Parar el sondeo; la observación deja de refrescarse y se descarta"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.reset()
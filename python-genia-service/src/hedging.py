@@ -0,0 +1,144 @@
+"""
+Peticiones "hedged" para recortar la latencia de cola de Gemini.
+
+Si el primer intento no ha respondido cuando se alcanza un percentil de la
+latencia reciente, se lanza un segundo intento idéntico; gana el primero que
+termine bien y el otro se cancela. Un presupuesto (porcentaje del tráfico)
+limita la carga extra que se envía a Gemini.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Ráfaga máxima de hedges acumulables cuando el tráfico ha sido tranquilo
+MAX_HEDGE_BURST = 10.0
+
+
+class HedgePolicy:
+    """
+    Lanza un intento de respaldo cuando el primero supera el percentil
+    `percentile` de la latencia observada en las últimas `window` llamadas
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget_percent: float = 5.0,
+        min_delay: float = 0.05,
+        min_samples: int = 20,
+        window: int = 512,
+        recompute_every: int = 16
+    ):
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.recompute_every = recompute_every
+
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._pending_samples = 0
+        self._threshold: Optional[float] = None
+        self._budget = 0.0
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Espera antes de lanzar el respaldo; None mientras no haya muestras suficientes"""
+        if self._threshold is None and len(self._latencies) >= self.min_samples:
+            self._recompute_threshold()
+        return self._threshold
+
+    def observe(self, latency: float) -> None:
+        """Registrar la latencia de una llamada terminada con éxito"""
+        self._latencies.append(latency)
+        self._pending_samples += 1
+        if self._pending_samples >= self.recompute_every and len(self._latencies) >= self.min_samples:
+            self._recompute_threshold()
+
+    def _recompute_threshold(self) -> None:
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        self._threshold = max(self.min_delay, ordered[index])
+        self._pending_samples = 0
+
+    def _take_budget(self) -> bool:
+        if self._budget >= 1.0:
+            self._budget -= 1.0
+            return True
+        self.budget_denied += 1
+        return False
+
+    async def run(self, operation: Callable[[], Awaitable[Any]], call_id: str = "") -> Any:
+        """
+        Ejecutar `operation()` con un posible intento de respaldo
+
+        Args:
+            operation: Función que crea la corrutina de un intento
+            call_id: Identificador para los logs
+
+        Returns:
+            Any: Resultado del primer intento que termine bien
+
+        Raises:
+            Exception: El error del intento principal si no hubo respaldo,
+                o el del último intento si ambos fallan
+        """
+        self.calls += 1
+        self._budget = min(MAX_HEDGE_BURST, self._budget + self.budget_percent / 100)
+        start = time.monotonic()
+
+        primary = asyncio.ensure_future(operation())
+        hedge: Optional[asyncio.Future] = None
+        delay = self.hedge_delay()
+        if delay is None:
+            result = await primary
+            self.observe(time.monotonic() - start)
+            return result
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._take_budget():
+                result = await primary
+                self.observe(time.monotonic() - start)
+                return result
+
+            self.hedges += 1
+            logger.debug(f"[{call_id}] Primary attempt slower than {delay:.3f}s, sending hedge")
+            hedge = asyncio.ensure_future(operation())
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        self.observe(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de hedging y umbral actual"""
+        return {
+            "percentile": self.percentile,
+            "budget_percent": self.budget_percent,
+            "threshold_seconds": self._threshold,
+            "samples": len(self._latencies),
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied
+        }
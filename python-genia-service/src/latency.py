@@ -0,0 +1,233 @@
+"""
+Histogramas de latencia en memoria por operación, con ventanas deslizantes (/stats).
+
+Cada operación (ruta HTTP, llamada a Gemini por modelo, sonda de salud) tiene
+un anillo de histogramas estilo HDR, uno por franja de LATENCY_SLOT_SECONDS.
+Al cambiar de franja se reutiliza la más antigua, así que el anillo cubre los
+últimos 15 minutos y /stats combina las franjas de 1, 5 y 15 minutos para dar
+percentiles (p50, p90, p99, p99.9) y peticiones por segundo.
+
+Los histogramas son arrays de contadores de 32 bits preasignados con buckets
+log-lineales (estilo HDR): 64 sub-buckets por potencia de dos, en 5,5 KB.
+Los percentiles son por rango más cercano y se dan como el límite superior del
+bucket: sobreestiman la muestra de ese rango en como mucho 1/64 (~1,6%) entre
+1 µs y ~134 s. Registrar
+una latencia es O(1): unas operaciones de bits para el índice y un incremento
+en el array, sin crear estructuras ni hacer crecer nada.
+"""
+import math
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import settings
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Buckets log-lineales: 2^SUB_BUCKET_BITS sub-buckets en el primer tramo y la
+# mitad superior en cada potencia de dos siguiente
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_MASK = (1 << SUB_BUCKET_BITS) - 1
+HALF_BUCKET_BITS = SUB_BUCKET_BITS - 1
+MAX_MICROSECONDS = (1 << 27) - 1  # ~134 s; las latencias mayores cuentan en el último bucket
+BUCKET_COUNT = (((MAX_MICROSECONDS | SUB_BUCKET_MASK).bit_length() - SUB_BUCKET_BITS) << HALF_BUCKET_BITS) + SUB_BUCKET_MASK + 1
+
+PERCENTILES = ((50.0, "p50"), (90.0, "p90"), (99.0, "p99"), (99.9, "p99_9"))
+WINDOWS = (("1m", 60), ("5m", 300), ("15m", 900))
+OTHER_OPERATION = "_other"
+
+
+def bucket_index(microseconds: int) -> int:
+    """Índice del bucket de una latencia en microsegundos"""
+    bucket = (microseconds | SUB_BUCKET_MASK).bit_length() - SUB_BUCKET_BITS
+    return (bucket << HALF_BUCKET_BITS) + (microseconds >> bucket)
+
+
+def bucket_upper_bound(index: int) -> int:
+    """Mayor latencia (µs) que cae en el bucket `index`"""
+    if index <= SUB_BUCKET_MASK:
+        return index
+    bucket = (index >> HALF_BUCKET_BITS) - 1
+    sub_bucket = index - (bucket << HALF_BUCKET_BITS)
+    return ((sub_bucket + 1) << bucket) - 1
+
+
+class LatencyHistogram:
+    """Histograma estilo HDR sobre un array preasignado de contadores"""
+
+    __slots__ = ("counts", "count", "sum", "max", "low", "high")
+
+    def __init__(self):
+        self.counts = array("I", bytes(BUCKET_COUNT * array("I").itemsize))
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        # Rango de índices usados (para vaciar y combinar sin recorrer todo el array)
+        self.low = BUCKET_COUNT
+        self.high = -1
+
+    def record(self, seconds: float) -> None:
+        microseconds = int(seconds * 1_000_000)
+        if microseconds > MAX_MICROSECONDS:
+            microseconds = MAX_MICROSECONDS
+        elif microseconds < 0:
+            microseconds = 0
+        index = bucket_index(microseconds)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if index < self.low:
+            self.low = index
+        if index > self.high:
+            self.high = index
+
+    def reset(self) -> None:
+        for index in range(self.low, self.high + 1):
+            self.counts[index] = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.low = BUCKET_COUNT
+        self.high = -1
+
+
+class LatencyWindows:
+    """
+    Anillo de histogramas de una operación, uno por franja de `slot_seconds`
+    """
+
+    def __init__(self, slot_seconds: float, horizon_seconds: float):
+        self.slot_seconds = slot_seconds
+        size = math.ceil(horizon_seconds / slot_seconds) + 1  # + la franja en curso
+        self.slots = [LatencyHistogram() for _ in range(size)]
+        self.epochs = array("q", [-1] * size)
+        self.total = 0
+
+    def record(self, seconds: float, now: float) -> None:
+        epoch = int(now // self.slot_seconds)
+        position = epoch % len(self.slots)
+        slot = self.slots[position]
+        if self.epochs[position] != epoch:
+            # Franja nueva: se reutiliza la más antigua del anillo
+            slot.reset()
+            self.epochs[position] = epoch
+        slot.record(seconds)
+        self.total += 1
+
+    def summary(self, now: float) -> Dict[str, Dict[str, Any]]:
+        """Percentiles y peticiones por segundo de cada ventana (1, 5 y 15 minutos)"""
+        current = int(now // self.slot_seconds)
+        elapsed = now - current * self.slot_seconds
+        merged: List[int] = [0] * BUCKET_COUNT
+        count, total_sum, maximum, low, high = 0, 0.0, 0.0, BUCKET_COUNT, -1
+        summaries: Dict[str, Dict[str, Any]] = {}
+        added = 0
+
+        # De la franja en curso hacia atrás, acumulando; cada ventana es un prefijo
+        for name, window_seconds in WINDOWS:
+            slots = max(1, math.ceil(window_seconds / self.slot_seconds))
+            while added < slots:
+                epoch = current - added
+                slot = self.slots[epoch % len(self.slots)]
+                if self.epochs[epoch % len(self.slots)] == epoch and slot.count:
+                    counts = slot.counts
+                    for index in range(slot.low, slot.high + 1):
+                        merged[index] += counts[index]
+                    count += slot.count
+                    total_sum += slot.sum
+                    maximum = max(maximum, slot.max)
+                    low, high = min(low, slot.low), max(high, slot.high)
+                added += 1
+
+            covered = (slots - 1) * self.slot_seconds + elapsed
+            summary: Dict[str, Any] = {
+                "window_seconds": round(covered, 3),
+                "count": count,
+                "throughput_per_second": round(count / covered, 3) if covered > 0 else 0.0
+            }
+            if count:
+                summary.update(_percentiles(merged, low, high, count, maximum))
+                summary["mean"] = round(total_sum / count, 6)
+                summary["max"] = round(maximum, 6)
+            summaries[name] = summary
+        return summaries
+
+
+def _percentiles(counts: List[int], low: int, high: int, count: int, maximum: float) -> Dict[str, float]:
+    """Percentiles (segundos, límite superior del bucket) de un histograma combinado"""
+    result: Dict[str, float] = {}
+    targets = [(max(1, math.ceil(count * pct / 100)), key) for pct, key in PERCENTILES]
+    cumulative, target = 0, 0
+    for index in range(low, high + 1):
+        cumulative += counts[index]
+        while target < len(targets) and cumulative >= targets[target][0]:
+            value = min(bucket_upper_bound(index) / 1_000_000, maximum)
+            result[targets[target][1]] = round(value, 6)
+            target += 1
+        if target == len(targets):
+            break
+    return result
+
+
+class LatencyRecorder:
+    """
+    Latencias por operación con ventanas deslizantes. El número de operaciones
+    está acotado: las que llegan con el máximo alcanzado cuentan como "_other"
+    """
+
+    def __init__(
+        self,
+        slot_seconds: float = 20.0,
+        horizon_seconds: float = 900.0,
+        max_operations: int = 64,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.slot_seconds = slot_seconds
+        self.horizon_seconds = horizon_seconds
+        self.max_operations = max_operations
+        self._clock = clock
+        self._operations: Dict[str, LatencyWindows] = {}
+
+    def record(self, operation: str, seconds: float) -> None:
+        """Registrar la latencia de una operación"""
+        windows = self._operations.get(operation)
+        if windows is None:
+            windows = self._add(operation)
+        windows.record(seconds, self._clock())
+
+    def _add(self, operation: str) -> LatencyWindows:
+        if len(self._operations) >= self.max_operations:
+            other = self._operations.get(OTHER_OPERATION)
+            if other is None:
+                logger.warning(f"⚠️  Tracking latency for {self.max_operations} operations, grouping new ones as '{OTHER_OPERATION}'")
+                other = self._operations[OTHER_OPERATION] = LatencyWindows(self.slot_seconds, self.horizon_seconds)
+            return other
+        windows = self._operations[operation] = LatencyWindows(self.slot_seconds, self.horizon_seconds)
+        return windows
+
+    def reset(self) -> None:
+        self._operations.clear()
+
+    def stats(self, operation: Optional[str] = None) -> Dict[str, Any]:
+        """Resumen por operación (o solo de `operation`) de las ventanas de 1, 5 y 15 minutos"""
+        now = self._clock()
+        selected: List[Tuple[str, LatencyWindows]] = sorted(self._operations.items())
+        if operation is not None:
+            selected = [(name, windows) for name, windows in selected if name == operation]
+        return {
+            "slot_seconds": self.slot_seconds,
+            "percentile_error": round(1 / (1 << HALF_BUCKET_BITS), 4),
+            "operations": {
+                name: {"total": windows.total, **windows.summary(now)} for name, windows in selected
+            }
+        }
+
+
+# Instancia global (rutas HTTP, llamadas a Gemini y sondas de salud)
+latency_recorder = LatencyRecorder(
+    slot_seconds=settings.LATENCY_SLOT_SECONDS,
+    max_operations=settings.LATENCY_MAX_OPERATIONS
+)
@@ -0,0 +1,116 @@
+"""
+Muestreo de logs repetitivos (acceso HTTP y rendimiento).
+
+Cada categoría tiene un LogSampler configurado con una especificación:
+
+- "" o "1": se escriben todos los registros
+- "1/N": uno de cada N (el primero de cada grupo)
+- "R/s": cubo de tokens de R registros por segundo (ráfaga de hasta R)
+
+El muestreo solo se aplica a registros por debajo de WARNING: los errores y
+los eventos SLOW se escriben siempre (lo decide logging_config). Los
+registros suprimidos se cuentan y se informan periódicamente para que los
+agregados sigan cuadrando.
+
+Este módulo no usa logging (logging_config lo importa).
+"""
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+_SPEC_PATTERN = re.compile(r"^\s*(?:(?P<one>1)\s*/\s*(?P<every>\d+)|(?P<rate>\d+(?:\.\d+)?)\s*/\s*s)\s*$")
+
+
+class LogSampler:
+    """
+    Decide qué registros de una categoría se escriben: 1 de cada `every` o,
+    con `rate` > 0, un cubo de tokens de `rate` registros por segundo
+    """
+
+    def __init__(self, every: int = 1, rate: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        if every < 1 or rate < 0:
+            raise ValueError("Log sampling needs every >= 1 and rate >= 0")
+        self.every = every
+        self.rate = rate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = rate
+        self._updated = clock()
+        self._seen = 0
+
+        self.kept = 0
+        self.suppressed = 0
+        # Ventana del último informe
+        self._window_start = self._updated
+        self._window_kept = 0
+        self._window_suppressed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 or self.every > 1
+
+    @property
+    def mode(self) -> str:
+        if self.rate > 0:
+            return f"{self.rate:g}/s"
+        return f"1/{self.every}" if self.every > 1 else "all"
+
+    def allow(self) -> bool:
+        """Registrar un intento y decidir si se escribe"""
+        with self._lock:
+            if self.rate > 0:
+                now = self._clock()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                keep = self._tokens >= 1
+                if keep:
+                    self._tokens -= 1
+            else:
+                keep = self._seen % self.every == 0
+                self._seen += 1
+
+            if keep:
+                self.kept += 1
+                self._window_kept += 1
+            else:
+                self.suppressed += 1
+                self._window_suppressed += 1
+            return keep
+
+    def report(self, interval: float, force: bool = False) -> Optional[Tuple[int, int, float]]:
+        """
+        Cerrar la ventana si han pasado `interval` segundos (o con `force`) y
+        hubo registros suprimidos
+
+        Returns:
+            (escritos, suprimidos, segundos de la ventana) o None
+        """
+        now = self._clock()
+        window = now - self._window_start
+        if not force and window < interval:
+            return None
+        with self._lock:
+            kept, suppressed = self._window_kept, self._window_suppressed
+            self._window_start, self._window_kept, self._window_suppressed = now, 0, 0
+        return (kept, suppressed, window) if suppressed else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "kept": self.kept, "suppressed": self.suppressed}
+
+
+def parse_sampling(spec: Optional[str], clock: Callable[[], float] = time.monotonic) -> LogSampler:
+    """
+    Crear el sampler de una especificación ("", "1", "1/N" o "R/s")
+
+    Raises:
+        ValueError: Especificación inválida
+    """
+    if not spec or spec.strip() == "1":
+        return LogSampler(clock=clock)
+    match = _SPEC_PATTERN.match(spec)
+    if match is None:
+        raise ValueError(f"Invalid log sampling '{spec}' (expected '1/N' or 'R/s')")
+    if match.group("every"):
+        return LogSampler(every=int(match.group("every")), clock=clock)
+    return LogSampler(rate=float(match.group("rate")), clock=clock)
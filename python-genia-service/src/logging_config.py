@@ -1,13 +1,248 @@
 """
 Configuración centralizada de logging siguiendo las mejores prácticas de Python.
 Basado en: https://docs.python.org/3/library/logging.html
+
+Con LOG_QUEUE_ENABLED el logger raíz solo encola los registros
+(BoundedQueueHandler) y los handlers de consola y archivo, rotación incluida,
+se ejecutan en el thread de un QueueListener: el event loop no hace E/S de logs.
+
+Con LOG_FORMAT=json cada registro sale como un objeto JSON (structlog), tanto
+los de get_logger como los eventos de get_event_logger. Estos últimos llevan
+campos estructurados, comprueban el nivel antes de procesar nada y admiten
+campos Lazy que solo se calculan si el evento se emite.
+
+log_api_call y log_performance se pueden muestrear (LOG_SAMPLING_*, ver
+log_sampling); los errores y los eventos SLOW se escriben siempre y los
+registros suprimidos se informan periódicamente.
 """
+import atexit
 import logging
 import logging.handlers
+import queue
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional
+import structlog
 from config import settings
+from log_sampling import LogSampler, parse_sampling
+
+QUEUE_POLICIES = ("drop", "block")
+LOG_FORMATS = ("text", "json")
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler sobre una cola acotada. Con la cola llena, la política "drop"
+    descarta el registro (y lo cuenta) y "block" espera a que el listener haga hueco
+    """
+
+    def __init__(self, log_queue: queue.Queue, policy: str = "drop"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown log queue policy '{policy}' (expected one of {', '.join(QUEUE_POLICIES)})")
+        super().__init__(log_queue)
+        self.policy = policy
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.msg, dict):
+            # Evento de structlog en modo JSON: lo renderiza el formatter del listener
+            return logging.makeLogRecord(record.__dict__)
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.policy == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """QueueListener que al parar vacía la cola aunque esté llena"""
+
+    def enqueue_sentinel(self) -> None:
+        # put_nowait (el de la clase base) fallaría con la cola llena
+        self.queue.put(self._sentinel)
+
+
+# Cola activa (None si los handlers escriben directamente)
+_queue_handler: Optional[BoundedQueueHandler] = None
+_queue_listener: Optional[FlushingQueueListener] = None
+
+# Formato de salida activo (lo fija setup_logging)
+_json_format = False
+
+# Muestreo por categoría (nombre del logger de cada helper) y cada cuánto se informa
+SAMPLED_CATEGORIES = ("api_calls", "performance")
+_samplers: Dict[str, LogSampler] = {}
+_sampling_report_interval = 60.0
+
+
+class Lazy:
+    """
+    Valor de un campo de log que solo se calcula si el registro se emite,
+    p. ej. Lazy(dict, request.headers). Sirve en eventos de structlog y como
+    argumento %s de los loggers de stdlib
+    """
+
+    __slots__ = ("function", "args")
+
+    def __init__(self, function: Callable[..., Any], *args: Any):
+        self.function = function
+        self.args = args
+
+    def __call__(self) -> Any:
+        return self.function(*self.args)
+
+    def __str__(self) -> str:
+        return str(self())
+
+    def __repr__(self) -> str:
+        return repr(self())
+
+
+def resolve_lazy(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Procesador de structlog: calcular los campos Lazy de un evento que se va a emitir"""
+    for key, value in event_dict.items():
+        if isinstance(value, Lazy):
+            event_dict[key] = value()
+    return event_dict
+
+
+_JSON_EVENT_PROCESSORS = (
+    structlog.stdlib.add_logger_name,
+    structlog.stdlib.add_log_level,
+    structlog.processors.TimeStamper(fmt="iso", utc=True),
+    structlog.processors.format_exc_info,
+    structlog.stdlib.ProcessorFormatter.wrap_for_formatter
+)
+
+
+def render_event(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Any:
+    """
+    Procesador final: en JSON deja el evento al ProcessorFormatter de los
+    handlers; en texto lo convierte en "evento clave=valor ..." para los
+    formatters de siempre
+    """
+    if _json_format:
+        for processor in _JSON_EVENT_PROCESSORS:
+            event_dict = processor(logger, method_name, event_dict)
+        return event_dict
+
+    exc_info = event_dict.pop("exc_info", None)
+    event = event_dict.pop("event", "")
+    fields = " ".join(f"{key}={value}" for key, value in event_dict.items())
+    return (f"{event} {fields}" if fields else str(event),), {"exc_info": exc_info}
+
+
+class EventLogger(structlog.stdlib.BoundLogger):
+    """
+    Logger estructurado sobre el logger de stdlib del mismo nombre (mismos
+    niveles y handlers). Un evento de un nivel desactivado se descarta antes
+    de pasar por los procesadores: no se calculan sus campos Lazy
+    """
+
+    def _proxy_to_logger(self, method_name: str, event: Optional[str] = None, *event_args: Any, **event_kw: Any) -> Any:
+        if not self._logger.isEnabledFor(_METHOD_LEVELS.get(method_name, logging.CRITICAL)):
+            return None
+        return super()._proxy_to_logger(method_name, event, *event_args, **event_kw)
+
+
+_METHOD_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "warn": logging.WARNING,
+    "error": logging.ERROR,
+    "exception": logging.ERROR,
+    "critical": logging.CRITICAL,
+    "fatal": logging.CRITICAL
+}
+
+# La cadena es fija (el formato se elige en render_event), así que los loggers
+# se pueden cachear en el primer uso aunque se reconfigure el logging
+structlog.configure(
+    processors=[resolve_lazy, render_event],
+    wrapper_class=EventLogger,
+    logger_factory=structlog.stdlib.LoggerFactory(),
+    cache_logger_on_first_use=True
+)
+
+
+def record_timestamp(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Procesador de los registros de stdlib: hora de creación del registro (no la
+    de formateo, que con la cola ocurre más tarde en el thread del listener)
+    """
+    created = datetime.fromtimestamp(event_dict["_record"].created, tz=timezone.utc)
+    event_dict["timestamp"] = created.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return event_dict
+
+
+def json_formatter() -> logging.Formatter:
+    """Formatter JSON para los handlers: eventos de structlog y registros de stdlib"""
+    return structlog.stdlib.ProcessorFormatter(
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(ensure_ascii=False)
+        ],
+        foreign_pre_chain=[
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            record_timestamp
+        ]
+    )
+
+
+def shutdown_logging() -> None:
+    """
+    Informar de los registros suprimidos por muestreo y parar el listener
+    escribiendo antes los registros pendientes. Se llama al cerrar la
+    aplicación, al reconfigurar el logging y al salir del proceso
+    """
+    global _queue_handler, _queue_listener
+    flush_sampling_reports()
+    listener, handler = _queue_listener, _queue_handler
+    _queue_listener = _queue_handler = None
+    if listener is None:
+        return
+
+    logging.getLogger().removeHandler(handler)
+    listener.stop()
+    if handler.dropped:
+        record = logging.getLogger(__name__).makeRecord(
+            __name__, logging.WARNING, __file__, 0,
+            f"⚠️  {handler.dropped} log records were dropped (log queue full)", None, None
+        )
+        for target in listener.handlers:
+            target.handle(record)
+    for target in listener.handlers:
+        try:
+            target.flush()
+            target.close()
+        except (ValueError, OSError):
+            # Al salir del proceso el stream (p. ej. stdout capturado) puede estar ya cerrado
+            pass
+
+
+def queue_stats() -> Dict[str, Any]:
+    """Estado de la cola de logs (registros pendientes y descartados)"""
+    if _queue_handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "policy": _queue_handler.policy,
+        "size": _queue_handler.queue.qsize(),
+        "max_size": _queue_handler.queue.maxsize,
+        "dropped": _queue_handler.dropped
+    }
+
+
+atexit.register(shutdown_logging)
 
 
 
@@ -18,9 +253,12 @@ def setup_logging(
     max_bytes: int = 10 * 1024 * 1024,  # 10MB
     backup_count: int = 5,
     enable_console: bool = True,
-    enable_file: bool = True
-
-
+    enable_file: bool = True,
+    use_queue: Optional[bool] = None,
+    queue_size: Optional[int] = None,
+    queue_policy: Optional[str] = None,
+    log_format: Optional[str] = None,
+    sampling: Optional[Dict[str, str]] = None
 ) -> logging.Logger:
     """
     Configura el sistema de logging de la aplicación siguiendo las mejores prácticas.
@@ -33,21 +271,41 @@ def setup_logging(
         backup_count: Número de archivos de backup a mantener
         enable_console: Si mostrar logs en consola
         enable_file: Si guardar logs en archivo
+        use_queue: Ejecutar los handlers en un thread aparte (por defecto LOG_QUEUE_ENABLED)
+        queue_size: Registros en cola como máximo (por defecto LOG_QUEUE_SIZE)
+        queue_policy: Con la cola llena, "drop" o "block" (por defecto LOG_QUEUE_POLICY)
+        log_format: "text" o "json" (por defecto LOG_FORMAT)
+        sampling: Muestreo por categoría, p. ej. {"api_calls": "1/100"} (por defecto LOG_SAMPLING_*)
 
     Returns:
         Logger: Logger raíz configurado
     """
+    global _queue_handler, _queue_listener, _json_format, _samplers, _sampling_report_interval
+
+    log_format = (log_format or settings.LOG_FORMAT).lower()
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{log_format}' (expected one of {', '.join(LOG_FORMATS)})")
+    if sampling is None:
+        sampling = {"api_calls": settings.LOG_SAMPLING_API_CALLS, "performance": settings.LOG_SAMPLING_PERFORMANCE}
+    samplers = {category: parse_sampling(sampling.get(category)) for category in SAMPLED_CATEGORIES}
 
     # Obtener el logger raíz
     root_logger = logging.getLogger()
 
+    # Escribir lo pendiente de una configuración anterior antes de reemplazarla
+    shutdown_logging()
+
     # Limpiar handlers existentes para evitar duplicados
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    handlers: List[logging.Handler] = []
 
     # Configurar nivel de logging
     numeric_level = getattr(logging, log_level.upper(), logging.INFO)
     root_logger.setLevel(numeric_level)
+    _json_format = log_format == "json"
+    _samplers = {category: sampler for category, sampler in samplers.items() if sampler.enabled}
+    _sampling_report_interval = settings.LOG_SAMPLING_REPORT_INTERVAL
 
     # Formato detallado para logs
     detailed_formatter = logging.Formatter(
@@ -65,8 +323,8 @@ def setup_logging(
     if enable_console:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setLevel(numeric_level)
-        console_handler.setFormatter(console_formatter)
-        root_logger.addHandler(console_handler)
+        console_handler.setFormatter(json_formatter() if _json_format else console_formatter)
+        handlers.append(console_handler)
 
     # Handler para archivo con rotación
     if enable_file:
@@ -88,8 +346,21 @@ def setup_logging(
             encoding='utf-8'
         )
         file_handler.setLevel(numeric_level)
-        file_handler.setFormatter(detailed_formatter)
-        root_logger.addHandler(file_handler)
+        file_handler.setFormatter(json_formatter() if _json_format else detailed_formatter)
+        handlers.append(file_handler)
+
+    if settings.LOG_QUEUE_ENABLED if use_queue is None else use_queue:
+        # El event loop solo encola; consola, archivo y rotación van en el thread del listener
+        _queue_handler = BoundedQueueHandler(
+            queue.Queue(maxsize=queue_size or settings.LOG_QUEUE_SIZE),
+            policy=queue_policy or settings.LOG_QUEUE_POLICY
+        )
+        _queue_listener = FlushingQueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+        root_logger.addHandler(_queue_handler)
+    else:
+        for handler in handlers:
+            root_logger.addHandler(handler)
 
     # Logger específico para requests HTTP (opcional)
     http_logger = logging.getLogger('httpx')
@@ -103,7 +374,10 @@ def setup_logging(
     root_logger.propagate = False
 
     # Log inicial confirmando configuración
-    root_logger.info(f"Logging configurado - Nivel: {log_level}, Archivo: {enable_file}, Consola: {enable_console}")
+    root_logger.info(
+        f"Logging configurado - Nivel: {log_level}, Archivo: {enable_file}, Consola: {enable_console}, "
+        f"Cola: {_queue_handler is not None}, Formato: {log_format}"
+    )
 
     return root_logger
 
@@ -124,6 +398,65 @@ def get_logger(name: str) -> logging.Logger:
 
 
 
+def get_event_logger(name: str) -> EventLogger:
+    """
+    Obtiene un logger estructurado (structlog) sobre el logger de stdlib del
+    mismo nombre: logger.debug("evento", campo=valor, otro=Lazy(funcion, arg))
+
+    Args:
+        name: Nombre del logger (típicamente __name__)
+
+    Returns:
+        EventLogger: Logger de eventos para el módulo
+    """
+    # La cadena de procesadores es fija: se puede enlazar ya, sin el proxy perezoso
+    return structlog.stdlib.get_logger(name).bind()
+
+
+_api_call_events = get_event_logger('api_calls')
+_performance_events = get_event_logger('performance')
+
+
+def _sampled_out(category: str, level: int) -> bool:
+    """
+    Si el registro de un helper se descarta por muestreo. WARNING o más
+    (errores, SLOW) se escribe siempre y no gasta cuota
+    """
+    sampler = _samplers.get(category)
+    if sampler is None:
+        return False
+    keep = level >= logging.WARNING or sampler.allow()
+    report = sampler.report(_sampling_report_interval)
+    if report is not None:
+        _report_sampling(category, *report)
+    return not keep
+
+
+def _report_sampling(category: str, kept: int, suppressed: int, window: float) -> None:
+    if _json_format:
+        get_event_logger(category).info(
+            "log_sampling", category=category, kept=kept, suppressed=suppressed, window_seconds=round(window, 3)
+        )
+    else:
+        get_logger(category).info(
+            f"📉 Log sampling: {suppressed} {category} records suppressed, {kept} written in the last {window:.0f}s"
+        )
+
+
+def flush_sampling_reports() -> None:
+    """Informar de los registros suprimidos que aún no se han informado"""
+    for category, sampler in _samplers.items():
+        report = sampler.report(_sampling_report_interval, force=True)
+        if report is not None:
+            _report_sampling(category, *report)
+
+
+def sampling_stats() -> Dict[str, Dict[str, Any]]:
+    """Registros escritos y suprimidos por categoría muestreada"""
+    return {category: sampler.stats() for category, sampler in _samplers.items()}
+
+
+
 def log_function_call(func_name: str, args: dict = None, level: str = "DEBUG"):
     """
     Utility para loggear llamadas a funciones con sus argumentos.
@@ -155,18 +488,27 @@ def log_api_call(method: str, url: str, status_code: int = None, response_time:
     """
     logger = get_logger('api_calls')
 
+    if status_code and status_code >= 400:
+        level = logging.ERROR
+    elif status_code and status_code >= 300:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    if not logger.isEnabledFor(level) or _sampled_out('api_calls', level):
+        return
+
+    if _json_format:
+        _api_call_events.log(
+            level, "api_call", method=method, url=url, status_code=status_code, response_time=response_time
+        )
+        return
+
     message = f"{method} {url}"
     if status_code:
         message += f" - Status: {status_code}"
     if response_time:
         message += f" - Time: {response_time:.3f}s"
-
-    if status_code and status_code >= 400:
-        logger.error(message)
-    elif status_code and status_code >= 300:
-        logger.warning(message)
-    else:
-        logger.info(message)
+    logger.log(level, message)
 
 
 
@@ -181,17 +523,24 @@ def log_performance(operation: str, duration: float, details: dict = None):
     """
     logger = get_logger('performance')
 
-    message = f"{operation} completed in {duration:.3f}s"
-    if details:
-        message += f" - Details: {details}"
-
     # Clasificar por tiempo de respuesta
     if duration > 5.0:
-        logger.warning(f"SLOW: {message}")
+        level, speed = logging.WARNING, "SLOW"
     elif duration > 2.0:
-        logger.info(f"MEDIUM: {message}")
+        level, speed = logging.INFO, "MEDIUM"
     else:
-        logger.debug(f"FAST: {message}")
+        level, speed = logging.DEBUG, "FAST"
+    if not logger.isEnabledFor(level) or _sampled_out('performance', level):
+        return
+
+    if _json_format:
+        _performance_events.log(level, "performance", operation=operation, duration=duration, speed=speed, details=details)
+        return
+
+    message = f"{operation} completed in {duration:.3f}s"
+    if details:
+        message += f" - Details: {details}"
+    logger.log(level, f"{speed}: {message}")
 
 
 # Configuración específica para diferentes entornos
@@ -3,15 +3,36 @@ Aplicación principal FastAPI para integración con Google Gemini API.
 """
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from config import settings
-from models import QueryRequest, QueryResponse, HealthResponse, ErrorResponse, ServiceStatus
+from models import (
+    QueryRequest, QueryResponse, HealthResponse, ErrorResponse, ServiceStatus,
+    BatchQueryRequest, BatchQueryResponse, PrefixRegisterRequest, PrefixInfo
+)
 from services import genia_service
+from circuit_breaker import CircuitOpenError
+from rate_limit import RateLimitExceededError
+from admission import AdmissionMiddleware, admission_controller
+from fair_queue import TenantMiddleware
+from deadline import DeadlineMiddleware, deadline_tracker
+from retry import DeadlineExceededError
+from prefix_cache import UnknownPrefixError
+from cache import request_fingerprint
+from tokens import token_counter
+from metrics import MetricsMiddleware, ServiceStatsCollector, registry as metrics_registry
+from latency import latency_recorder
+import asyncio
 import time
-from logging_config import get_logger, log_api_call, log_performance
+import json
+import math
+from typing import Any, AsyncIterator, Dict, Optional
+from logging_config import Lazy, get_event_logger, get_logger, log_api_call, log_performance, shutdown_logging
 import logging
 
 # Obtener logger específico para este módulo
 logger = get_logger(__name__)
+events = get_event_logger(__name__)
 
 def create_app() -> FastAPI:
     """Factory para crear la aplicación FastAPI"""
@@ -33,11 +54,38 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # Descarte de carga en /query* antes de que se acumule la cola
+    if settings.ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+    # Tenant de cada petición (cabecera del gateway) para la cola justa hacia Gemini
+    app.add_middleware(TenantMiddleware, header=settings.TENANT_HEADER)
+
+    # Deadline del llamante: las peticiones que llegan vencidas reciben 504 sin trabajo
+    app.add_middleware(
+        DeadlineMiddleware,
+        tracker=deadline_tracker,
+        deadline_header=settings.DEADLINE_HEADER,
+        timeout_header=settings.TIMEOUT_HEADER
+    )
+
+    # Métricas HTTP (el más externo: mide también las respuestas de admisión y deadline);
+    # la misma medida alimenta los histogramas de /stats, que no dependen de METRICS_ENABLED
+    app.add_middleware(
+        MetricsMiddleware,
+        known_paths=lambda: [route.path for route in app.routes],
+        recorder=latency_recorder,
+        prometheus=settings.METRICS_ENABLED
+    )
+
     return app
 
 # Crear instancia de la aplicación
 app = create_app()
 
+# Estado del servicio (caché, circuito, colas) leído en cada scrape de /metrics
+metrics_registry.register(ServiceStatsCollector(genia_service))
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Middleware para loggear todas las requests HTTP"""
@@ -45,7 +93,7 @@ async def log_requests(request: Request, call_next):
 
     # Log request inicial
     logger.info(f"🌐 Incoming request: {request.method} {request.url.path}")
-    logger.debug(f"Request headers: {dict(request.headers)}")
+    events.debug("request_headers", headers=Lazy(dict, request.headers))
 
     try:
         response = await call_next(request)
@@ -82,16 +130,27 @@ async def startup_event():
     logger.debug("Configuration details:")
     logger.debug(f"  - API Timeout: {settings.API_TIMEOUT}s")
     logger.debug(f"  - Max Retries: {settings.MAX_RETRIES}")
+    logger.debug(f"  - Client backend: {genia_service.backend} (max concurrency: {genia_service.max_concurrency})")
     logger.debug(f"  - Log Level: {settings.LOG_LEVEL}")
 
+    # Cargar el tokenizador fuera del event loop (puede leer/descargar la codificación)
+    await asyncio.get_running_loop().run_in_executor(None, token_counter.warm_up)
+
     # Verificar configuración crítica
     if not settings.GENIA_API_KEY:
         logger.critical("⚠️  GENIA_API_KEY not configured - API calls will fail!")
 
+    # Salud de Gemini refrescada en segundo plano: los health checks no llaman a Gemini
+    if genia_service.client:
+        genia_service.health_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Eventos de cierre de la aplicación"""
     logger.info(f"🛑 Shutting down {settings.APP_NAME}")
+    await genia_service.health_monitor.stop()
+    genia_service.close()
+    shutdown_logging()  # Escribir los logs encolados y parar el listener
     logging.shutdown()  # Cerrar todos los handlers
 
 @app.get("/", response_model=dict)
@@ -121,18 +180,66 @@ async def health_check():
     logger.debug(f"Health status: {health_response.status}")
     return health_response
 
+@app.get("/health/live", response_model=HealthResponse)
+async def liveness_check():
+    """Liveness: el proceso responde (no depende de Gemini)"""
+    return HealthResponse(
+        status=ServiceStatus.HEALTHY,
+        service=settings.APP_NAME,
+        version=settings.APP_VERSION,
+        timestamp=time.time()
+    )
+
+@app.get("/health/ready", response_model=HealthResponse)
+async def readiness_check():
+    """
+    Readiness: el servicio puede atender consultas. Responde desde memoria:
+    cliente configurado, circuito no abierto y Gemini no marcado como caído
+    """
+    reason = None
+    if not genia_service.client:
+        reason = "Google Gemini client not configured"
+    elif genia_service.get_circuit_state().get("state", "closed") == "open":
+        reason = "Circuit breaker is open"
+    elif genia_service.health_monitor.status == "unhealthy":
+        reason = f"Google Gemini is unhealthy ({genia_service.health_monitor.source})"
+
+    if reason is not None:
+        logger.debug(f"Readiness check failed: {reason}")
+        raise HTTPException(
+            status_code=503,
+            detail=ErrorResponse(error="not_ready", message=reason, timestamp=time.time()).model_dump()
+        )
+
+    return HealthResponse(
+        status=ServiceStatus.HEALTHY,
+        service=settings.APP_NAME,
+        version=settings.APP_VERSION,
+        timestamp=time.time()
+    )
+
 @app.get("/health/detailed", response_model=dict)
 async def detailed_health_check():
-    """Health check detallado incluyendo dependencias externas"""
+    """
+    Health check detallado incluyendo dependencias externas
+
+    El estado de Gemini sale de memoria (sondeo en segundo plano y tráfico real);
+    solo se sondea aquí si todavía no hay una observación reciente.
+    """
     start_time = time.time()
-    logger.info("🔍 Detailed health check started")
+    logger.debug("🔍 Detailed health check started")
 
     try:
-        # Verificar Google Gemini API
-        logger.debug("Checking Google Gemini API health...")
-        gemini_healthy = await genia_service.health_check()
+        monitor = genia_service.health_monitor
+        if not monitor.fresh:
+            logger.debug("No recent Google Gemini health observation, probing now...")
+            await monitor.refresh()
+        upstream = monitor.snapshot()
+        gemini_healthy = upstream["status"] == "healthy"
+        circuit = genia_service.get_circuit_state()
+        circuit_closed = circuit.get("state", "closed") == "closed"
 
-        overall_status = ServiceStatus.HEALTHY if gemini_healthy else ServiceStatus.DEGRADED
+        overall_status = ServiceStatus.HEALTHY if gemini_healthy and circuit_closed else ServiceStatus.DEGRADED
 
         health_details = {
             "status": overall_status,
@@ -140,8 +247,10 @@ async def detailed_health_check():
             "version": settings.APP_VERSION,
             "timestamp": time.time(),
             "dependencies": {
-                "google_gemini": "healthy" if gemini_healthy else "unhealthy"
+                "google_gemini": upstream["status"]
             },
+            "upstream_health": upstream,
+            "circuit_breaker": circuit,
             "environment": settings.ENVIRONMENT,
             "model": genia_service.model_name
         }
@@ -150,10 +259,8 @@ async def detailed_health_check():
         check_duration = time.time() - start_time
         log_performance("detailed_health_check", check_duration, {"gemini_healthy": gemini_healthy})
 
-        if gemini_healthy:
-            logger.info(f"✅ Detailed health check passed - Status: {overall_status}")
-        else:
-            logger.warning(f"⚠️  Detailed health check degraded - Gemini API unhealthy")
+        if not gemini_healthy:
+            logger.warning(f"⚠️  Detailed health check degraded - Gemini API {upstream['status']}")
 
         return health_details
 
@@ -192,6 +299,94 @@ async def get_model_info():
             ).model_dump()
         )
 
+@app.get("/cache/stats", response_model=dict)
+async def get_cache_stats():
+    """
+    Obtener los contadores de la caché de respuestas (hits, misses, expulsiones)
+    y de la coalescencia de peticiones idénticas en curso
+    """
+    return {
+        "success": True,
+        "data": {
+            **genia_service.get_cache_stats(),
+            "single_flight": genia_service.get_single_flight_stats()
+        },
+        "timestamp": time.time()
+    }
+
+@app.get("/stats", response_model=dict)
+async def get_latency_stats(operation: Optional[str] = None):
+    """
+    Latencia por operación (rutas HTTP, llamadas a Gemini por modelo, sondas de
+    salud) en los últimos 1, 5 y 15 minutos: p50, p90, p99, p99.9 y peticiones por segundo
+    """
+    return {
+        "success": True,
+        "data": latency_recorder.stats(operation),
+        "timestamp": time.time()
+    }
+
+@app.post("/prefixes", response_model=PrefixInfo, status_code=201)
+async def register_prefix(request: PrefixRegisterRequest):
+    """
+    Registrar (o reemplazar) un prefijo compartido; las consultas lo referencian
+    con `prefix` y Gemini lo recibe cacheado en lugar de en cada llamada
+    """
+    entry = await genia_service.prefix_cache.register(request.name, request.content, request.ttl_seconds)
+    return PrefixInfo(**entry.info())
+
+@app.get("/prefixes", response_model=dict)
+async def list_prefixes():
+    """
+    Prefijos registrados y contadores del caché de prefijos
+    """
+    return {
+        "success": True,
+        "data": {
+            "prefixes": genia_service.prefix_cache.list(),
+            **genia_service.prefix_cache.stats()
+        },
+        "timestamp": time.time()
+    }
+
+@app.delete("/prefixes/{name}", status_code=204)
+async def delete_prefix(name: str):
+    """
+    Borrar un prefijo registrado y sus cached contents en Gemini
+    """
+    if not await genia_service.prefix_cache.unregister(name):
+        raise HTTPException(
+            status_code=404,
+            detail=ErrorResponse(
+                error="unknown_prefix",
+                message=f"Prefix '{name}' is not registered",
+                timestamp=time.time()
+            ).model_dump()
+        )
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Métricas en formato Prometheus (latencias HTTP y de Gemini, colas, tokens)"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/upstream/stats", response_model=dict)
+async def get_upstream_stats():
+    """
+    Obtener el estado de las llamadas a Google Gemini (admisión, reintentos, hedging, circuit breaker,
+    cuota, colas por tenant y deadlines)
+    """
+    return {
+        "success": True,
+        "data": {
+            **genia_service.get_upstream_stats(),
+            "admission": admission_controller.stats(),
+            "deadlines": deadline_tracker.stats()
+        },
+        "timestamp": time.time()
+    }
+
 @app.post("/query", response_model=QueryResponse)
 async def query_gemini(request: QueryRequest):
     """
@@ -210,7 +405,7 @@ async def query_gemini(request: QueryRequest):
     request_id = f"query_{int(start_time * 1000)}"  # ID único para tracking
 
     logger.info(f"🤖 [{request_id}] Processing Gemini query - Prompt: '{request.prompt[:50]}...'")
-    logger.debug(f"[{request_id}] Query parameters: max_tokens={request.max_tokens}, temperature={request.temperature}")
+    events.debug("query_parameters", request_id=request_id, max_tokens=request.max_tokens, temperature=request.temperature)
 
     try:
         response = await genia_service.query(request)
@@ -230,6 +425,39 @@ async def query_gemini(request: QueryRequest):
         logger.info(f"✅ [{request_id}] Gemini query successful - Tokens: {response.tokens_used}, Time: {processing_time:.3f}s")
         return response
 
+    except CircuitOpenError as e:
+        logger.warning(f"🔌 [{request_id}] Gemini query rejected: circuit open")
+        raise circuit_open_exception(e, request_id)
+
+    except RateLimitExceededError as e:
+        logger.warning(f"⏳ [{request_id}] Gemini query rejected: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail=ErrorResponse(
+                error="rate_limited",
+                message=str(e),
+                timestamp=time.time(),
+                details={"request_id": request_id, "retry_after": e.retry_after}
+            ).model_dump(),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+
+    except UnknownPrefixError as e:
+        logger.warning(f"🧩 [{request_id}] Gemini query rejected: {e}")
+        raise unknown_prefix_exception(e, request_id)
+
+    except DeadlineExceededError as e:
+        logger.warning(f"⌛ [{request_id}] Gemini query dropped: {e}")
+        raise HTTPException(
+            status_code=504,
+            detail=ErrorResponse(
+                error="deadline_exceeded",
+                message=str(e),
+                timestamp=time.time(),
+                details={"request_id": request_id, "processing_time": time.time() - start_time}
+            ).model_dump()
+        )
+
     except Exception as e:
         processing_time = time.time() - start_time
         logger.error(f"❌ [{request_id}] Gemini query failed: {str(e)} - Time: {processing_time:.3f}s")
@@ -245,6 +473,141 @@ async def query_gemini(request: QueryRequest):
             ).model_dump()
         )
 
+def circuit_open_exception(error: CircuitOpenError, request_id: str) -> HTTPException:
+    """503 con Retry-After para una llamada rechazada por el circuit breaker"""
+    return HTTPException(
+        status_code=503,
+        detail=ErrorResponse(
+            error="upstream_unavailable",
+            message=str(error),
+            timestamp=time.time(),
+            details={"request_id": request_id, "retry_after": error.retry_after}
+        ).model_dump(),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+def unknown_prefix_exception(error: UnknownPrefixError, request_id: str) -> HTTPException:
+    """400 para una consulta que referencia un prefijo no registrado"""
+    return HTTPException(
+        status_code=400,
+        detail=ErrorResponse(
+            error="unknown_prefix",
+            message=str(error),
+            timestamp=time.time(),
+            details={"request_id": request_id, "prefix": error.name}
+        ).model_dump()
+    )
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_query_events(request: QueryRequest, request_id: str) -> AsyncIterator[str]:
+    """Convertir los eventos del servicio en SSE; los errores se emiten como evento"""
+    try:
+        async for event in genia_service.query_stream(request):
+            yield format_sse(event["event"], event["data"])
+    except Exception as e:
+        logger.error(f"❌ [{request_id}] Gemini stream failed: {str(e)}")
+        yield format_sse("error", ErrorResponse(
+            error="stream_error",
+            message=str(e),
+            timestamp=time.time(),
+            details={"request_id": request_id}
+        ).model_dump())
+
+@app.post("/query/stream")
+async def query_gemini_stream(request: QueryRequest):
+    """
+    Procesa una consulta en streaming (Server-Sent Events)
+
+    Emite eventos "chunk" a medida que Gemini genera texto y un evento final
+    "done" con tokens_used, finish_reason y tiempos (incluido time-to-first-token).
+
+    Args:
+        request: Datos de la consulta con prompt, max_tokens, temperature
+
+    Returns:
+        StreamingResponse: Flujo text/event-stream
+    """
+    request_id = f"stream_{int(time.time() * 1000)}"
+    logger.info(f"🤖 [{request_id}] Processing Gemini stream - Prompt: '{request.prompt[:50]}...'")
+
+    if not genia_service.client:
+        raise HTTPException(
+            status_code=500,
+            detail=ErrorResponse(
+                error="query_error",
+                message="Google Gemini client not configured. Check your GENIA_API_KEY.",
+                timestamp=time.time(),
+                details={"request_id": request_id}
+            ).model_dump()
+        )
+
+    # Validar antes de abrir el stream: una vez enviado el 200 solo queda el evento "error"
+    try:
+        if request.prefix is not None:
+            genia_service.prefix_cache.get(request.prefix)
+        genia_service.check_circuit()
+    except UnknownPrefixError as e:
+        logger.warning(f"🧩 [{request_id}] Gemini stream rejected: {e}")
+        raise unknown_prefix_exception(e, request_id)
+    except CircuitOpenError as e:
+        raise circuit_open_exception(e, request_id)
+
+    return StreamingResponse(
+        _stream_query_events(request, request_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _stream_batch_results(batch: BatchQueryRequest) -> AsyncIterator[str]:
+    """Emitir cada resultado del lote como una línea NDJSON al terminar"""
+    async for result in genia_service.query_batch(batch.items, batch.concurrency):
+        yield result.model_dump_json() + "\n"
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_gemini_batch(batch: BatchQueryRequest, stream: bool = False):
+    """
+    Procesa un lote de consultas con concurrencia acotada
+
+    Las consultas idénticas se envían una sola vez a Gemini. Un error en una
+    consulta no hace fallar el lote: queda registrado en su resultado.
+
+    Args:
+        batch: Lista de consultas y concurrencia opcional
+        stream: Si es True, devuelve NDJSON con cada resultado al terminar
+
+    Returns:
+        BatchQueryResponse: Resultados en el orden del lote (o NDJSON)
+    """
+    start_time = time.time()
+    request_id = f"batch_{int(start_time * 1000)}"
+    logger.info(f"📦 [{request_id}] Processing batch - Items: {len(batch.items)}, Stream: {stream}")
+
+    if stream:
+        return StreamingResponse(_stream_batch_results(batch), media_type="application/x-ndjson")
+
+    results = [result async for result in genia_service.query_batch(batch.items, batch.concurrency)]
+    results.sort(key=lambda result: result.index)
+
+    processing_time = time.time() - start_time
+    succeeded = sum(1 for result in results if result.success)
+    log_performance(
+        f"gemini_batch_{request_id}",
+        processing_time,
+        {"items": len(results), "succeeded": succeeded}
+    )
+
+    return BatchQueryResponse(
+        results=results,
+        total=len(results),
+        unique=len({request_fingerprint(genia_service.model_name, item) for item in batch.items}),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        processing_time=processing_time
+    )
+
 @app.post("/query/mock", response_model=QueryResponse)
 async def query_mock(request: QueryRequest):
     """
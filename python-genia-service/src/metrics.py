@@ -0,0 +1,225 @@
+"""
+Métricas Prometheus del servicio (endpoint /metrics).
+
+- HTTP: latencia y peticiones por ruta, método y código, y peticiones en curso
+- Gemini: latencia por modelo y resultado, llamadas canceladas, llamadas en
+  curso y tokens de entrada/salida por modelo
+- Colas: espera hasta poder llamar a Gemini (huecos de concurrencia) y hasta
+  que un thread del pool empieza la llamada (backend "thread")
+- Estado de la capa de resiliencia leído en cada scrape (caché, circuito,
+  límite adaptativo y espera en la cola justa por tenant) y de la cola de logs
+
+La cardinalidad de las etiquetas está acotada: la ruta es la plantilla
+(/prefixes/{name}, no la URL concreta) o "unmatched"; los métodos fuera de la
+lista cuentan como OTHER; los modelos son los configurados; los tenants, los
+que la cola justa ya acota (MAX_TRACKED_TENANTS + "_other"). Los identificadores
+por petición (request_id, call_id) nunca son etiquetas.
+"""
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from fair_queue import WAIT_BUCKETS
+from logging_config import get_logger, queue_stats, sampling_stats
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+HTTP_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+UNMATCHED_ROUTE = "unmatched"
+
+# Límites superiores (segundos) de los buckets de latencia
+HTTP_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+UPSTREAM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+# Estados del circuit breaker como valor numérico
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Registro propio: /metrics publica solo las métricas del servicio
+registry = CollectorRegistry()
+
+http_requests_total = Counter(
+    "genia_http_requests_total", "Peticiones HTTP atendidas",
+    ("method", "route", "status"), registry=registry
+)
+http_request_duration = Histogram(
+    "genia_http_request_duration_seconds", "Latencia de las peticiones HTTP (hasta el último byte)",
+    ("method", "route", "status"), buckets=HTTP_LATENCY_BUCKETS, registry=registry
+)
+http_requests_in_flight = Gauge(
+    "genia_http_requests_in_flight", "Peticiones HTTP en curso", registry=registry
+)
+upstream_request_duration = Histogram(
+    "genia_upstream_request_duration_seconds", "Latencia de cada llamada a Gemini",
+    ("model", "outcome"), buckets=UPSTREAM_LATENCY_BUCKETS, registry=registry
+)
+upstream_requests_cancelled_total = Counter(
+    "genia_upstream_requests_cancelled_total",
+    "Llamadas a Gemini canceladas antes de responder (hedge perdedor o deadline)",
+    ("model",), registry=registry
+)
+upstream_requests_in_flight = Gauge(
+    "genia_upstream_requests_in_flight", "Llamadas a Gemini en curso", ("model",), registry=registry
+)
+upstream_tokens_total = Counter(
+    "genia_upstream_tokens_total", "Tokens enviados (input) y generados (output) por Gemini",
+    ("model", "direction"), registry=registry
+)
+queue_wait = Histogram(
+    "genia_queue_wait_seconds",
+    "Espera antes de llamar a Gemini: huecos de concurrencia (dispatch) o thread libre (thread_pool)",
+    ("stage",), buckets=WAIT_BUCKETS, registry=registry
+)
+
+dispatch_wait = queue_wait.labels("dispatch")
+thread_pool_wait = queue_wait.labels("thread_pool")
+
+
+def observe_upstream(model: str, duration: float, outcome: str) -> None:
+    """Registrar una llamada a Gemini (outcome: success, error o cancelled, que solo se cuenta)"""
+    if outcome == "cancelled":
+        upstream_requests_cancelled_total.labels(model).inc()
+        return
+    upstream_request_duration.labels(model, outcome).observe(duration)
+
+
+def record_tokens(model: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+    """Sumar los tokens de una consulta terminada"""
+    if input_tokens:
+        upstream_tokens_total.labels(model, "input").inc(input_tokens)
+    if output_tokens:
+        upstream_tokens_total.labels(model, "output").inc(output_tokens)
+
+
+def timed_in_thread(function: Callable, *args) -> Callable[[], Any]:
+    """
+    Envolver una llamada que se enviará al pool de threads para medir cuánto
+    espera en la cola del executor antes de empezar
+    """
+    submitted = time.perf_counter()
+
+    def run():
+        thread_pool_wait.observe(time.perf_counter() - submitted)
+        return function(*args)
+    return run
+
+
+class ServiceStatsCollector:
+    """
+    Colector que lee en cada scrape los contadores que el servicio ya mantiene
+    (no duplica estado ni añade trabajo por petición)
+    """
+
+    def __init__(self, service: Any):
+        self.service = service
+
+    def collect(self) -> Iterator:
+        service = self.service
+
+        if service.cache is not None:
+            cache = service.cache.stats()
+            family = CounterMetricFamily("genia_response_cache_events", "Eventos de la caché de respuestas", labels=("event",))
+            for event in ("hits", "stale_hits", "misses", "evictions", "expirations"):
+                if event in cache:
+                    family.add_metric((event,), cache[event])
+            yield family
+
+        circuit = service.get_circuit_state()
+        if circuit.get("enabled", True) and "state" in circuit:
+            yield GaugeMetricFamily(
+                "genia_circuit_state", "Estado del circuit breaker (0 cerrado, 1 semiabierto, 2 abierto)",
+                value=CIRCUIT_STATE_VALUES.get(circuit["state"], -1)
+            )
+
+        if service.concurrency_limiter is not None:
+            yield GaugeMetricFamily(
+                "genia_adaptive_concurrency_limit", "Límite de concurrencia adaptativo hacia Gemini",
+                value=service.concurrency_limiter.limit
+            )
+
+        if service.fair_scheduler is not None:
+            family = HistogramMetricFamily(
+                "genia_fair_queue_wait_seconds", "Espera en la cola justa por tenant", labels=("tenant",)
+            )
+            for tenant, stats in service.fair_scheduler.stats()["tenants"].items():
+                wait = stats["wait_seconds"]
+                family.add_metric((tenant,), list(wait["buckets"].items()), wait["sum"])
+            yield family
+
+        logs = queue_stats()
+        if logs["enabled"]:
+            yield GaugeMetricFamily("genia_log_queue_size", "Registros de log pendientes de escribir", value=logs["size"])
+            yield CounterMetricFamily(
+                "genia_log_records_dropped", "Registros de log descartados con la cola llena", value=logs["dropped"]
+            )
+
+        sampling = sampling_stats()
+        if sampling:
+            family = CounterMetricFamily(
+                "genia_log_records_sampled_out", "Registros de log suprimidos por muestreo", labels=("category",)
+            )
+            for category, stats in sampling.items():
+                family.add_metric((category,), stats["suppressed"])
+            yield family
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: latencia y código de cada petición HTTP, medidos hasta el
+    último byte (también en streaming), etiquetados con la plantilla de la ruta.
+    Con `recorder` la latencia también va a los histogramas en memoria de /stats;
+    con `prometheus=False` solo a esos histogramas (METRICS_ENABLED desactivado)
+    """
+
+    def __init__(
+        self,
+        app,
+        known_paths: Optional[Callable[[], Any]] = None,
+        recorder: Any = None,
+        prometheus: bool = True
+    ):
+        self.app = app
+        self._known_paths = known_paths
+        self._recorder = recorder
+        self._prometheus = prometheus
+        self._static_paths: Optional[frozenset] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        if self._prometheus:
+            http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "OTHER"
+            route = self._route(scope)
+            if self._prometheus:
+                http_requests_in_flight.dec()
+                labels = (method, route, str(status))
+                http_requests_total.labels(*labels).inc()
+                http_request_duration.labels(*labels).observe(duration)
+            if self._recorder is not None:
+                self._recorder.record(f"http {method} {route}", duration)
+
+    def _route(self, scope: Dict[str, Any]) -> str:
+        route = scope.get("route")
+        path = getattr(route, "path", None)
+        if path is not None:
+            return path
+        # Respuestas anteriores al enrutado (p. ej. descarte por admisión): solo rutas estáticas conocidas
+        if self._static_paths is None and self._known_paths is not None:
+            self._static_paths = frozenset(path for path in self._known_paths() if "{" not in path)
+        return scope["path"] if self._static_paths and scope["path"] in self._static_paths else UNMATCHED_ROUTE
@@ -0,0 +1,223 @@
+"""
+Enrutado de cada consulta entre modelos Gemini (flash / pro) con fallback.
+
+El modelo se elige por petición a partir de:
+
+- la pista de calidad opcional del cliente ("fast", "balanced", "high"),
+- el tamaño del prompt y los max_tokens pedidos (tareas largas → secundario),
+- la latencia (percentil) y la tasa de errores observadas por modelo: si el
+  modelo elegido incumple el SLO y el otro no, se usa el otro.
+
+Cada decisión lleva un fallback: si el intento con el modelo elegido falla o
+agota su timeout, el reintento va al otro modelo. Mientras un modelo está
+degradado recibe una fracción pequeña de sondeo para detectar su recuperación.
+La degradación se juzga sobre una ventana corta de llamadas recientes, para
+que unas pocas sondas basten para devolverle el tráfico; los percentiles que
+se publican usan una ventana más larga y se recalculan cada pocas muestras.
+"""
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Percentiles de latencia que se publican por modelo
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+class RouteDecision:
+    """Modelo elegido para una consulta, con el orden de fallback y el motivo"""
+
+    __slots__ = ("model", "fallback", "reason")
+
+    def __init__(self, model: str, fallback: Optional[str], reason: str):
+        self.model = model
+        self.fallback = fallback
+        self.reason = reason
+
+    def model_for_attempt(self, attempt: int) -> str:
+        """Modelo del intento `attempt` (1, 2, ...): el primero al elegido, los reintentos al fallback"""
+        if attempt <= 1 or self.fallback is None:
+            return self.model
+        return self.fallback
+
+
+class ModelHealth:
+    """Latencia y errores recientes de un modelo"""
+
+    def __init__(self, health_window: int = 20, window: int = 256, recompute_every: int = 16):
+        self.recompute_every = recompute_every
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._pending_samples = 0
+        self._percentiles: Dict[int, float] = {}
+
+        # Ventana corta para decidir si el modelo está degradado
+        self._recent_latencies: Deque[float] = deque(maxlen=health_window)
+        self._outcomes: Deque[bool] = deque(maxlen=health_window)
+        self._failures = 0
+        self.recent_p95: Optional[float] = None
+
+        self.calls = 0
+        self.failures_total = 0
+
+    def observe(self, latency: float, failed: bool) -> None:
+        self.calls += 1
+        self.failures_total += failed
+        self._latencies.append(latency)
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._failures -= self._outcomes[0]
+        self._outcomes.append(failed)
+        self._failures += failed
+        self._recent_latencies.append(latency)
+        recent = sorted(self._recent_latencies)
+        self.recent_p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+
+        self._pending_samples += 1
+        if self._pending_samples >= self.recompute_every:
+            self._recompute()
+
+    def _recompute(self) -> None:
+        ordered = sorted(self._latencies)
+        self._percentiles = {
+            pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+            for pct in LATENCY_PERCENTILES
+        }
+        self._pending_samples = 0
+
+    @property
+    def window_full(self) -> bool:
+        return len(self._outcomes) == self._outcomes.maxlen
+
+    @property
+    def error_rate(self) -> float:
+        return self._failures / len(self._outcomes) if self._outcomes else 0.0
+
+    def percentile(self, pct: int) -> Optional[float]:
+        if not self._percentiles and self._latencies:
+            self._recompute()
+        return self._percentiles.get(pct)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures_total,
+            "recent_error_rate": round(self.error_rate, 4),
+            "recent_latency_p95": self.recent_p95,
+            **{f"latency_p{pct}": self.percentile(pct) for pct in LATENCY_PERCENTILES}
+        }
+
+
+class ModelRouter:
+    """
+    Elige el modelo de cada consulta y su fallback
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        secondary: Optional[str] = None,
+        long_prompt_tokens: int = 0,
+        long_output_tokens: int = 0,
+        latency_slo: float = 10.0,
+        error_rate_threshold: float = 0.2,
+        health_window: int = 20,
+        probe_every: int = 10
+    ):
+        self.primary = primary
+        self.secondary = secondary if secondary and secondary != primary else None
+        self.long_prompt_tokens = long_prompt_tokens
+        self.long_output_tokens = long_output_tokens
+        self.latency_slo = latency_slo
+        self.error_rate_threshold = error_rate_threshold
+        self.probe_every = probe_every
+
+        self.health: Dict[str, ModelHealth] = {model: ModelHealth(health_window) for model in self.models}
+        self.decisions: Dict[str, Dict[str, int]] = {model: {} for model in self.models}
+        self.fallbacks: Dict[str, int] = {model: 0 for model in self.models}
+        self._diverted = 0
+
+    @property
+    def models(self) -> List[str]:
+        return [self.primary] + ([self.secondary] if self.secondary else [])
+
+    def route(self, prompt_tokens: int, max_tokens: int, quality: Optional[str] = None) -> RouteDecision:
+        """
+        Elegir el modelo de una consulta
+
+        Args:
+            prompt_tokens: Tokens estimados del prompt
+            max_tokens: max_tokens pedido
+            quality: Pista opcional del cliente ("fast", "balanced", "high")
+
+        Returns:
+            RouteDecision: Modelo, fallback y motivo
+        """
+        model, reason = self._preferred(prompt_tokens, max_tokens, quality)
+        other = self._other(model)
+
+        if other is not None and self.is_degraded(model) and not self.is_degraded(other):
+            # Cada `probe_every` desvíos, uno va al modelo degradado para ver si se recuperó
+            self._diverted += 1
+            if self._diverted % self.probe_every:
+                model, other, reason = other, model, "degraded"
+            else:
+                reason = "probe"
+
+        self.decisions[model][reason] = self.decisions[model].get(reason, 0) + 1
+        return RouteDecision(model, other, reason)
+
+    def _preferred(self, prompt_tokens: int, max_tokens: int, quality: Optional[str]) -> Tuple[str, str]:
+        if self.secondary is None:
+            return self.primary, "default"
+        if quality == "high":
+            return self.secondary, "quality_hint"
+        if quality == "fast":
+            return self.primary, "quality_hint"
+        if self.long_prompt_tokens and prompt_tokens >= self.long_prompt_tokens:
+            return self.secondary, "long_prompt"
+        if self.long_output_tokens and max_tokens >= self.long_output_tokens:
+            return self.secondary, "long_output"
+        return self.primary, "default"
+
+    def _other(self, model: str) -> Optional[str]:
+        if self.secondary is None:
+            return None
+        return self.secondary if model == self.primary else self.primary
+
+    def is_degraded(self, model: str) -> bool:
+        """Si el modelo incumple el SLO de latencia (p95) o de errores en las últimas llamadas"""
+        health = self.health[model]
+        if not health.window_full:
+            return False
+        return health.error_rate > self.error_rate_threshold or health.recent_p95 > self.latency_slo
+
+    def observe(self, model: str, latency: float, failed: bool) -> None:
+        """Registrar el resultado de una llamada a `model`"""
+        health = self.health.get(model)
+        if health is not None:
+            health.observe(latency, failed)
+
+    def record_fallback(self, model: str) -> None:
+        """Un reintento se envió a `model` como fallback"""
+        if model in self.fallbacks:
+            self.fallbacks[model] += 1
+        logger.info(f"🧭 Falling back to {model}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Decisiones por modelo y motivo, fallbacks y latencia/errores por modelo"""
+        return {
+            "primary": self.primary,
+            "secondary": self.secondary,
+            "latency_slo": self.latency_slo,
+            "error_rate_threshold": self.error_rate_threshold,
+            "models": {
+                model: {
+                    "degraded": self.is_degraded(model),
+                    "routed": dict(self.decisions[model]),
+                    "fallbacks": self.fallbacks[model],
+                    **self.health[model].stats()
+                }
+                for model in self.models
+            }
+        }
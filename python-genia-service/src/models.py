@@ -2,11 +2,22 @@
 Modelos de datos usando Pydantic v2 para validación y serialización.
 """
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from enum import Enum
 import time
 
 
+class QualityHint(str, Enum):
+    """Pista de calidad para el enrutado entre modelos"""
+    FAST = "fast"
+    BALANCED = "balanced"
+    HIGH = "high"
+
+
+# Nombres de prefijo: letras, dígitos, "_", "-" y "." (hasta 64)
+PREFIX_NAME_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+
+
 class QueryRequest(BaseModel):
     """Modelo para las consultas a Google Gemini API"""
 
@@ -40,6 +51,15 @@ class QueryRequest(BaseModel):
         le=100,
         description="Top-k sampling parameter"
     )
+    quality: Optional[QualityHint] = Field(
+        default=None,
+        description="Pista de calidad: fast (modelo primario), high (secundario) o balanced"
+    )
+    prefix: Optional[str] = Field(
+        default=None,
+        pattern=PREFIX_NAME_PATTERN,
+        description="Nombre de un prefijo registrado (POST /prefixes) que se usa como instrucción de sistema"
+    )
 
     model_config = ConfigDict(
         str_strip_whitespace=True,
@@ -72,6 +92,11 @@ class QueryResponse(BaseModel):
     model: str = Field(..., description="Modelo utilizado")
     processing_time: float = Field(..., ge=0.0, description="Tiempo de procesamiento en segundos")
     finish_reason: str = Field(default="stop", description="Razón de finalización")
+    prompt_tokens: Optional[int] = Field(default=None, ge=0, description="Tokens del prompt")
+    output_tokens: Optional[int] = Field(default=None, ge=0, description="Tokens generados")
+    total_tokens: Optional[int] = Field(default=None, ge=0, description="Tokens totales (prompt + salida)")
+    token_source: str = Field(default="estimated", description="Origen del conteo: usage_metadata o estimated")
+    cached: bool = Field(default=False, description="Si la respuesta se sirvió desde la caché")
     timestamp: float = Field(default_factory=time.time, description="Timestamp de la respuesta")
 
     @field_validator('tokens_used')
@@ -83,6 +108,80 @@ class QueryResponse(BaseModel):
         return v
 
 
+class PrefixRegisterRequest(BaseModel):
+    """Modelo para registrar un prefijo compartido"""
+
+    name: str = Field(..., pattern=PREFIX_NAME_PATTERN, description="Nombre con el que se referencia el prefijo")
+    content: str = Field(
+        ...,
+        min_length=1,
+        max_length=1_000_000,
+        description="Instrucción compartida que se cachea en Gemini"
+    )
+    ttl_seconds: Optional[int] = Field(
+        default=None,
+        ge=60,
+        le=604800,
+        description="TTL del cached content en Gemini (por defecto PREFIX_CACHE_TTL_SECONDS)"
+    )
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class PrefixInfo(BaseModel):
+    """Modelo con el estado de un prefijo registrado"""
+
+    name: str = Field(..., description="Nombre del prefijo")
+    digest: str = Field(..., description="SHA-256 del contenido")
+    size_bytes: int = Field(..., ge=0, description="Tamaño del contenido en bytes")
+    tokens: int = Field(..., ge=0, description="Tokens estimados del contenido")
+    ttl_seconds: float = Field(..., description="TTL de los cached contents")
+    created_at: float = Field(..., description="Timestamp del registro")
+    last_used: Optional[float] = Field(default=None, description="Timestamp del último uso")
+    uses: int = Field(default=0, ge=0, description="Consultas que lo han usado")
+    handles: int = Field(default=0, ge=0, description="Cached contents activos (uno por modelo y API key)")
+
+
+class BatchQueryRequest(BaseModel):
+    """Modelo para consultas en lote"""
+
+    items: List[QueryRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="Consultas a procesar"
+    )
+    concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=64,
+        description="Consultas simultáneas (limitado por BATCH_MAX_CONCURRENCY)"
+    )
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class BatchItemResult(BaseModel):
+    """Resultado de una consulta dentro de un lote"""
+
+    index: int = Field(..., ge=0, description="Posición de la consulta en el lote")
+    success: bool = Field(..., description="Si la consulta terminó sin error")
+    response: Optional[QueryResponse] = Field(default=None, description="Respuesta de Gemini")
+    error: Optional[str] = Field(default=None, description="Mensaje de error de esta consulta")
+
+
+class BatchQueryResponse(BaseModel):
+    """Modelo para las respuestas de consultas en lote"""
+
+    results: List[BatchItemResult] = Field(..., description="Resultados en el orden del lote")
+    total: int = Field(..., ge=0, description="Número de consultas recibidas")
+    unique: int = Field(..., ge=0, description="Consultas distintas enviadas a Gemini")
+    succeeded: int = Field(..., ge=0, description="Consultas exitosas")
+    failed: int = Field(..., ge=0, description="Consultas con error")
+    processing_time: float = Field(..., ge=0.0, description="Tiempo total del lote en segundos")
+    timestamp: float = Field(default_factory=time.time, description="Timestamp de la respuesta")
+
+
 class HealthResponse(BaseModel):
     """Modelo para respuestas de health check"""
 
@@ -0,0 +1,342 @@
+"""
+Registro de prefijos compartidos con caché de contexto de Gemini (cached content).
+
+Muchos prompts comparten una instrucción larga. El cliente la registra una vez
+con un nombre (POST /prefixes) y después la referencia en QueryRequest.prefix:
+el servicio crea en Gemini un cached content con ese prefijo como instrucción
+de sistema y en cada llamada envía solo el sufijo (el prompt) junto al handle.
+
+- Los handles se crean bajo demanda, uno por modelo y API key (un cached
+  content solo sirve para el modelo y el proyecto con que se creó); las
+  creaciones concurrentes del mismo handle se comparten (single-flight).
+- Antes de que caduque, el TTL del handle se renueva al usarlo; uno caducado
+  se vuelve a crear.
+- El registro guarda como mucho PREFIX_CACHE_MAX_ENTRIES prefijos; al superar
+  el límite se expulsa el menos usado recientemente (LRU) y se borran sus handles.
+- Si Gemini no puede cachear el prefijo (p. ej. por debajo del mínimo de
+  tokens del modelo) se envía completo como instrucción de sistema: la
+  respuesta es la misma, solo se pierde el ahorro.
+
+Los bytes de prompt enviados a Gemini y los que el caché evitó enviar quedan
+en las estadísticas.
+"""
+import asyncio
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from google.genai import types
+from singleflight import SingleFlight
+from tokens import count_tokens
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Tras un fallo al crear un handle, segundos durante los que el prefijo se envía completo
+CREATE_RETRY_SECONDS = 300.0
+
+
+class UnknownPrefixError(LookupError):
+    """La consulta referencia un prefijo que no está registrado"""
+
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Prefix '{name}' is not registered")
+
+
+class BaseCachedContentBackend(ABC):
+    """
+    Interfaz para crear, renovar y borrar cached contents. Se puede sustituir
+    (p. ej. por un backend falso en tests y benchmarks).
+    """
+
+    @abstractmethod
+    async def create(self, client: Any, model: str, content: str, ttl_seconds: float, display_name: str) -> str:
+        """Crear el cached content y devolver su nombre (handle)"""
+
+    @abstractmethod
+    async def refresh(self, client: Any, handle: str, ttl_seconds: float) -> None:
+        """Extender el TTL del cached content"""
+
+    @abstractmethod
+    async def delete(self, client: Any, handle: str) -> None:
+        """Borrar el cached content"""
+
+
+class GeminiCachedContentBackend(BaseCachedContentBackend):
+    """Cached contents de Gemini a través de client.aio.caches"""
+
+    async def create(self, client: Any, model: str, content: str, ttl_seconds: float, display_name: str) -> str:
+        cached = await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=content,
+                display_name=display_name,
+                ttl=f"{int(ttl_seconds)}s"
+            )
+        )
+        return cached.name
+
+    async def refresh(self, client: Any, handle: str, ttl_seconds: float) -> None:
+        await client.aio.caches.update(
+            name=handle,
+            config=types.UpdateCachedContentConfig(ttl=f"{int(ttl_seconds)}s")
+        )
+
+    async def delete(self, client: Any, handle: str) -> None:
+        await client.aio.caches.delete(name=handle)
+
+
+class CachedHandle:
+    """Cached content de un prefijo para un modelo y una API key"""
+
+    __slots__ = ("name", "client", "expires_at")
+
+    def __init__(self, name: str, client: Any, expires_at: float):
+        self.name = name
+        self.client = client
+        self.expires_at = expires_at
+
+
+class PrefixEntry:
+    """Prefijo registrado y sus handles en Gemini"""
+
+    def __init__(self, name: str, content: str, ttl_seconds: float):
+        self.name = name
+        self.content = content
+        self.ttl_seconds = ttl_seconds
+        self.digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self.size_bytes = len(content.encode("utf-8"))
+        self.tokens = count_tokens(content)
+        self.created_at = time.time()
+        self.last_used: Optional[float] = None
+        self.uses = 0
+        self.handles: Dict[Tuple[str, str], CachedHandle] = {}
+        # (modelo, key) → instante hasta el que no se reintenta crear el handle
+        self.inline_until: Dict[Tuple[str, str], float] = {}
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "digest": self.digest,
+            "size_bytes": self.size_bytes,
+            "tokens": self.tokens,
+            "ttl_seconds": self.ttl_seconds,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "uses": self.uses,
+            "handles": len(self.handles)
+        }
+
+
+class PrefixBinding:
+    """Cómo se envía el prefijo en una llamada: handle cacheado o instrucción completa"""
+
+    __slots__ = ("cached_content", "system_instruction")
+
+    def __init__(self, cached_content: Optional[str] = None, system_instruction: Optional[str] = None):
+        self.cached_content = cached_content
+        self.system_instruction = system_instruction
+
+    def apply(self, generation_config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Configuración de generación con el prefijo"""
+        if self.cached_content is not None:
+            return {**(generation_config or {}), "cached_content": self.cached_content}
+        return {**(generation_config or {}), "system_instruction": self.system_instruction}
+
+
+class PrefixCacheRegistry:
+    """
+    Prefijos registrados por nombre, con sus cached contents en Gemini
+    """
+
+    def __init__(
+        self,
+        backend: BaseCachedContentBackend,
+        max_entries: int = 32,
+        ttl_seconds: float = 3600.0,
+        refresh_margin: float = 300.0,
+        min_tokens: int = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self._clock = clock
+        self._entries: "OrderedDict[str, PrefixEntry]" = OrderedDict()
+        self._flights = SingleFlight()
+        self._cleanups: set = set()
+
+        self.cached_calls = 0
+        self.creates = 0
+        self.refreshes = 0
+        self.inline = 0
+        self.evictions = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def register(self, name: str, content: str, ttl_seconds: Optional[float] = None) -> PrefixEntry:
+        """
+        Registrar (o reemplazar) un prefijo; expulsa el menos usado si se supera el máximo
+        """
+        previous = self._entries.pop(name, None)
+        if previous is not None:
+            await self._delete_handles(previous)
+
+        entry = PrefixEntry(name, content, ttl_seconds or self.ttl_seconds)
+        self._entries[name] = entry
+        logger.info(f"🧩 Registered prefix '{name}' ({entry.size_bytes} bytes, ~{entry.tokens} tokens)")
+
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"🧩 Evicting least recently used prefix '{evicted.name}'")
+            await self._delete_handles(evicted)
+        return entry
+
+    async def unregister(self, name: str) -> bool:
+        """Borrar un prefijo y sus handles (False si no existía)"""
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return False
+        await self._delete_handles(entry)
+        return True
+
+    def get(self, name: str) -> PrefixEntry:
+        """
+        Prefijo registrado con ese nombre
+
+        Raises:
+            UnknownPrefixError: No hay un prefijo con ese nombre
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            raise UnknownPrefixError(name)
+        return entry
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Prefijos registrados, del menos al más usado recientemente"""
+        return [entry.info() for entry in self._entries.values()]
+
+    async def bind(self, name: str, model: str, client: Any, key_id: str = "") -> PrefixBinding:
+        """
+        Cómo enviar el prefijo `name` a `model` con `client`: handle cacheado si es
+        posible, si no la instrucción completa
+
+        Raises:
+            UnknownPrefixError: No hay un prefijo con ese nombre
+        """
+        entry = self.get(name)
+        self._entries.move_to_end(name)
+        entry.uses += 1
+        entry.last_used = time.time()
+
+        key = (model, key_id)
+        now = self._clock()
+        if entry.tokens < self.min_tokens or entry.inline_until.get(key, 0.0) > now:
+            return self._inline(entry)
+
+        handle = entry.handles.get(key)
+        if handle is not None and handle.expires_at <= now:
+            entry.handles.pop(key, None)
+            handle = None
+
+        try:
+            if handle is None:
+                flight = f"create|{entry.digest}|{model}|{key_id}"
+                handle = await self._flights.do(flight, lambda: self._create(entry, key, client))
+            elif handle.expires_at - now < self.refresh_margin:
+                flight = f"refresh|{handle.name}"
+                await self._flights.do(flight, lambda: self._refresh(entry, handle))
+        except Exception as e:
+            self.errors += 1
+            entry.inline_until[key] = now + CREATE_RETRY_SECONDS
+            logger.warning(f"⚠️  Could not cache prefix '{entry.name}' for {model}, sending it inline: {e}")
+            return self._inline(entry)
+
+        self.cached_calls += 1
+        self.bytes_saved += entry.size_bytes
+        return PrefixBinding(cached_content=handle.name)
+
+    def record_sent(self, prompt: str, binding: Optional[PrefixBinding] = None) -> None:
+        """Contabilizar los bytes de prompt (y de prefijo enviado completo) de una llamada"""
+        sent = len(prompt.encode("utf-8"))
+        if binding is not None and binding.system_instruction is not None:
+            sent += len(binding.system_instruction.encode("utf-8"))
+        self.bytes_sent += sent
+
+    def _inline(self, entry: PrefixEntry) -> PrefixBinding:
+        self.inline += 1
+        return PrefixBinding(system_instruction=entry.content)
+
+    async def _create(self, entry: PrefixEntry, key: Tuple[str, str], client: Any) -> CachedHandle:
+        model, key_id = key
+        creating = asyncio.ensure_future(
+            self.backend.create(client, model, entry.content, entry.ttl_seconds, f"prefix-{entry.name}")
+        )
+        try:
+            # shield: cancelar la espera no cancela la creación que Gemini ya puede estar haciendo
+            name = await asyncio.shield(creating)
+        except asyncio.CancelledError:
+            creating.add_done_callback(lambda task: self._discard_orphan(task, client))
+            raise
+        handle = CachedHandle(name, client, self._clock() + entry.ttl_seconds)
+        self.creates += 1
+        logger.info(f"🧩 Cached prefix '{entry.name}' for {model} {key_id}: {name}")
+        # El prefijo pudo reemplazarse o expulsarse mientras se creaba
+        if self._entries.get(entry.name) is entry:
+            entry.handles[key] = handle
+        else:
+            await self._delete_handle(handle)
+        return handle
+
+    def _discard_orphan(self, creating: asyncio.Future, client: Any) -> None:
+        """Borrar un cached content que terminó de crearse cuando ya nadie lo esperaba"""
+        if creating.cancelled() or creating.exception() is not None:
+            return
+        cleanup = asyncio.ensure_future(self._delete_handle(CachedHandle(creating.result(), client, 0.0)))
+        self._cleanups.add(cleanup)
+        cleanup.add_done_callback(self._cleanups.discard)
+
+    async def _refresh(self, entry: PrefixEntry, handle: CachedHandle) -> None:
+        await self.backend.refresh(handle.client, handle.name, entry.ttl_seconds)
+        handle.expires_at = self._clock() + entry.ttl_seconds
+        self.refreshes += 1
+        logger.debug(f"Refreshed TTL of cached prefix '{entry.name}' ({handle.name})")
+
+    async def _delete_handles(self, entry: PrefixEntry) -> None:
+        handles, entry.handles = list(entry.handles.values()), {}
+        for handle in handles:
+            await self._delete_handle(handle)
+
+    async def _delete_handle(self, handle: CachedHandle) -> None:
+        # Si el borrado falla, el cached content caduca solo al acabar su TTL
+        try:
+            await self.backend.delete(handle.client, handle.name)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️  Could not delete cached content {handle.name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Prefijos, handles, reutilización y bytes enviados/ahorrados"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "handles": sum(len(entry.handles) for entry in self._entries.values()),
+            "cached_calls": self.cached_calls,
+            "creates": self.creates,
+            "refreshes": self.refreshes,
+            "inline": self.inline,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_saved
+        }
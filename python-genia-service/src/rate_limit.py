@@ -0,0 +1,261 @@
+"""
+Limitador de cuota RPM/TPM para las llamadas a Google Gemini.
+
+Dos token buckets (peticiones por minuto y tokens por minuto) delante de cada
+llamada. El coste en tokens se estima como tokens del prompt + max_tokens y la
+parte no usada se devuelve al terminar. Si no hay cuota, la llamada espera en
+una cola async acotada (FIFO) hasta un tiempo máximo, en lugar de fallar.
+
+El estado de los buckets puede vivir en memoria (un proceso) o en un archivo
+con bloqueo `fcntl`, compartido por los workers locales (p. ej. uvicorn --workers).
+Las operaciones sobre el archivo bloquean (flock), así que se ejecutan en un
+thread y no en el event loop.
+"""
+import asyncio
+import os
+import struct
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Estado serializado en el archivo compartido: tokens RPM, tokens TPM, instante de actualización
+_STATE_FORMAT = struct.Struct("<ddd")
+
+
+class RateLimitExceededError(Exception):
+    """No hubo cuota dentro del tiempo máximo de espera, o la cola está llena"""
+
+    def __init__(self, message: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class TokenBuckets:
+    """
+    Aritmética de los buckets RPM y TPM (un límite 0 significa sin límite)
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+
+    def full(self) -> Tuple[float, float]:
+        return float(self.rpm), float(self.tpm)
+
+    def take(self, state: Tuple[float, float, float], now: float, tokens: int) -> Tuple[Tuple[float, float, float], float]:
+        """
+        Rellenar según el tiempo transcurrido e intentar consumir 1 petición y `tokens`
+
+        Returns:
+            (nuevo estado, espera): espera 0 si se consumió la cuota; si no, los
+            segundos hasta que haya suficiente (el estado solo se rellena)
+        """
+        request_level, token_level, updated = state
+        elapsed = max(0.0, now - updated)
+        request_level = min(self.rpm, request_level + elapsed * self.rpm / 60)
+        token_level = min(self.tpm, token_level + elapsed * self.tpm / 60)
+        tokens = min(tokens, self.tpm)
+
+        wait = 0.0
+        if self.rpm and request_level < 1:
+            wait = max(wait, (1 - request_level) * 60 / self.rpm)
+        if self.tpm and token_level < tokens:
+            wait = max(wait, (tokens - token_level) * 60 / self.tpm)
+        if wait == 0.0:
+            request_level -= 1 if self.rpm else 0
+            token_level -= tokens if self.tpm else 0
+        return (request_level, token_level, now), wait
+
+    def refund(self, state: Tuple[float, float, float], tokens: int) -> Tuple[float, float, float]:
+        """Devolver `tokens` al bucket TPM (negativo: cargar tokens usados de más)"""
+        request_level, token_level, updated = state
+        return request_level, min(self.tpm, token_level + tokens), updated
+
+
+class MemoryBucketStore:
+    """Estado de los buckets en memoria del proceso"""
+
+    blocking = False
+
+    def __init__(self, buckets: TokenBuckets, clock: Callable[[], float] = time.monotonic):
+        self.buckets = buckets
+        self._clock = clock
+        self._state = (*buckets.full(), clock())
+
+    def take(self, tokens: int) -> float:
+        self._state, wait = self.buckets.take(self._state, self._clock(), tokens)
+        return wait
+
+    def refund(self, tokens: int) -> None:
+        self._state = self.buckets.refund(self._state, tokens)
+
+    def levels(self) -> Tuple[float, float]:
+        return self._state[0], self._state[1]
+
+    def snapshot(self) -> Tuple[float, float]:
+        return self.levels()
+
+
+class FileBucketStore:
+    """
+    Estado de los buckets en un archivo compartido entre procesos locales.
+    Cada operación toma un `flock` exclusivo, lee 24 bytes y los reescribe.
+    `snapshot()` no toma el lock: devuelve los niveles vistos en la última operación.
+    """
+
+    blocking = True
+
+    def __init__(self, buckets: TokenBuckets, path: str):
+        import fcntl  # Solo POSIX
+
+        self.buckets = buckets
+        self.path = path
+        self._fcntl = fcntl
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._seen = buckets.full()
+
+    def _update(self, change):
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        try:
+            raw = os.pread(self._fd, _STATE_FORMAT.size, 0)
+            now = time.time()
+            state = _STATE_FORMAT.unpack(raw) if len(raw) == _STATE_FORMAT.size else (*self.buckets.full(), now)
+            state, result = change(state, now)
+            os.pwrite(self._fd, _STATE_FORMAT.pack(*state), 0)
+            self._seen = state[0], state[1]
+            return result
+        finally:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def take(self, tokens: int) -> float:
+        return self._update(lambda state, now: self.buckets.take(state, now, tokens))
+
+    def refund(self, tokens: int) -> None:
+        self._update(lambda state, now: (self.buckets.refund(state, tokens), None))
+
+    def levels(self) -> Tuple[float, float]:
+        state = self._update(lambda state, now: (state, state))
+        return state[0], state[1]
+
+    def snapshot(self) -> Tuple[float, float]:
+        return self._seen
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class UpstreamRateLimiter:
+    """
+    Admisión de llamadas a Gemini según la cuota RPM/TPM, con cola FIFO acotada
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_queue: int = 1000,
+        max_wait: float = 10.0,
+        state_file: Optional[str] = None
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        buckets = TokenBuckets(rpm, tpm)
+        self.store = FileBucketStore(buckets, state_file) if state_file else MemoryBucketStore(buckets)
+        self._turn = asyncio.Lock()
+        self._waiting = 0
+
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Esperar cuota para una llamada de `tokens` tokens estimados
+
+        Raises:
+            RateLimitExceededError: Cola llena o la cuota no llegaría a tiempo
+        """
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceededError("Gemini rate limit queue is full", retry_after=self.max_wait)
+
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._admit(tokens, start + self.max_wait), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RateLimitExceededError(
+                f"No Gemini quota available within {self.max_wait:.1f}s", retry_after=self.max_wait
+            )
+        except RateLimitExceededError:
+            self.rejected += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        if waited > 0.001:
+            self.delayed += 1
+
+    async def _admit(self, tokens: int, deadline: float) -> None:
+        # asyncio.Lock despierta a los interesados en orden de llegada: cola FIFO
+        async with self._turn:
+            while True:
+                wait = await self._in_store(self.store.take, tokens)
+                if wait == 0.0:
+                    return
+                if time.monotonic() + wait > deadline:
+                    raise RateLimitExceededError(
+                        f"Gemini quota available in {wait:.1f}s, beyond the {self.max_wait:.1f}s wait limit",
+                        retry_after=wait
+                    )
+                await asyncio.sleep(wait)
+
+    def refund(self, tokens: int) -> None:
+        """
+        Ajustar la cuota TPM a lo realmente usado: positivo devuelve tokens
+        reservados de más; negativo carga los que la respuesta usó por encima
+        de la reserva
+        """
+        if not tokens or not self.tpm:
+            return
+        if self.store.blocking:
+            # No hace falta esperar al ajuste: se encola en un thread
+            asyncio.get_running_loop().run_in_executor(None, self.store.refund, tokens)
+        else:
+            self.store.refund(tokens)
+
+    async def _in_store(self, operation: Callable[..., Any], *args) -> Any:
+        """Operación sobre el estado; las que bloquean (archivo con flock) van a un thread"""
+        if not self.store.blocking:
+            return operation(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, operation, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cuota disponible y contadores de admisión. Se llama desde el event loop:
+        con estado en archivo usa la última lectura en vez de tomar el flock
+        """
+        request_level, token_level = self.store.snapshot()
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "shared_state": isinstance(self.store, FileBucketStore),
+            "available_requests": round(request_level, 2) if self.rpm else None,
+            "available_tokens": round(token_level, 2) if self.tpm else None,
+            "waiting": self._waiting,
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0
+        }
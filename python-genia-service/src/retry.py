@@ -0,0 +1,182 @@
+"""
+Reintentos con deadline para las llamadas a Google Gemini.
+
+Cada intento tiene su propio timeout y todos comparten un deadline global. Los
+errores transitorios (429, 5xx, timeouts, fallos de red) se reintentan con
+backoff exponencial y jitter completo, respetando Retry-After cuando Gemini lo
+indica. Nunca se espera ni se reintenta más allá del presupuesto restante.
+"""
+import asyncio
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from google.genai import errors as genai_errors
+import httpx
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Códigos HTTP que indican un fallo transitorio
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class UpstreamTimeoutError(Exception):
+    """Un intento contra Gemini superó su timeout"""
+
+
+class DeadlineExceededError(Exception):
+    """No queda presupuesto de tiempo para (re)intentar la llamada"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Clasificar un error como transitorio (reintentable) o definitivo
+    """
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (UpstreamTimeoutError, asyncio.TimeoutError, ConnectionError, httpx.TransportError))
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    Obtener la espera sugerida por Gemini: cabecera Retry-After o RetryInfo.retryDelay
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("retry-after")
+            if value is not None:
+                return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+
+    # Cuerpo de error de Google: {"error": {"details": [{"retryDelay": "20s", ...}]}}
+    details = getattr(error, "details", None)
+    body = details.get("error", details) if isinstance(details, dict) else {}
+    items = body.get("details") if isinstance(body, dict) else None
+    for item in items if isinstance(items, list) else []:
+        delay = item.get("retryDelay") if isinstance(item, dict) else None
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)s", delay) if isinstance(delay, str) else None
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class RetryPolicy:
+    """
+    Política de reintentos con timeout por intento, deadline global y backoff
+    exponencial con jitter completo. Registra el número de intentos por llamada.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        attempt_timeout: float = 15.0,
+        total_timeout: float = 30.0,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0
+    ):
+        self.max_retries = max_retries
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.calls = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.deadline_exceeded = 0
+        self.attempts_histogram: Dict[int, int] = {}
+
+    def backoff(self, retry_number: int, error: BaseException) -> float:
+        """Espera antes del reintento `retry_number` (1, 2, ...)"""
+        suggested = retry_after_seconds(error)
+        if suggested is not None:
+            return suggested
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (retry_number - 1)))
+        return random.uniform(0, ceiling)
+
+    async def run(
+        self,
+        operation: Callable[[], Awaitable[Any]],
+        deadline: Optional[float] = None,
+        call_id: str = "",
+        operation_timed: bool = False
+    ) -> Any:
+        """
+        Ejecutar `operation()` con reintentos
+
+        Args:
+            operation: Función que crea la corrutina de un intento
+            deadline: Instante límite (time.monotonic) del llamante; nunca más allá de ahora + total_timeout
+            call_id: Identificador para los logs
+            operation_timed: `operation` aplica attempt_timeout desde que la llamada sale
+                (y lanza UpstreamTimeoutError); aquí el intento solo se corta por el deadline,
+                así que la espera en cola no consume el timeout del intento
+
+        Returns:
+            Any: Resultado del primer intento exitoso
+
+        Raises:
+            Exception: El último error si no es reintentable o se agotó el presupuesto
+        """
+        budget = time.monotonic() + self.total_timeout
+        deadline = budget if deadline is None else min(deadline, budget)
+
+        self.calls += 1
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.deadline_exceeded += 1
+                    raise DeadlineExceededError(f"Deadline exceeded before attempt {attempt}")
+
+                timeout = remaining if operation_timed else min(self.attempt_timeout, remaining)
+                try:
+                    return await asyncio.wait_for(operation(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    if operation_timed or timeout < self.attempt_timeout:
+                        # El intento lo cortó el deadline, no su propio timeout: no queda presupuesto
+                        self.deadline_exceeded += 1
+                        raise DeadlineExceededError(f"Deadline exceeded during attempt {attempt}")
+                    error: Exception = UpstreamTimeoutError(f"Attempt {attempt} timed out after {timeout:.2f}s")
+                except Exception as e:
+                    error = e
+
+                if not is_retryable(error):
+                    raise error
+                if attempt > self.max_retries:
+                    self.exhausted += 1
+                    raise error
+
+                delay = self.backoff(attempt, error)
+                if time.monotonic() + delay >= deadline:
+                    self.deadline_exceeded += 1
+                    raise error
+
+                self.retries += 1
+                logger.warning(
+                    f"🔁 [{call_id}] Retrying Gemini call after {type(error).__name__} "
+                    f"(attempt {attempt}/{self.max_retries + 1}, backoff {delay:.2f}s)"
+                )
+                await asyncio.sleep(delay)
+        finally:
+            self.attempts_histogram[attempt] = self.attempts_histogram.get(attempt, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de intentos y reintentos"""
+        return {
+            "max_retries": self.max_retries,
+            "attempt_timeout": self.attempt_timeout,
+            "total_timeout": self.total_timeout,
+            "calls": self.calls,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+            "deadline_exceeded": self.deadline_exceeded,
+            "attempts_histogram": dict(sorted(self.attempts_histogram.items()))
+        }
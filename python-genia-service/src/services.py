@@ -4,14 +4,43 @@ Implementación siguiendo la documentación oficial de Google.
 """
 import time
 import asyncio
-from typing import Optional, Dict, Any
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
 from config import settings
-from models import QueryRequest, QueryResponse
-from logging_config import get_logger, log_api_call, log_performance
+from models import QueryRequest, QueryResponse, BatchItemResult
+from logging_config import Lazy, get_event_logger, get_logger, log_api_call, log_performance
+from cache import BaseResponseCache, ResponseCache, request_fingerprint
+from singleflight import SingleFlight
+from tokens import count_tokens, token_counter
+from retry import DeadlineExceededError, RetryPolicy, UpstreamTimeoutError, is_retryable
+from hedging import HedgePolicy
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from rate_limit import UpstreamRateLimiter, RateLimitExceededError
+from concurrency_limit import AdaptiveConcurrencyLimiter, create_limit_algorithm
+from fair_queue import FairScheduler, current_tenant, parse_weights
+from deadline import ensure_budget, remaining_budget, request_deadline
+from model_router import ModelRouter, RouteDecision
+from client_pool import ClientPool, PooledClient, parse_api_keys
+from health import UpstreamHealthMonitor
+from prefix_cache import GeminiCachedContentBackend, PrefixCacheRegistry
+import metrics
+from latency import latency_recorder
 from google import genai
+from google.genai import types
 
 # Obtener logger específico para este módulo
 logger = get_logger(__name__)
+events = get_event_logger(__name__)
+
+# El health check solo necesita saber que Gemini responde: pocos tokens, pero no
+# tan pocos que la respuesta llegue vacía por MAX_TOKENS
+HEALTH_CHECK_PROMPT = "Hello, respond with just 'OK'"
+HEALTH_CHECK_GENERATION_CONFIG = {"max_output_tokens": 16, "temperature": 0.0}
+
+# Marca de fin del stream producido por el backend "thread"
+_STREAM_END = object()
 
 
 class GeniaAPIService:
@@ -25,25 +54,189 @@ class GeniaAPIService:
         self.api_key = settings.GENIA_API_KEY
         self.timeout = settings.API_TIMEOUT
         self.max_retries = settings.MAX_RETRIES
-        self.model_name = "gemini-1.5-flash"
+        self.model_name = settings.GEMINI_PRIMARY_MODEL
+
+        # Enrutado por petición entre el modelo primario y el secundario, con fallback
+        self.router = ModelRouter(
+            primary=self.model_name,
+            secondary=settings.GEMINI_SECONDARY_MODEL or None,
+            long_prompt_tokens=settings.ROUTER_LONG_PROMPT_TOKENS,
+            long_output_tokens=settings.ROUTER_LONG_OUTPUT_TOKENS,
+            latency_slo=settings.ROUTER_LATENCY_SLO,
+            error_rate_threshold=settings.ROUTER_ERROR_RATE,
+            health_window=settings.ROUTER_HEALTH_WINDOW
+        )
+
+        # Backend de llamadas: "async" usa client.aio; "thread" usa un pool propio
+        self.backend = settings.GENIA_CLIENT_BACKEND.lower()
+        self.max_concurrency = settings.MAX_CONCURRENT_REQUESTS
+        self._concurrency = asyncio.Semaphore(self.max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Límite adaptativo (AIMD / gradiente) por debajo del tope fijo
+        self.concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None
+        if settings.ADAPTIVE_CONCURRENCY_ENABLED:
+            self.concurrency_limiter = AdaptiveConcurrencyLimiter(create_limit_algorithm(
+                settings.ADAPTIVE_CONCURRENCY_ALGORITHM.lower(),
+                initial=min(settings.ADAPTIVE_CONCURRENCY_INITIAL, self.max_concurrency),
+                min_limit=settings.ADAPTIVE_CONCURRENCY_MIN,
+                max_limit=self.max_concurrency,
+                rtt_threshold=settings.ADAPTIVE_CONCURRENCY_RTT_THRESHOLD
+            ))
+
+        # Cola justa entre tenants: los huecos libres se reparten por peso (DRR)
+        self.fair_scheduler: Optional[FairScheduler] = None
+        if settings.FAIR_QUEUE_ENABLED:
+            self.fair_scheduler = FairScheduler(
+                capacity=self.dispatch_capacity,
+                weights=parse_weights(settings.FAIR_QUEUE_WEIGHTS),
+                default_weight=settings.FAIR_QUEUE_DEFAULT_WEIGHT,
+                max_queue_per_tenant=settings.FAIR_QUEUE_MAX_PER_TENANT,
+                default_timeout=self.timeout
+            )
+
+        # Reintentos con timeout por intento y deadline global (API_TIMEOUT)
+        self.retry_policy = RetryPolicy(
+            max_retries=self.max_retries,
+            attempt_timeout=settings.ATTEMPT_TIMEOUT,
+            total_timeout=self.timeout,
+            base_delay=settings.RETRY_BASE_DELAY,
+            max_delay=settings.RETRY_MAX_DELAY
+        )
+
+        # Hedging opcional dentro de cada intento (recorta la latencia de cola)
+        self.hedge_policy: Optional[HedgePolicy] = None
+        if settings.HEDGE_ENABLED:
+            self.hedge_policy = HedgePolicy(
+                percentile=settings.HEDGE_PERCENTILE,
+                budget_percent=settings.HEDGE_BUDGET_PERCENT,
+                min_delay=settings.HEDGE_MIN_DELAY,
+                min_samples=settings.HEDGE_MIN_SAMPLES
+            )
+
+        # Circuit breaker: rechazo inmediato mientras Gemini está caído
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        if settings.CIRCUIT_BREAKER_ENABLED:
+            self.circuit_breaker = CircuitBreaker(
+                failure_rate_threshold=settings.CIRCUIT_FAILURE_RATE,
+                slow_call_seconds=settings.CIRCUIT_SLOW_CALL_SECONDS,
+                slow_call_rate_threshold=settings.CIRCUIT_SLOW_CALL_RATE,
+                window_seconds=settings.CIRCUIT_WINDOW_SECONDS,
+                min_calls=settings.CIRCUIT_MIN_CALLS,
+                open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+                half_open_max_calls=settings.CIRCUIT_HALF_OPEN_CALLS
+            )
+
+        # Cuota RPM/TPM: las llamadas esperan en una cola acotada en vez de recibir 429
+        self.rate_limiter: Optional[UpstreamRateLimiter] = None
+        if settings.RATE_LIMIT_RPM or settings.RATE_LIMIT_TPM:
+            self.rate_limiter = UpstreamRateLimiter(
+                rpm=settings.RATE_LIMIT_RPM,
+                tpm=settings.RATE_LIMIT_TPM,
+                max_queue=settings.RATE_LIMIT_MAX_QUEUE,
+                max_wait=settings.RATE_LIMIT_MAX_WAIT,
+                state_file=settings.RATE_LIMIT_STATE_FILE or None
+            )
 
         logger.info(f"🔧 Initializing GeniaAPIService with model: {self.model_name}")
-        logger.debug(f"Service configuration: timeout={self.timeout}s, max_retries={self.max_retries}")
+        logger.debug(
+            f"Service configuration: timeout={self.timeout}s, max_retries={self.max_retries}, "
+            f"backend={self.backend}, max_concurrency={self.max_concurrency}"
+        )
+
+        # Configurar los clientes oficiales de Google Gemini: uno por API key
+        self._configured_pool = self._build_client_pool(
+            parse_api_keys(self.api_key, settings.GENIA_API_KEYS)
+        )
+        self.client_pool = self._configured_pool
+        if not self.client_pool:
+            logger.warning("⚠️  No GENIA_API_KEY provided. Service will work in mock mode only.")
+
+        # Caché de respuestas (intercambiable asignando otra BaseResponseCache)
+        self.cache: Optional[BaseResponseCache] = None
+        if settings.CACHE_ENABLED:
+            self.cache = ResponseCache(
+                max_entries=settings.CACHE_MAX_ENTRIES,
+                max_bytes=settings.CACHE_MAX_BYTES,
+                ttl_seconds=settings.CACHE_TTL_SECONDS,
+                stale_ttl_seconds=settings.CACHE_STALE_TTL_SECONDS
+            )
+            logger.debug(
+                f"Response cache enabled: max_entries={settings.CACHE_MAX_ENTRIES}, "
+                f"ttl={settings.CACHE_TTL_SECONDS}s, deterministic_only={settings.CACHE_DETERMINISTIC_ONLY}"
+            )
+
+        # Peticiones idénticas concurrentes comparten una sola llamada a Gemini
+        self.single_flight: Optional[SingleFlight] = SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None
+
+        # Prefijos compartidos: se cachean en Gemini y cada llamada envía solo el sufijo
+        self.prefix_cache = PrefixCacheRegistry(
+            GeminiCachedContentBackend(),
+            max_entries=settings.PREFIX_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.PREFIX_CACHE_TTL_SECONDS,
+            refresh_margin=settings.PREFIX_CACHE_REFRESH_MARGIN,
+            min_tokens=settings.PREFIX_CACHE_MIN_TOKENS
+        )
+
+        # Salud de Gemini en memoria; la sonda se resuelve en cada llamada (se puede sustituir)
+        self.health_monitor = UpstreamHealthMonitor(
+            probe=lambda: self._timed_health_check(),
+            interval=settings.HEALTH_CHECK_INTERVAL,
+            jitter=settings.HEALTH_CHECK_JITTER,
+            failure_threshold=settings.HEALTH_FAILURE_THRESHOLD,
+            probe_timeout=settings.ATTEMPT_TIMEOUT
+        )
+
+
+    @property
+    def client(self):
+        """Cliente de la primera key del pool (None si no hay ninguna configurada)"""
+        return self.client_pool.primary
+
+    @client.setter
+    def client(self, client) -> None:
+        # Asignar un cliente concreto lo deja como único cliente del pool
+        self.client_pool = self._new_pool([PooledClient("key-1", client)] if client is not None else [])
+
+    @client.deleter
+    def client(self) -> None:
+        # Volver al pool construido con las keys configuradas
+        self.client_pool = self._configured_pool
 
-        # Configurar el cliente oficial de Google Gemini
-        if self.api_key:
+
+    def _build_client_pool(self, api_keys: List[Tuple[str, float]]) -> ClientPool:
+        """
+        Crear un cliente de Gemini por API key; las keys que fallan se omiten
+        """
+        clients = []
+        for index, (api_key, weight) in enumerate(api_keys, start=1):
             try:
-                logger.debug("Setting up Google Gemini client...")
-                self.client = genai.Client(api_key=self.api_key)
-                logger.info("✅ Google Gemini client configured successfully")
-                logger.debug(f"API Key preview: {self.api_key[:10]}...{self.api_key[-5:]}")
+                logger.debug(f"Setting up Google Gemini client for key-{index}...")
+                # Timeout HTTP del SDK: ninguna llamada puede colgar un thread indefinidamente
+                client = genai.Client(
+                    api_key=api_key,
+                    http_options=types.HttpOptions(timeout=int(settings.ATTEMPT_TIMEOUT * 1000))
+                )
+                clients.append(PooledClient(f"key-{index}", client, weight, preview=f"...{api_key[-4:]}"))
+                logger.debug(f"API Key preview: {api_key[:10]}...{api_key[-5:]}")
             except Exception as e:
-                logger.error(f"❌ Failed to configure Google Gemini client: {e}")
+                logger.error(f"❌ Failed to configure Google Gemini client for key-{index}: {e}")
                 logger.debug(f"Error type: {type(e).__name__}")
-                self.client = None
-        else:
-            logger.warning("⚠️  No GENIA_API_KEY provided. Service will work in mock mode only.")
-            self.client = None
+
+        if clients:
+            logger.info(f"✅ Google Gemini client configured successfully ({len(clients)} API key(s))")
+        return self._new_pool(clients)
+
+
+    @staticmethod
+    def _new_pool(clients: List[PooledClient]) -> ClientPool:
+        return ClientPool(
+            clients,
+            cooldown_seconds=settings.CLIENT_POOL_COOLDOWN_SECONDS,
+            max_cooldown_seconds=settings.CLIENT_POOL_MAX_COOLDOWN_SECONDS,
+            key_rpm=settings.CLIENT_POOL_KEY_RPM,
+            key_tpm=settings.CLIENT_POOL_KEY_TPM
+        )
 
 
     async def query(self, request: QueryRequest) -> QueryResponse:
@@ -63,70 +256,529 @@ class GeniaAPIService:
             logger.error("❌ Google Gemini client not configured")
             raise Exception("Google Gemini client not configured. Check your GENIA_API_KEY.")
 
+        start_time = time.time()
+        cacheable = self._is_cacheable(request)
+        # La huella lleva el modelo elegido por el router: las respuestas de
+        # modelos distintos no se comparten en la caché ni en single-flight
+        decision = self._route(request)
+        fingerprint = request_fingerprint(decision.model, request, self._prefix_digest(request))
+
+        if cacheable:
+            cached_response = self.cache.get(fingerprint)
+            if cached_response is not None:
+                logger.info(f"💾 Cache hit for {decision.model} - key: {fingerprint[:12]}")
+                return self._from_cache(cached_response, start_time)
+
+        try:
+            response = await self._coalesced_upstream(fingerprint, request, decision)
+        except Exception:
+            # stale-if-error: preferimos una respuesta vencida a un fallo
+            stale_response = self.cache.get_stale(fingerprint) if cacheable else None
+            if stale_response is None:
+                raise
+            logger.warning(f"⚠️  Serving stale cached response after upstream failure - key: {fingerprint[:12]}")
+            return self._from_cache(stale_response, start_time)
+
+        if cacheable:
+            self.cache.set(fingerprint, response)
+        return response
+
+
+    async def _coalesced_upstream(self, fingerprint: str, request: QueryRequest, decision: RouteDecision) -> QueryResponse:
+        """
+        Llamada a Gemini compartida entre peticiones idénticas en curso del
+        mismo tenant (la cola justa carga la llamada a quien la pide)
+        """
+        if self.single_flight is None:
+            return await self._query_upstream(request, decision)
+        key = f"{current_tenant.get()}:{fingerprint}"
+        return await self.single_flight.do(key, lambda: self._query_upstream(request, decision))
+
+
+    async def _query_upstream(self, request: QueryRequest, decision: RouteDecision) -> QueryResponse:
+        """
+        Llamada real a Google Gemini (al modelo de `decision`), sin pasar por la caché
+        """
         start_time = time.time()
         call_id = f"gemini_{int(start_time * 1000)}"
+        attempt_models: List[str] = []
+
+        def attempt():
+            # El primer intento va al modelo elegido; los reintentos, a su fallback
+            model = decision.model_for_attempt(len(attempt_models) + 1)
+            if attempt_models and model != attempt_models[-1]:
+                self.router.record_fallback(model)
+            attempt_models.append(model)
+            return self._attempt(request.prompt, generation_config, call_id, model, request.prefix)
 
         try:
-            logger.info(f"🚀 [{call_id}] Calling Google Gemini API ({self.model_name})")
-            logger.debug(f"[{call_id}] Prompt preview: '{request.prompt[:100]}...'")
-            logger.debug(f"[{call_id}] Prompt length: {len(request.prompt)} characters")
+            logger.info(f"🚀 [{call_id}] Calling Google Gemini API ({decision.model}, route: {decision.reason})")
 
             # Preparar parámetros según la documentación oficial
             generation_config = self._build_generation_config(request)
-            logger.debug(f"[{call_id}] Generation config: {generation_config}")
-
-            # Ejecutar la llamada en un thread pool para hacerla async
-            logger.debug(f"[{call_id}] Executing API call...")
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                self._generate_content_with_config,
-                request.prompt,
-                generation_config
+            events.debug(
+                "gemini_request",
+                call_id=call_id,
+                backend=self.backend,
+                prompt_length=len(request.prompt),
+                prompt_preview=Lazy(lambda: request.prompt[:100]),
+                generation_config=generation_config
+            )
+            response = await self.retry_policy.run(
+                attempt,
+                deadline=request_deadline.get(),
+                call_id=call_id,
+                operation_timed=True
             )
 
             processing_time = time.time() - start_time
-            estimated_tokens = self._estimate_tokens(response.text)
+            # Sin texto (MAX_TOKENS antes del primer token, bloqueo de seguridad) el SDK da None
+            text = response.text or ""
+            finish_reason = self._extract_finish_reason(response) or "stop"
+            usage = self._token_usage(response, request.prompt, text)
+            model = attempt_models[-1]
 
             # Log métricas de performance
             log_performance(
                 f"gemini_api_call_{call_id}",
                 processing_time,
                 {
-                    "model": self.model_name,
+                    "model": model,
+                    "route": decision.reason,
                     "prompt_length": len(request.prompt),
-                    "response_length": len(response.text),
-                    "estimated_tokens": estimated_tokens
+                    "response_length": len(text),
+                    "finish_reason": finish_reason,
+                    **usage
                 }
             )
 
-            logger.info(f"✅ [{call_id}] Google Gemini API success - Time: {processing_time:.3f}s, Tokens: {estimated_tokens}")
+            self.health_monitor.record_traffic(success=True)
+            metrics.record_tokens(model, usage["prompt_tokens"], usage["output_tokens"])
+            logger.info(
+                f"✅ [{call_id}] Google Gemini API success - Time: {processing_time:.3f}s, "
+                f"Tokens: {usage['total_tokens']} ({usage['token_source']})"
+            )
+
+            if not text:
+                logger.warning(f"⚠️  [{call_id}] Google Gemini returned no text - finish_reason: {finish_reason}")
 
             return QueryResponse(
-                response=response.text,
-                tokens_used=estimated_tokens,
-                model=self.model_name,
-                processing_time=processing_time
+                response=text,
+                tokens_used=usage["output_tokens"],
+                model=model,
+                processing_time=processing_time,
+                finish_reason=finish_reason,
+                **usage
             )
 
+        except (CircuitOpenError, RateLimitExceededError) as e:
+            logger.warning(f"🔌 [{call_id}] Google Gemini call rejected: {e}")
+            raise
+
+        except DeadlineExceededError as e:
+            logger.warning(f"⌛ [{call_id}] Google Gemini call abandoned: {e}")
+            raise
+
         except Exception as e:
             processing_time = time.time() - start_time
             error_details = {
-                "model": self.model_name,
+                "model": attempt_models[-1] if attempt_models else decision.model,
                 "prompt_length": len(request.prompt),
                 "error_type": type(e).__name__,
                 "processing_time": processing_time
             }
 
             logger.error(f"❌ [{call_id}] Google Gemini API failed: {str(e)} - Time: {processing_time:.3f}s")
+            if is_retryable(e):
+                # Solo los fallos transitorios hablan de la salud de Gemini (no un 400 del cliente)
+                self.health_monitor.record_traffic(success=False, error=f"{type(e).__name__}: {e}")
             logger.debug(f"[{call_id}] Error details: {error_details}")
 
             # Log la llamada fallida para monitoring
-            log_api_call("POST", f"google-gemini/{self.model_name}", 500, processing_time)
+            log_api_call("POST", f"google-gemini/{error_details['model']}", 500, processing_time)
 
             raise Exception(f"Google Gemini API error: {str(e)}. Details: {error_details}")
 
 
+    async def query_batch(
+        self,
+        requests: List[QueryRequest],
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[BatchItemResult]:
+        """
+        Procesar un lote de consultas con concurrencia acotada
+
+        Las consultas idénticas se envían una sola vez. Los resultados se emiten
+        a medida que terminan y cada error queda en su propio resultado.
+
+        Args:
+            requests: Consultas del lote
+            concurrency: Consultas simultáneas solicitadas (opcional)
+
+        Yields:
+            BatchItemResult: Resultado de cada posición del lote
+        """
+        limit = min(concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+        semaphore = asyncio.Semaphore(limit)
+
+        # Agrupar posiciones por huella para no repetir consultas idénticas
+        groups: Dict[str, List[int]] = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(request_fingerprint(self.model_name, request), []).append(index)
+
+        logger.info(f"📦 Processing batch - items: {len(requests)}, unique: {len(groups)}, concurrency: {limit}")
+
+        async def run(indices: List[int]):
+            async with semaphore:
+                try:
+                    return indices, await self.query(requests[indices[0]]), None
+                except Exception as e:
+                    return indices, None, str(e)
+
+        tasks = [asyncio.ensure_future(run(indices)) for indices in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indices, response, error = await next_done
+                for index in indices:
+                    yield BatchItemResult(index=index, success=error is None, response=response, error=error)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+    async def query_stream(self, request: QueryRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Consulta a Google Gemini en streaming usando generate_content_stream
+
+        Emite un evento "chunk" por cada fragmento recibido y un evento final
+        "done" con tokens, finish_reason y tiempos (incluido time-to-first-token).
+        Los fragmentos no se acumulan: el consumidor marca el ritmo (backpressure).
+
+        Args:
+            request: Datos de la consulta
+
+        Yields:
+            Dict[str, Any]: Eventos {"event": ..., "data": {...}}
+        """
+        if not self.client:
+            logger.error("❌ Google Gemini client not configured")
+            raise Exception("Google Gemini client not configured. Check your GENIA_API_KEY.")
+
+        # Rechazo inmediato con el circuito abierto (antes de esperar cuota)
+        self.check_circuit()
+
+        start_time = time.time()
+        call_id = f"gemini_stream_{int(start_time * 1000)}"
+        generation_config = self._build_generation_config(request)
+        # Un stream no puede cambiar de modelo a mitad: sin fallback
+        model = self._route(request).model
+        self._prefix_digest(request)
+        first_token_time = None
+        output_tokens = 0
+        chunk_count = 0
+        last_chunk = None
+
+        logger.info(f"🚀 [{call_id}] Streaming from Google Gemini API ({model})")
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(self._quota_cost(request.prompt, generation_config))
+        ensure_budget("the Gemini stream")
+
+        async with self._fair_slot(), self._concurrency:
+            # Para el circuito, la latencia de un stream es lo que tarda en llegar el primer fragmento
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.acquire()
+            opened_at = time.monotonic()
+            upstream_latency = None
+            try:
+                async for chunk in self._stream_chunks(request.prompt, generation_config, model, request.prefix):
+                    if upstream_latency is None:
+                        upstream_latency = time.monotonic() - opened_at
+                    last_chunk = chunk
+                    text = chunk.text or ""
+                    if not text:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    output_tokens += token_counter.count_uncached(text)
+                    chunk_count += 1
+                    yield {"event": "chunk", "data": {"index": chunk_count - 1, "text": text}}
+            except Exception as e:
+                failed = is_retryable(e)
+                if self.circuit_breaker is not None:
+                    latency = upstream_latency if upstream_latency is not None else time.monotonic() - opened_at
+                    self.circuit_breaker.record(latency, failed=failed)
+                if failed:
+                    self.health_monitor.record_traffic(success=False, error=f"{type(e).__name__}: {e}")
+                logger.error(f"❌ [{call_id}] Google Gemini stream failed: {e}")
+                raise
+            except BaseException:
+                # El cliente se fue: el stream no dice nada de la salud de Gemini
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.release()
+                raise
+            if self.circuit_breaker is not None:
+                latency = upstream_latency if upstream_latency is not None else time.monotonic() - opened_at
+                self.circuit_breaker.record(latency, failed=False)
+
+        processing_time = time.time() - start_time
+        self.health_monitor.record_traffic(success=True)
+        usage = self._usage_metadata(last_chunk) or {
+            "prompt_tokens": count_tokens(request.prompt),
+            "output_tokens": output_tokens,
+            "total_tokens": count_tokens(request.prompt) + output_tokens,
+            "token_source": "estimated"
+        }
+        metrics.record_tokens(model, usage["prompt_tokens"], usage["output_tokens"])
+        finish_reason = self._extract_finish_reason(last_chunk) or "stop"
+
+        log_performance(
+            f"gemini_api_stream_{call_id}",
+            processing_time,
+            {
+                "model": model,
+                "prompt_length": len(request.prompt),
+                "chunks": chunk_count,
+                "time_to_first_token": first_token_time
+            }
+        )
+
+        yield {
+            "event": "done",
+            "data": {
+                "model": model,
+                "tokens_used": usage["output_tokens"],
+                **usage,
+                "finish_reason": finish_reason,
+                "chunks": chunk_count,
+                "time_to_first_token": first_token_time,
+                "processing_time": processing_time
+            }
+        }
+
+
+    async def _stream_chunks(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        prefix: Optional[str] = None
+    ):
+        """
+        Iterar los fragmentos de Gemini con un cliente del pool durante todo el stream
+        """
+        model = model or self.model_name
+        with self.client_pool.lease() as pooled:
+            generation_config = await self._with_prefix(prefix, prompt, generation_config, model, pooled)
+            async for chunk in self._stream_from_client(prompt, generation_config, model, pooled.client):
+                yield chunk
+
+
+    async def _stream_from_client(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]],
+        model: Optional[str],
+        client
+    ):
+        """
+        Iterar los fragmentos de Gemini con el backend configurado
+        """
+        if self.backend == "async":
+            stream = await client.aio.models.generate_content_stream(
+                model=model or self.model_name,
+                contents=prompt,
+                config=self._to_generate_content_config(generation_config)
+            )
+            async for chunk in stream:
+                yield chunk
+            return
+
+        # Backend "thread": un thread consume el iterador síncrono y publica en una
+        # cola acotada; si el cliente lee despacio, el thread espera (backpressure)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_BUFFER_CHUNKS)
+        stopped = threading.Event()
+
+        def publish(item) -> bool:
+            # Nunca bloquear indefinidamente: el consumidor pudo irse o su loop cerrarse
+            if stopped.is_set():
+                return False
+            put = queue.put(item)
+            try:
+                future = asyncio.run_coroutine_threadsafe(put, loop)
+            except RuntimeError:
+                put.close()
+                return False
+            while not stopped.is_set() and not loop.is_closed():
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    continue
+            future.cancel()
+            return False
+
+        def produce():
+            try:
+                for chunk in self._generate_content_stream_with_config(prompt, generation_config, model, client):
+                    if stopped.is_set() or not publish(chunk):
+                        break
+            except Exception as e:
+                publish(e)
+            finally:
+                publish(_STREAM_END)
+
+        loop.run_in_executor(self._get_executor(), produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Si el consumidor se fue antes de terminar, el productor deja de publicar
+            # y termina solo al volver del iterador síncrono; no se le espera aquí
+            # para no retener los huecos de concurrencia hasta el siguiente fragmento
+            stopped.set()
+
+
+    def _generate_content_stream_with_config(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        client=None
+    ):
+        """
+        Método sincrónico para generar contenido en streaming
+        """
+        return (client or self.client).models.generate_content_stream(
+            model=model or self.model_name,
+            contents=prompt,
+            config=self._to_generate_content_config(generation_config)
+        )
+
+
+    def _token_usage(self, response, prompt: str, text: str) -> Dict[str, Any]:
+        """
+        Tokens de prompt, salida y total: los reales de usage_metadata si vienen
+        en la respuesta; si no, estimados con el contador local
+        """
+        usage = self._usage_metadata(response)
+        if usage is not None:
+            return usage
+
+        prompt_tokens = count_tokens(prompt)
+        output_tokens = self._estimate_tokens(text)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens,
+            "token_source": "estimated"
+        }
+
+
+    @staticmethod
+    def _usage_metadata(response) -> Optional[Dict[str, Any]]:
+        """Extraer los contadores de usage_metadata del SDK, si son válidos"""
+        metadata = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(metadata, "prompt_token_count", None)
+        output_tokens = getattr(metadata, "candidates_token_count", None)
+        if not isinstance(prompt_tokens, int) or not isinstance(output_tokens, int):
+            return None
+
+        total_tokens = getattr(metadata, "total_token_count", None)
+        if not isinstance(total_tokens, int):
+            total_tokens = prompt_tokens + output_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens,
+            "token_source": "usage_metadata"
+        }
+
+
+    @staticmethod
+    def _extract_finish_reason(response) -> Optional[str]:
+        """Obtener el finish_reason del primer candidato, si existe"""
+        candidates = getattr(response, "candidates", None)
+        if not isinstance(candidates, (list, tuple)) or not candidates:
+            return None
+        reason = getattr(candidates[0], "finish_reason", None)
+        if reason is None:
+            return None
+        return str(getattr(reason, "value", reason)).lower()
+
+
+    def _is_cacheable(self, request: QueryRequest) -> bool:
+        """
+        Determinar si la respuesta a un request puede cachearse.
+        Por defecto solo las consultas deterministas (temperature == 0).
+        """
+        if self.cache is None:
+            return False
+        return not settings.CACHE_DETERMINISTIC_ONLY or request.temperature == 0
+
+
+    @staticmethod
+    def _from_cache(response: QueryResponse, start_time: float) -> QueryResponse:
+        """Copia de una respuesta cacheada con tiempos propios de esta consulta"""
+        return response.model_copy(update={
+            "cached": True,
+            "processing_time": time.time() - start_time,
+            "timestamp": time.time()
+        })
+
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Contadores de la caché de respuestas (hits, misses, expulsiones)
+        """
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, "deterministic_only": settings.CACHE_DETERMINISTIC_ONLY, **self.cache.stats()}
+
+
+    def get_single_flight_stats(self) -> Dict[str, Any]:
+        """
+        Contadores de coalescencia de peticiones idénticas en curso
+        """
+        if self.single_flight is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.single_flight.stats()}
+
+
+    def get_upstream_stats(self) -> Dict[str, Any]:
+        """
+        Estado de la capa de resiliencia frente a Gemini (reintentos, etc.)
+        """
+        return {
+            "retries": self.retry_policy.stats(),
+            "hedging": self.hedge_policy.stats() if self.hedge_policy else {"enabled": False},
+            "circuit_breaker": self.get_circuit_state(),
+            "rate_limit": self.rate_limiter.stats() if self.rate_limiter else {"enabled": False},
+            "adaptive_concurrency": (
+                self.concurrency_limiter.stats() if self.concurrency_limiter else {"enabled": False}
+            ),
+            "fair_queue": self.fair_scheduler.stats() if self.fair_scheduler else {"enabled": False},
+            "routing": self.router.stats(),
+            "client_pool": self.client_pool.stats(),
+            "prefix_cache": self.prefix_cache.stats()
+        }
+
+
+    def get_circuit_state(self) -> Dict[str, Any]:
+        """
+        Estado del circuit breaker hacia Gemini
+        """
+        if self.circuit_breaker is None:
+            return {"enabled": False}
+        return self.circuit_breaker.stats()
+
+
     def _build_generation_config(self, request: QueryRequest) -> Optional[Dict[str, Any]]:
         """
         Construir configuración de generación basada en los parámetros del request
@@ -154,25 +806,321 @@ class GeniaAPIService:
         return config if config else None
 
 
-    def _generate_content_with_config(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None):
+    @staticmethod
+    def _to_generate_content_config(
+        generation_config: Optional[Dict[str, Any]]
+    ) -> Optional[types.GenerateContentConfig]:
+        """
+        Convertir la configuración de generación en el tipo del SDK
+        """
+        if not generation_config:
+            return None
+        return types.GenerateContentConfig(**generation_config)
+
+
+    async def _attempt(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        call_id: str = "",
+        model: Optional[str] = None,
+        prefix: Optional[str] = None
+    ):
+        """
+        Un intento de generación, con respaldo "hedged" si está habilitado.
+        Con el circuito abierto se rechaza antes de esperar turno o cuota; el
+        circuit breaker solo mide la llamada ya enviada a Gemini (ver _dispatch).
+        """
+        self.check_circuit()
+        async with self._fair_slot():
+            if self.hedge_policy is None:
+                return await self._generate(prompt, generation_config, model, prefix)
+            return await self.hedge_policy.run(
+                lambda: self._generate(prompt, generation_config, model, prefix), call_id=call_id
+            )
+
+
+    def check_circuit(self) -> None:
+        """
+        Rechazar de inmediato si el circuito hacia Gemini está abierto
+
+        Raises:
+            CircuitOpenError: El circuito está abierto
+        """
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.check()
+
+
+    async def _generate(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        prefix: Optional[str] = None
+    ):
+        """
+        Ejecutar la llamada a Gemini con el backend configurado.
+        La concurrencia la limita un semáforo explícito, no el número de threads.
+        Antes de llamar se espera cuota RPM/TPM si hay limitador.
+        Si la petición trae deadline, lo que queda de él es el timeout HTTP.
+        Con un prefijo registrado se envía su handle cacheado y solo el prompt.
+        """
+        reserved = 0
+        if self.rate_limiter is not None:
+            reserved = self._quota_cost(prompt, generation_config)
+            await self.rate_limiter.acquire(reserved)
+
+        try:
+            response, pooled = await self._dispatch(prompt, generation_config, model or self.model_name, prefix)
+        except Exception:
+            # Un error de Gemini (o no llegar a enviarla) no consume cuota TPM
+            if reserved:
+                self.rate_limiter.refund(reserved)
+            raise
+
+        # Ajustar la reserva TPM a los tokens usados (también si se usaron más)
+        usage = self._usage_metadata(response)
+        if usage is not None:
+            self.client_pool.record_usage(pooled, usage["total_tokens"])
+            if reserved:
+                self.rate_limiter.refund(reserved - usage["total_tokens"])
+        return response
+
+
+    async def _dispatch(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]],
+        model: str,
+        prefix: Optional[str]
+    ) -> Tuple[Any, PooledClient]:
+        """
+        Esperar turno (límite adaptativo, semáforo) y llamar a Gemini con un cliente
+        del pool. ATTEMPT_TIMEOUT cuenta desde que la llamada sale, no desde la cola.
+
+        Raises:
+            UpstreamTimeoutError: Gemini no respondió dentro de ATTEMPT_TIMEOUT
+        """
+        ensure_budget("the Gemini call")
+        waiting = time.perf_counter()
+        async with self._adaptive_slot(), self._concurrency:
+            metrics.dispatch_wait.observe(time.perf_counter() - waiting)
+            generation_config = self._with_remaining_budget(generation_config)
+            with self.client_pool.lease() as pooled:
+                # Crear el handle del prefijo no es tiempo de la llamada ni cuenta como en curso
+                generation_config = await self._with_prefix(prefix, prompt, generation_config, model, pooled)
+                # El circuit breaker mide solo la llamada: la espera local no es un resultado de Gemini
+                if self.circuit_breaker is None:
+                    response = await self._call_upstream(prompt, generation_config, model, pooled)
+                else:
+                    response = await self.circuit_breaker.call(
+                        lambda: self._call_upstream(prompt, generation_config, model, pooled)
+                    )
+        return response, pooled
+
+
+    async def _call_upstream(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]],
+        model: str,
+        pooled: PooledClient
+    ) -> Any:
+        """
+        Enviar la llamada a Gemini con su timeout y registrar su latencia y resultado
+
+        Raises:
+            UpstreamTimeoutError: Gemini no respondió dentro de ATTEMPT_TIMEOUT
+        """
+        start = time.monotonic()
+        in_flight = metrics.upstream_requests_in_flight.labels(model)
+        in_flight.inc()
+        try:
+            if self.backend == "async":
+                call = self._agenerate_content_with_config(
+                    prompt, generation_config, model, pooled.client
+                )
+            else:
+                call = asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(),
+                    metrics.timed_in_thread(
+                        self._generate_content_with_config,
+                        prompt,
+                        generation_config,
+                        model,
+                        pooled.client
+                    )
+                )
+            response = await asyncio.wait_for(call, timeout=self.retry_policy.attempt_timeout)
+        except asyncio.CancelledError:
+            # Cortada por el deadline o por perder un hedge
+            self._observe_call(model, time.monotonic() - start, "cancelled", failed=False)
+            raise
+        except Exception as e:
+            self._observe_call(model, time.monotonic() - start, "error", failed=is_retryable(e))
+            if isinstance(e, asyncio.TimeoutError):
+                raise UpstreamTimeoutError(
+                    f"Gemini call timed out after {self.retry_policy.attempt_timeout:.2f}s"
+                ) from None
+            raise
+        finally:
+            in_flight.dec()
+        self._observe_call(model, time.monotonic() - start, "success", failed=False)
+        return response
+
+
+    def _observe_call(self, model: str, duration: float, outcome: str, failed: bool) -> None:
+        """
+        Latencia de una llamada a Gemini para el enrutado, /metrics y /stats.
+        Una llamada cancelada (perdedora de un hedge, deadline) solo se cuenta:
+        su duración no es una latencia de Gemini.
+        """
+        metrics.observe_upstream(model, duration, outcome)
+        if outcome == "cancelled":
+            return
+        self.router.observe(model, duration, failed=failed)
+        if outcome == "success":
+            latency_recorder.record(f"upstream {model}", duration)
+
+
+    async def _with_prefix(
+        self,
+        prefix: Optional[str],
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]],
+        model: str,
+        pooled: PooledClient
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Añadir el prefijo a la configuración (handle cacheado o instrucción completa)
+        y contabilizar los bytes de prompt que salen hacia Gemini
+        """
+        if prefix is None:
+            self.prefix_cache.record_sent(prompt)
+            return generation_config
+        binding = await self.prefix_cache.bind(prefix, model, pooled.client, pooled.key_id)
+        self.prefix_cache.record_sent(prompt, binding)
+        return binding.apply(generation_config)
+
+
+    def _prefix_digest(self, request: QueryRequest) -> Optional[str]:
+        """
+        Hash del prefijo referenciado por la consulta (None si no referencia ninguno)
+
+        Raises:
+            UnknownPrefixError: El prefijo no está registrado
+        """
+        if request.prefix is None:
+            return None
+        return self.prefix_cache.get(request.prefix).digest
+
+
+    def _route(self, request: QueryRequest) -> RouteDecision:
+        """Elegir modelo (y fallback) para una consulta"""
+        return self.router.route(
+            prompt_tokens=count_tokens(request.prompt),
+            max_tokens=request.max_tokens,
+            quality=request.quality.value if request.quality else None
+        )
+
+
+    @staticmethod
+    def _with_remaining_budget(generation_config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Acotar el timeout HTTP de la llamada al presupuesto restante del llamante,
+        para que el thread no siga esperando una respuesta que nadie va a leer
+        """
+        remaining = remaining_budget()
+        if remaining is None or remaining >= settings.ATTEMPT_TIMEOUT:
+            return generation_config
+        ensure_budget("the Gemini call")
+        timeout_ms = max(1, int(remaining * 1000))
+        return {**(generation_config or {}), "http_options": types.HttpOptions(timeout=timeout_ms)}
+
+
+    @asynccontextmanager
+    async def _fair_slot(self):
+        """Hueco de la cola justa del tenant en curso (no hace nada si está deshabilitada)"""
+        if self.fair_scheduler is None:
+            yield
+            return
+        async with self.fair_scheduler.slot():
+            yield
+
+
+    def dispatch_capacity(self) -> int:
+        """Llamadas simultáneas a Gemini: el límite adaptativo o el tope fijo"""
+        if self.concurrency_limiter is not None:
+            return self.concurrency_limiter.limit
+        return self.max_concurrency
+
+
+    @asynccontextmanager
+    async def _adaptive_slot(self):
+        """Hueco del límite adaptativo (no hace nada si está deshabilitado)"""
+        if self.concurrency_limiter is None:
+            yield
+            return
+        async with self.concurrency_limiter.slot():
+            yield
+
+
+    @staticmethod
+    def _quota_cost(prompt: str, generation_config: Optional[Dict[str, Any]]) -> int:
+        """Tokens a reservar en la cuota TPM: prompt estimado + max_output_tokens"""
+        return count_tokens(prompt) + (generation_config or {}).get("max_output_tokens", 0)
+
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Pool de threads propio del backend "thread", creado bajo demanda"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.THREAD_POOL_SIZE,
+                thread_name_prefix="gemini-call"
+            )
+        return self._executor
+
+
+    async def _agenerate_content_with_config(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        client=None
+    ):
+        """
+        Método asíncrono nativo para generar contenido usando client.aio
+        """
+        return await (client or self.client).aio.models.generate_content(
+            model=model or self.model_name,
+            contents=prompt,
+            config=self._to_generate_content_config(generation_config)
+        )
+
+
+    def _generate_content_with_config(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        client=None
+    ):
         """
         Método sincrónico para generar contenido con configuración
         Siguiendo exactamente la documentación oficial de Google
         """
-        # Implementación simplificada - exactamente como en la documentación oficial
-        return self.client.models.generate_content(
-            model=self.model_name,
-            contents=prompt
+        return (client or self.client).models.generate_content(
+            model=model or self.model_name,
+            contents=prompt,
+            config=self._to_generate_content_config(generation_config)
         )
 
 
     def _estimate_tokens(self, text: str) -> int:
         """
-        Estimación de tokens más precisa para gemini-1.5-pro-002
+        Estimación local de tokens (tiktoken si está disponible, con caché LRU)
         """
-        # Gemini 1.5 Pro tiene tokenización más eficiente
-        # Estimación mejorada: ~3.5 caracteres por token en promedio para español
-        return max(1, len(text) // 4)
+        return max(1, count_tokens(text))
 
 
     async def query_mock(self, request: QueryRequest) -> QueryResponse:
@@ -204,60 +1152,107 @@ class GeniaAPIService:
             f"generación de texto, razonamiento complejo y comprensión contextual avanzada."
         )
 
+        prompt_tokens = count_tokens(request.prompt)
+        output_tokens = self._estimate_tokens(mock_response)
+
         return QueryResponse(
             response=mock_response,
-            tokens_used=len(request.prompt.split()) * 2,  # Mock más realista
+            tokens_used=output_tokens,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            total_tokens=prompt_tokens + output_tokens,
             model=f"mock-{self.model_name}",
             processing_time=processing_time
         )
 
 
-    async def health_check(self) -> bool:
+    async def _timed_health_check(self) -> bool:
+        """
+        Sonda de salud con su latencia registrada para /stats; los fallos se
+        propagan para que el monitor guarde su causa en last_error
+        """
+        start = time.monotonic()
+        try:
+            return await self.health_check(raise_errors=True)
+        finally:
+            latency_recorder.record("health_probe", time.monotonic() - start)
+
+
+    async def health_check(self, raise_errors: bool = False) -> bool:
         """
         Verificar salud de Google Gemini API con una consulta simple
 
+        Args:
+            raise_errors: Propagar el motivo del fallo en lugar de devolver False
+
         Returns:
             bool: True si la API está disponible y funcionando
         """
         if not self.client:
             logger.warning("Health check failed: Client not configured")
+            if raise_errors:
+                raise Exception("Google Gemini client not configured. Check your GENIA_API_KEY.")
             return False
 
         try:
             logger.info(f"Performing health check with {self.model_name}")
 
-            # Consulta simple y rápida para verificar conectividad
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                self._generate_content_with_config,
-                "Hello, respond with just 'OK'",
-                {"max_output_tokens": 10, "temperature": 0.1}
-            )
+            # Consulta simple y rápida, directa al cliente: la sonda no espera cuota,
+            # turno en la cola justa ni hueco del límite adaptativo
+            if self.backend == "async":
+                call = self._agenerate_content_with_config(HEALTH_CHECK_PROMPT, HEALTH_CHECK_GENERATION_CONFIG)
+            else:
+                call = asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(),
+                    self._generate_content_with_config,
+                    HEALTH_CHECK_PROMPT,
+                    HEALTH_CHECK_GENERATION_CONFIG
+                )
+            response = await asyncio.wait_for(call, timeout=settings.ATTEMPT_TIMEOUT)
 
-            # Verificar que la respuesta sea válida
-            is_healthy = bool(response and response.text and len(response.text.strip()) > 0)
+            # Cualquier respuesta sin error prueba que Gemini está disponible (el texto
+            # puede venir vacío si el modelo agota el presupuesto de salida)
+            is_healthy = response is not None
 
-            if is_healthy:
-                logger.info(f"Health check passed: {self.model_name} is healthy")
-            else:
-                logger.warning(f"Health check failed: Invalid response from {self.model_name}")
+            if not is_healthy:
+                raise Exception(f"Invalid response from {self.model_name}")
 
-            return is_healthy
+            logger.info(f"Health check passed: {self.model_name} is healthy")
+            return True
 
         except Exception as e:
             logger.warning(f"Google Gemini API health check failed: {e}")
+            if raise_errors:
+                raise
             return False
 
 
+    def close(self) -> None:
+        """
+        Liberar recursos del servicio (pool de threads del backend "thread" y
+        conexiones de los clientes de Gemini)
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for entry in self._configured_pool.clients:
+            close_client = getattr(entry.client, "close", None)
+            if callable(close_client):
+                close_client()
+
+
     def get_model_info(self) -> Dict[str, Any]:
         """
         Obtener información del modelo configurado
         """
         return {
             "model_name": self.model_name,
+            "fallback_model": self.router.secondary,
             "client_configured": bool(self.client),
             "api_key_set": bool(self.api_key),
+            "api_keys": len(self.client_pool),
+            "client_backend": self.backend,
+            "max_concurrency": self.max_concurrency,
             "capabilities": {
                 "text_generation": True,
                 "multimodal": True,  # gemini-1.5-pro-002 soporta imágenes
@@ -0,0 +1,101 @@
+"""
+Coalescencia single-flight de llamadas idénticas en curso.
+
+Las peticiones concurrentes con la misma huella esperan sobre una única tarea
+compartida y reciben su resultado o su error. Cancelar a un solo interesado no
+cancela la llamada compartida mientras queden otros esperando.
+
+La llamada compartida no hereda el deadline de quien llega primero: cada
+interesado deja de esperar al vencer su propio deadline (DeadlineExceededError)
+y la llamada sigue mientras quede alguien esperando.
+"""
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict
+from deadline import remaining_budget, request_deadline
+from retry import DeadlineExceededError
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+
+class _Flight:
+    """Llamada compartida en curso y número de interesados"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en una sola ejecución
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar `factory()` una única vez por clave entre los llamadores concurrentes
+
+        Args:
+            key: Huella de la petición
+            factory: Función que crea la corrutina a ejecutar
+
+        Returns:
+            Any: Resultado de la llamada compartida
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            task = contextvars.copy_context().run(self._start, factory)
+            flight = _Flight(task)
+            self._flights[key] = flight
+            task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalescing in-flight request - key: {key[:12]}, waiters: {flight.waiters + 1}")
+
+        flight.waiters += 1
+        try:
+            remaining = remaining_budget()
+            done, _ = await asyncio.wait((flight.task,), timeout=None if remaining is None else max(remaining, 0))
+            if not done:
+                raise DeadlineExceededError(f"Request deadline exceeded while waiting for coalesced call {key[:12]}")
+            return flight.task.result()
+        except (asyncio.CancelledError, DeadlineExceededError):
+            # Solo se cancela la llamada compartida si nadie más la espera
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    @staticmethod
+    def _start(factory: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+        # Se ejecuta en una copia del contexto: la tarea compartida no lleva deadline
+        request_deadline.set(None)
+        return asyncio.ensure_future(factory())
+
+    def in_flight(self) -> int:
+        """Número de llamadas compartidas en curso"""
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de coalescencia"""
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
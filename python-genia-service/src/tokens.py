@@ -0,0 +1,143 @@
+"""
+Conteo de tokens local y rápido.
+
+Se usa cuando la respuesta de Gemini no trae `usage_metadata`. Cuenta con
+tiktoken si la codificación está disponible localmente; si no, cae a una
+heurística por caracteres. Los textos largos se cuentan por muestreo y los
+resultados se guardan en una LRU para los prompts repetidos.
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+from config import settings
+from logging_config import get_logger
+
+# Obtener logger específico para este módulo
+logger = get_logger(__name__)
+
+# Caracteres por token de la heurística cuando no hay tokenizador
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """
+    Contador de tokens con tokenizador opcional, muestreo y caché LRU
+
+    La LRU se indexa por (longitud, hash) del texto para no retener prompts
+    largos en memoria; una colisión solo afectaría a una estimación.
+    """
+
+    def __init__(
+        self,
+        encoding_name: Optional[str] = "cl100k_base",
+        cache_size: int = 4096,
+        sample_chars: int = 8192
+    ):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self.sample_chars = sample_chars
+
+        self._encoding = None
+        self._encoding_loaded = False
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def warm_up(self) -> bool:
+        """
+        Cargar el tokenizador (una sola vez). Puede implicar E/S, así que
+        conviene llamarlo fuera del event loop al arrancar.
+
+        Returns:
+            bool: True si hay tokenizador; False si se usará la heurística
+        """
+        self._get_encoding()
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        """
+        Contar tokens de un texto, usando la caché LRU
+
+        Args:
+            text: Texto a contar
+
+        Returns:
+            int: Número de tokens (mínimo 1 para texto no vacío)
+        """
+        if not text:
+            return 0
+
+        key = (len(text), hash(text))
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        tokens = self.count_uncached(text)
+        self._cache[key] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def count_uncached(self, text: str) -> int:
+        """Contar tokens sin pasar por la caché (fragmentos de streaming, etc.)"""
+        if not text:
+            return 0
+
+        encoding = self._get_encoding()
+        if encoding is None:
+            return max(1, -(-len(text) // CHARS_PER_TOKEN))
+
+        if len(text) <= self.sample_chars:
+            return max(1, len(encoding.encode_ordinary(text)))
+
+        # Texto largo: contar tres tramos (inicio, mitad, final) y extrapolar
+        part = self.sample_chars // 3
+        middle = (len(text) - part) // 2
+        sample = (text[:part], text[middle:middle + part], text[-part:])
+        sampled_tokens = sum(len(encoding.encode_ordinary(chunk)) for chunk in sample)
+        return max(1, round(sampled_tokens * len(text) / (part * 3)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del contador y de su caché"""
+        return {
+            "tokenizer": self.encoding_name if self._encoding is not None else "heuristic",
+            "cache_entries": len(self._cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses
+        }
+
+    def _get_encoding(self):
+        if self._encoding_loaded:
+            return self._encoding
+
+        with self._load_lock:
+            if not self._encoding_loaded:
+                if self.encoding_name:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                        logger.info(f"Token counter using tiktoken encoding '{self.encoding_name}'")
+                    except Exception as e:
+                        logger.warning(f"⚠️  tiktoken encoding unavailable ({e}); using character heuristic")
+                self._encoding_loaded = True
+        return self._encoding
+
+
+# Instancia global del contador
+
+
+token_counter = TokenCounter(
+    encoding_name=settings.TOKENIZER_ENCODING or None,
+    cache_size=settings.TOKEN_COUNT_CACHE_SIZE,
+    sample_chars=settings.TOKENIZER_SAMPLE_CHARS
+)
+
+
+def count_tokens(text: str) -> int:
+    """Contar tokens con el contador global (con caché)"""
+    return token_counter.count(text)
@@ -5,7 +5,8 @@ import pytest
 import sys
 import os
 from pathlib import Path
-from unittest.mock import AsyncMock, MagicMock
+from contextlib import ExitStack
+from unittest.mock import AsyncMock, MagicMock, patch
 import tempfile
 from fastapi.testclient import TestClient
 
@@ -21,6 +22,8 @@ os.environ.setdefault("DEBUG", "true")
 os.environ.setdefault("GENIA_API_KEY", "test-api-key-for-testing")
 os.environ.setdefault("HOST", "127.0.0.1")
 os.environ.setdefault("PORT", "8000")
+# Los tests del servicio mockean la llamada síncrona; el backend async tiene sus propios tests
+os.environ.setdefault("GENIA_CLIENT_BACKEND", "thread")
 
 # Ahora podemos importar nuestros módulos
 from config import settings
@@ -159,6 +162,51 @@ def mock_google_client():
     return mock_client
 
 
+@pytest.fixture
+def make_genia_service(mock_google_client):
+    """
+    Fábrica de GeniaAPIService con API key de testing y el cliente de Google
+    mockeado; los argumentos sustituyen settings durante la construcción
+    """
+    services = []
+
+    def make(**overrides) -> GeniaAPIService:
+        with ExitStack() as stack:
+            stack.enter_context(patch('config.settings.GENIA_API_KEY', 'test-api-key'))
+            for name, value in overrides.items():
+                stack.enter_context(patch(f'config.settings.{name}', value))
+            service = GeniaAPIService()
+        service.client = mock_google_client
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.close()
+
+
+@pytest.fixture
+def genia_service(make_genia_service):
+    """GeniaAPIService con la configuración por defecto y el cliente de Google mockeado"""
+    return make_genia_service()
+
+
+class FakeClock:
+    """Reloj manual para tests de componentes que reciben `clock`"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def fake_clock():
+    """Reloj manual que empieza en t=1000"""
+    return FakeClock()
+
+
 # Configuración de markers para categorizar tests
 def pytest_configure(config):
     """Configurar markers personalizados"""
@@ -0,0 +1,145 @@
+"""
+Tests para el control de admisión y descarte de carga.
+"""
+import pytest
+from unittest.mock import patch
+from admission import AdmissionController, admission_controller, is_admission_path
+
+
+class TestAdmissionController:
+    """Test suite para AdmissionController"""
+
+    @pytest.mark.unit
+    def test_admits_until_max_in_flight(self):
+        """Test que se rechaza al alcanzar el máximo de peticiones en curso"""
+        controller = AdmissionController(capacity=2, max_in_flight=2)
+        assert controller.try_admit()[0]
+        assert controller.try_admit()[0]
+
+        admitted, retry_after = controller.try_admit()
+        assert not admitted
+        assert retry_after > 0
+        assert controller.shed_by_reason["max_in_flight"] == 1
+
+    @pytest.mark.unit
+    def test_sheds_when_estimated_wait_exceeds_slo(self):
+        """Test que se rechaza cuando la espera estimada supera el SLO"""
+        controller = AdmissionController(capacity=2, max_in_flight=100, queue_slo_seconds=1.0)
+        controller.avg_latency = 1.0
+
+        for _ in range(3):
+            assert controller.try_admit()[0]
+        assert controller.estimated_wait() == pytest.approx(1.0)
+
+        controller.in_flight = 4
+        admitted, retry_after = controller.try_admit()
+        assert not admitted
+        assert retry_after == pytest.approx(0.5)
+        assert controller.shed_by_reason["queue_slo"] == 1
+
+    @pytest.mark.unit
+    def test_release_updates_latency_average(self):
+        """Test que al terminar se actualiza la latencia media"""
+        controller = AdmissionController(latency_alpha=0.5)
+        controller.try_admit()
+        controller.release(2.0)
+        controller.try_admit()
+        controller.release(4.0)
+
+        assert controller.in_flight == 0
+        assert controller.avg_latency == pytest.approx(3.0)
+
+    @pytest.mark.unit
+    def test_capacity_follows_adaptive_limit(self):
+        """Test que la capacidad se lee en cada estimación (límite adaptativo)"""
+        limit = {"value": 4}
+        controller = AdmissionController(capacity=lambda: limit["value"])
+        controller.avg_latency = 2.0
+        controller.in_flight = 4
+
+        assert controller.estimated_wait() == pytest.approx(0.5)
+        limit["value"] = 1
+        assert controller.estimated_wait() == pytest.approx(8.0)
+        assert controller.stats()["capacity"] == 1
+
+    @pytest.mark.unit
+    def test_batch_weighs_its_items(self):
+        """Test que un lote cuenta como tantas peticiones como consultas"""
+        controller = AdmissionController(capacity=2, max_in_flight=10)
+        assert controller.try_admit(weight=8)[0]
+        assert controller.in_flight == 8
+        assert not controller.try_admit(weight=3)[0]
+
+        controller.release(weight=8)
+        assert controller.in_flight == 0
+        assert controller.avg_latency is None
+        assert controller.weight_of(5000) == 10
+
+    @pytest.mark.unit
+    def test_admission_paths(self):
+        """Test que /health y /query/mock nunca pasan por la admisión"""
+        assert is_admission_path("/query")
+        assert is_admission_path("/query/stream")
+        assert not is_admission_path("/query/mock")
+        assert not is_admission_path("/health")
+        assert not is_admission_path("/health/detailed")
+
+
+class TestAdmissionMiddleware:
+    """Tests del middleware de admisión en la app"""
+
+    @pytest.mark.integration
+    def test_overload_returns_429_but_health_passes(self, client, sample_query_request):
+        """Test que con sobrecarga /query recibe 429 y /health sigue respondiendo"""
+        with patch.object(admission_controller, "max_in_flight", 0):
+            response = client.post("/query", json=sample_query_request.model_dump())
+            health = client.get("/health")
+
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert response.json()["detail"]["error"] == "overloaded"
+        assert health.status_code == 200
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query')
+    def test_admitted_request_released(self, mock_query, client, sample_query_request):
+        """Test que una petición admitida deja de contar al terminar"""
+        mock_query.side_effect = Exception("Gemini no disponible")
+        client.post("/query", json=sample_query_request.model_dump())
+
+        assert admission_controller.in_flight == 0
+        stats = client.get("/upstream/stats").json()["data"]["admission"]
+        assert stats["admitted"] >= 1
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query')
+    def test_only_successful_queries_update_latency(self, mock_query, client, sample_query_request):
+        """Test que los errores (422, 500) no alimentan la latencia media"""
+        mock_query.side_effect = Exception("Gemini no disponible")
+        with patch.object(admission_controller, "avg_latency", None):
+            client.post("/query", json=sample_query_request.model_dump())
+            client.post("/query", json={"prompt": ""})
+            assert admission_controller.avg_latency is None
+
+    @pytest.mark.integration
+    def test_batch_admitted_by_item_count(self, client, sample_query_request):
+        """Test que un lote se admite según su número de consultas y la app recibe el cuerpo"""
+        body = {"items": [sample_query_request.model_dump()] * 3}
+        with patch.object(admission_controller, "in_flight", 2), \
+             patch.object(admission_controller, "max_in_flight", 4):
+            shed = client.post("/query/batch", json=body)
+        with patch.object(admission_controller, "in_flight", 2), \
+             patch.object(admission_controller, "max_in_flight", 5), \
+             patch('services.genia_service.query_batch') as mock_batch:
+            mock_batch.return_value = _no_results()
+            admitted = client.post("/query/batch", json=body)
+
+        assert shed.status_code == 429
+        assert admitted.status_code != 429
+        assert len(mock_batch.call_args[0][0]) == 3
+        assert admission_controller.in_flight == 0
+
+
+async def _no_results():
+    return
+    yield
@@ -0,0 +1,228 @@
+"""
+Tests para el procesamiento masivo offline (bulk).
+"""
+import pytest
+import csv
+import json
+import asyncio
+import time
+from pathlib import Path
+from openpyxl import Workbook, load_workbook
+from bulk import iter_rows, build_request, RateLimiter, Checkpoint, process_file, main
+from models import QueryResponse
+
+
+class FakeService:
+    """Servicio falso que registra los prompts consultados"""
+
+    def __init__(self, fail_prompts=()):
+        self.calls = []
+        self.fail_prompts = set(fail_prompts)
+
+    async def query(self, request):
+        self.calls.append(request.prompt)
+        await asyncio.sleep(0)
+        if request.prompt in self.fail_prompts:
+            raise Exception(f"fallo en {request.prompt}")
+        return QueryResponse(response=f"R: {request.prompt}", tokens_used=3,
+                             model="fake-model", processing_time=0.01)
+
+    query_mock = query
+
+
+def write_jsonl(path: Path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class TestReaders:
+    """Test suite para la lectura de archivos de entrada"""
+
+    @pytest.mark.unit
+    def test_iter_rows_jsonl(self, tmp_path):
+        """Test lectura JSONL ignorando líneas vacías"""
+        path = tmp_path / "in.jsonl"
+        path.write_text('{"prompt": "uno"}\n\n{"prompt": "dos"}\n', encoding="utf-8")
+        assert [r["prompt"] for r in iter_rows(path)] == ["uno", "dos"]
+
+    @pytest.mark.unit
+    def test_iter_rows_csv(self, tmp_path):
+        """Test lectura CSV con cabecera"""
+        path = tmp_path / "in.csv"
+        path.write_text("id,prompt,max_tokens\n1,uno,100\n2,dos,\n", encoding="utf-8")
+        rows = list(iter_rows(path))
+        assert rows[0] == {"id": "1", "prompt": "uno", "max_tokens": "100"}
+        assert build_request(rows[0]).max_tokens == 100
+        assert build_request(rows[1]).max_tokens == 2048
+
+    @pytest.mark.unit
+    def test_iter_rows_xlsx(self, tmp_path):
+        """Test lectura XLSX en modo read-only"""
+        path = tmp_path / "in.xlsx"
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["prompt", "temperature"])
+        sheet.append(["uno", 0.0])
+        sheet.append([None, None])
+        sheet.append(["dos", 0.5])
+        workbook.save(path)
+
+        rows = list(iter_rows(path))
+        assert [r["prompt"] for r in rows] == ["uno", "dos"]
+        assert build_request(rows[1]).temperature == 0.5
+
+    @pytest.mark.unit
+    def test_unsupported_format(self, tmp_path):
+        """Test que un formato no soportado falla con un error claro"""
+        with pytest.raises(ValueError, match="Unsupported file format"):
+            list(iter_rows(tmp_path / "in.txt"))
+
+
+class TestRateLimiter:
+    """Test suite para RateLimiter"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_rate_limiter_spaces_requests(self):
+        """Test que el limitador espacia las peticiones"""
+        limiter = RateLimiter(rate=50)
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        assert time.monotonic() - start >= 0.07
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_rate_limiter_unlimited(self):
+        """Test que rate=0 no limita"""
+        limiter = RateLimiter(rate=0)
+        start = time.monotonic()
+        for _ in range(100):
+            await limiter.acquire()
+        assert time.monotonic() - start < 0.05
+
+
+class TestProcessFile:
+    """Test suite para process_file"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_process_jsonl_to_csv(self, tmp_path):
+        """Test procesamiento completo con errores por fila"""
+        input_path = tmp_path / "in.jsonl"
+        output_path = tmp_path / "out.csv"
+        write_jsonl(input_path, [{"id": "a", "prompt": "uno"}, {"id": "b", "prompt": "falla"},
+                                 {"id": "c", "prompt": ""}])
+        service = FakeService(fail_prompts={"falla"})
+
+        summary = await process_file(service, input_path, output_path, workers=2)
+
+        assert summary["done"] == 3
+        assert summary["failed"] == 2
+        assert summary["written"] == 3
+        with open(output_path, encoding="utf-8", newline="") as f:
+            rows = {row["id"]: row for row in csv.DictReader(f)}
+        assert rows["a"]["response"] == "R: uno"
+        assert rows["b"]["success"] == "False"
+        assert "Invalid row" in rows["c"]["error"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_malformed_lines_recorded_without_stopping(self, tmp_path):
+        """Test que una línea JSONL mal formada o que no es un objeto queda como fallo de su fila"""
+        input_path = tmp_path / "in.jsonl"
+        output_path = tmp_path / "out.jsonl"
+        input_path.write_text('{"prompt": "uno"}\n{"prompt": \n["dos"]\n{"prompt": "tres"}\n', encoding="utf-8")
+        service = FakeService()
+
+        summary = await process_file(service, input_path, output_path, workers=2)
+
+        assert (summary["done"], summary["failed"]) == (4, 2)
+        assert sorted(service.calls) == ["tres", "uno"]
+        with open(output_path, encoding="utf-8") as f:
+            records = {record["row"]: record for record in map(json.loads, f)}
+        assert records[1]["error"].startswith("Invalid row: malformed JSON")
+        assert records[2]["error"] == "Invalid row: expected a JSON object, got list"
+        assert records[3]["response"] == "R: tres"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_resume_skips_completed_rows(self, tmp_path):
+        """Test que al reanudar no se repiten las filas ya completadas"""
+        input_path = tmp_path / "in.jsonl"
+        output_path = tmp_path / "out.jsonl"
+        write_jsonl(input_path, [{"prompt": f"p{i}"} for i in range(5)])
+
+        # Primera ejecución: p3 falla
+        first = FakeService(fail_prompts={"p3"})
+        await process_file(first, input_path, output_path, workers=2)
+        assert sorted(first.calls) == ["p0", "p1", "p2", "p3", "p4"]
+
+        # Simular un diario con una línea truncada por un kill
+        checkpoint_path = output_path.with_name(output_path.name + ".checkpoint.jsonl")
+        with open(checkpoint_path, "a", encoding="utf-8") as f:
+            f.write('{"row": 4, "succ')
+            f.write("\n")
+
+        second = FakeService()
+        summary = await process_file(second, input_path, output_path, workers=2)
+
+        assert second.calls == ["p3"]
+        assert summary["failed"] == 0
+        records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+        assert sorted(r["row"] for r in records) == [0, 1, 2, 3, 4]
+        assert all(r["success"] for r in records)
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_xlsx_output_write_only(self, tmp_path):
+        """Test salida XLSX generada en modo write-only"""
+        input_path = tmp_path / "in.csv"
+        output_path = tmp_path / "out.xlsx"
+        input_path.write_text("prompt\nuno\ndos\n", encoding="utf-8")
+
+        await process_file(FakeService(), input_path, output_path, workers=1, use_mock=True)
+
+        sheet = load_workbook(output_path, read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        assert rows[0][0] == "row"
+        assert len(rows) == 3
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_progress_reporting(self, tmp_path, caplog):
+        """Test que se reporta throughput y ETA"""
+        input_path = tmp_path / "in.jsonl"
+        write_jsonl(input_path, [{"prompt": "uno"}])
+
+        with caplog.at_level("INFO", logger="bulk"):
+            await process_file(FakeService(), input_path, tmp_path / "out.jsonl", progress_interval=0.001)
+
+        assert any("Bulk progress" in r.message and "rows/s" in r.message for r in caplog.records)
+
+
+@pytest.mark.unit
+def test_checkpoint_empty_output(tmp_path):
+    """Test que sin diario no se escribe nada"""
+    from bulk import write_output
+    checkpoint = Checkpoint(tmp_path / "none.checkpoint.jsonl")
+    assert checkpoint.completed == set()
+    assert write_output(checkpoint, tmp_path / "out.jsonl") == 0
+
+
+@pytest.mark.unit
+def test_cli_main_mock(tmp_path):
+    """Test de la CLI en modo mock"""
+    input_path = tmp_path / "in.jsonl"
+    output_path = tmp_path / "out.jsonl"
+    write_jsonl(input_path, [{"prompt": "uno"}])
+
+    from unittest.mock import patch
+    with patch("services.genia_service.query_mock", side_effect=FakeService().query), \
+            patch("services.genia_service.close") as mock_close:
+        exit_code = main([str(input_path), str(output_path), "--mock", "--workers", "1"])
+
+    assert exit_code == 0
+    assert output_path.exists()
+    mock_close.assert_called_once()
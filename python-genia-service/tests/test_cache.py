@@ -0,0 +1,227 @@
+"""
+Tests para la caché de respuestas.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from cache import BaseResponseCache, ResponseCache, request_fingerprint, normalize_prompt
+from models import QueryRequest, QueryResponse
+from services import GeniaAPIService
+
+
+def make_response(text: str = "Respuesta") -> QueryResponse:
+    return QueryResponse(response=text, tokens_used=5, model="gemini-1.5-flash", processing_time=0.1)
+
+
+class TestRequestFingerprint:
+    """Test suite para la clave de caché"""
+
+    @pytest.mark.unit
+    def test_normalize_prompt_collapses_whitespace(self):
+        """Test que la normalización colapsa espacios"""
+        assert normalize_prompt("  Hola \n  mundo\t ") == "Hola mundo"
+
+    @pytest.mark.unit
+    def test_equivalent_requests_same_key(self):
+        """Test que prompts equivalentes generan la misma clave"""
+        a = QueryRequest(prompt="¿Qué es  la IA?", temperature=0.0)
+        b = QueryRequest(prompt="¿Qué es la IA?", temperature=0.0)
+        assert request_fingerprint("gemini-1.5-flash", a) == request_fingerprint("gemini-1.5-flash", b)
+
+    @pytest.mark.unit
+    def test_parameters_change_key(self):
+        """Test que cambiar modelo o parámetros cambia la clave"""
+        base = QueryRequest(prompt="Test", temperature=0.0)
+        other = QueryRequest(prompt="Test", temperature=0.0, max_tokens=100)
+        assert request_fingerprint("gemini-1.5-flash", base) != request_fingerprint("gemini-1.5-flash", other)
+        assert request_fingerprint("gemini-1.5-flash", base) != request_fingerprint("gemini-1.5-pro", base)
+
+
+class TestResponseCache:
+    """Test suite para ResponseCache"""
+
+    @pytest.mark.unit
+    def test_get_set_and_counters(self):
+        """Test hit y miss básicos"""
+        cache = ResponseCache()
+        assert cache.get("k") is None
+        cache.set("k", make_response())
+        assert cache.get("k").response == "Respuesta"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    @pytest.mark.unit
+    def test_lru_eviction_by_entries(self):
+        """Test expulsión LRU al superar max_entries"""
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", make_response("a"))
+        cache.set("b", make_response("b"))
+        cache.get("a")  # "b" pasa a ser la menos usada
+        cache.set("c", make_response("c"))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["evictions"] == 1
+
+    @pytest.mark.unit
+    def test_eviction_by_bytes(self):
+        """Test expulsión al superar el presupuesto de bytes"""
+        cache = ResponseCache(max_bytes=1000)
+        cache.set("a", make_response("x" * 400))
+        cache.set("b", make_response("y" * 400))
+
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] <= 1000
+
+    @pytest.mark.unit
+    def test_oversized_entry_not_stored(self):
+        """Test que una respuesta mayor al presupuesto no se guarda"""
+        cache = ResponseCache(max_bytes=100)
+        cache.set("a", make_response("x" * 500))
+        assert cache.stats()["entries"] == 0
+
+    @pytest.mark.unit
+    def test_replace_existing_key(self):
+        """Test que reemplazar una clave no duplica bytes"""
+        cache = ResponseCache()
+        cache.set("a", make_response("uno"))
+        cache.set("a", make_response("dos"))
+        assert cache.stats()["entries"] == 1
+        assert cache.get("a").response == "dos"
+
+    @pytest.mark.unit
+    def test_ttl_and_stale_window(self):
+        """Test expiración por TTL y ventana stale-if-error"""
+        cache = ResponseCache(ttl_seconds=10, stale_ttl_seconds=100)
+        with patch("cache.time.monotonic", return_value=1000.0):
+            cache.set("a", make_response())
+
+        with patch("cache.time.monotonic", return_value=1050.0):
+            assert cache.get("a") is None
+            assert cache.get_stale("a") is not None
+
+        with patch("cache.time.monotonic", return_value=1200.0):
+            assert cache.get_stale("a") is None
+
+        stats = cache.stats()
+        assert stats["stale_hits"] == 1
+        assert stats["expirations"] == 1
+        assert stats["entries"] == 0
+
+    @pytest.mark.unit
+    def test_clear(self):
+        """Test vaciar la caché"""
+        cache = ResponseCache()
+        cache.set("a", make_response())
+        cache.clear()
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["bytes"] == 0
+
+    @pytest.mark.unit
+    def test_incomplete_implementation_rejected(self):
+        """Test que una caché sin todos los métodos de la interfaz no se puede instanciar"""
+        class GetOnlyCache(BaseResponseCache):
+            def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            GetOnlyCache()
+
+
+class TestServiceCaching:
+    """Tests de la caché integrada en GeniaAPIService"""
+
+    @pytest.fixture
+    def service(self, genia_service):
+        genia_service.cache = ResponseCache()
+        return genia_service
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_deterministic_query_is_cached(self, service):
+        """Test que una consulta con temperature=0 se sirve desde caché"""
+        request = QueryRequest(prompt="Pregunta frecuente", temperature=0.0)
+        upstream = MagicMock(return_value=make_response("Desde Gemini"))
+
+        async def fake_upstream(req, decision):
+            return upstream(req)
+
+        with patch.object(service, "_query_upstream", side_effect=fake_upstream):
+            first = await service.query(request)
+            second = await service.query(request)
+
+        assert upstream.call_count == 1
+        assert first.cached is False
+        assert second.cached is True
+        assert second.response == "Desde Gemini"
+        assert service.get_cache_stats()["hits"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_non_deterministic_query_not_cached(self, service):
+        """Test que temperature > 0 no usa la caché por defecto"""
+        request = QueryRequest(prompt="Creativo", temperature=0.7)
+
+        async def fake_upstream(req, decision):
+            return make_response()
+
+        with patch.object(service, "_query_upstream", side_effect=fake_upstream) as mock_upstream:
+            await service.query(request)
+            await service.query(request)
+
+        assert mock_upstream.call_count == 2
+        assert service.get_cache_stats()["entries"] == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_serves_stale_on_upstream_failure(self, service):
+        """Test stale-if-error cuando Gemini falla"""
+        service.cache = ResponseCache(ttl_seconds=0, stale_ttl_seconds=3600)
+        request = QueryRequest(prompt="Pregunta frecuente", temperature=0.0)
+
+        async def ok(req, decision):
+            return make_response("Vieja")
+
+        async def fail(req, decision):
+            raise Exception("Gemini caído")
+
+        with patch.object(service, "_query_upstream", side_effect=ok):
+            await service.query(request)
+        with patch.object(service, "_query_upstream", side_effect=fail):
+            response = await service.query(request)
+
+        assert response.cached is True
+        assert response.response == "Vieja"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_failure_without_stale_entry_raises(self, service):
+        """Test que sin entrada stale el error se propaga"""
+        request = QueryRequest(prompt="Nueva", temperature=0.0)
+
+        async def fail(req, decision):
+            raise Exception("Gemini caído")
+
+        with patch.object(service, "_query_upstream", side_effect=fail):
+            with pytest.raises(Exception, match="Gemini caído"):
+                await service.query(request)
+
+    @pytest.mark.unit
+    def test_cache_stats_disabled(self, service):
+        """Test estadísticas con caché deshabilitada"""
+        service.cache = None
+        assert service.get_cache_stats() == {"enabled": False}
+
+
+@pytest.mark.unit
+def test_cache_stats_endpoint(client):
+    """Test del endpoint de estadísticas de caché"""
+    response = client.get("/cache/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert "enabled" in data["data"]
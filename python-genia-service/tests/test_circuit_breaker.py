@@ -0,0 +1,218 @@
+"""
+Tests para el circuit breaker de Google Gemini.
+"""
+import pytest
+import asyncio
+from unittest.mock import Mock, patch
+from google.genai import errors as genai_errors
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from retry import DeadlineExceededError
+from rate_limit import RateLimitExceededError
+from models import QueryRequest
+from services import GeniaAPIService
+
+
+def server_error():
+    return genai_errors.APIError(503, {"error": {"message": "unavailable", "status": "UNAVAILABLE"}}, Mock())
+
+
+def make_breaker(clock, **kwargs):
+    options = dict(min_calls=4, failure_rate_threshold=0.5, open_seconds=10, half_open_max_calls=2, clock=clock)
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.acquire()
+        breaker.record(0.1, failed=True)
+
+
+class TestCircuitBreaker:
+    """Test suite para CircuitBreaker"""
+
+    @pytest.mark.unit
+    def test_opens_on_error_rate(self, fake_clock):
+        """Test que el circuito se abre al superar la tasa de errores"""
+        breaker = make_breaker(fake_clock)
+        for failed in (False, True, False):
+            breaker.acquire()
+            breaker.record(0.1, failed=failed)
+        assert breaker.state is CircuitState.CLOSED
+
+        breaker.acquire()
+        breaker.record(0.1, failed=True)
+        assert breaker.state is CircuitState.OPEN
+        assert breaker.times_opened == 1
+
+    @pytest.mark.unit
+    def test_opens_on_slow_call_rate(self, fake_clock):
+        """Test que las llamadas lentas también abren el circuito"""
+        breaker = make_breaker(fake_clock, slow_call_seconds=1.0, slow_call_rate_threshold=0.75)
+        for _ in range(4):
+            breaker.acquire()
+            breaker.record(2.0, failed=False)
+        assert breaker.state is CircuitState.OPEN
+
+    @pytest.mark.unit
+    def test_open_rejects_with_retry_after(self, fake_clock):
+        """Test que el circuito abierto rechaza con el tiempo restante"""
+        breaker = make_breaker(fake_clock)
+        trip(breaker)
+        fake_clock.now += 4
+
+        with pytest.raises(CircuitOpenError) as exc_info:
+            breaker.acquire()
+        assert exc_info.value.retry_after == pytest.approx(6)
+        assert breaker.rejected == 1
+
+    @pytest.mark.unit
+    def test_half_open_limits_probes_and_closes(self, fake_clock):
+        """Test que en semiabierto pasan pocas pruebas y, si van bien, se cierra"""
+        breaker = make_breaker(fake_clock)
+        trip(breaker)
+        fake_clock.now += 10
+
+        assert breaker.state is CircuitState.HALF_OPEN
+        breaker.acquire()
+        breaker.acquire()
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire()
+
+        breaker.record(0.1, failed=False)
+        breaker.record(0.1, failed=False)
+        assert breaker.state is CircuitState.CLOSED
+
+    @pytest.mark.unit
+    def test_half_open_failure_reopens(self, fake_clock):
+        """Test que un fallo en semiabierto vuelve a abrir el circuito"""
+        breaker = make_breaker(fake_clock)
+        trip(breaker)
+        fake_clock.now += 10
+
+        breaker.acquire()
+        breaker.record(0.1, failed=True)
+        assert breaker.state is CircuitState.OPEN
+        assert breaker.times_opened == 2
+
+    @pytest.mark.unit
+    def test_old_failures_leave_window(self, fake_clock):
+        """Test que los fallos fuera de la ventana no cuentan"""
+        breaker = make_breaker(fake_clock, window_seconds=5)
+        for _ in range(3):
+            breaker.acquire()
+            breaker.record(0.1, failed=True)
+        fake_clock.now += 6
+
+        breaker.acquire()
+        breaker.record(0.1, failed=True)
+        assert breaker.state is CircuitState.CLOSED
+        assert breaker.stats()["window_calls"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_call_counts_only_transient_errors(self, fake_clock):
+        """Test que un error de cliente no cuenta como fallo de Gemini"""
+        breaker = make_breaker(fake_clock, min_calls=1)
+
+        async def bad_request():
+            raise ValueError("prompt inválido")
+
+        with pytest.raises(ValueError):
+            await breaker.call(bad_request)
+        assert breaker.state is CircuitState.CLOSED
+
+        async def unavailable():
+            raise server_error()
+
+        with pytest.raises(genai_errors.APIError):
+            await breaker.call(unavailable)
+        assert breaker.state is CircuitState.OPEN
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_slot(self, fake_clock):
+        """Test que una prueba cancelada libera su hueco"""
+        breaker = make_breaker(fake_clock, half_open_max_calls=1)
+        trip(breaker)
+        fake_clock.now += 10
+
+        task = asyncio.ensure_future(breaker.call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        breaker.acquire()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_deadline_drop_not_recorded(self, fake_clock):
+        """Test que una llamada descartada por deadline no cuenta en la ventana"""
+        breaker = make_breaker(fake_clock)
+
+        async def expired():
+            raise DeadlineExceededError("Request deadline exceeded")
+
+        with pytest.raises(DeadlineExceededError):
+            await breaker.call(expired)
+        assert breaker.stats()["window_calls"] == 0
+
+
+class TestServiceCircuitBreaker:
+    """Tests del circuit breaker integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self, genia_service, fake_clock):
+        """Test que con el circuito abierto no se llama a Gemini"""
+        service = genia_service
+        service.circuit_breaker = make_breaker(fake_clock)
+        trip(service.circuit_breaker)
+
+        with patch.object(service, '_generate_content_with_config') as mock_generate:
+            with pytest.raises(CircuitOpenError):
+                await service.query(QueryRequest(prompt="Hola", temperature=0.7))
+
+        mock_generate.assert_not_called()
+        assert service.get_circuit_state()["state"] == "open"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_local_quota_rejection_is_not_a_probe(self, make_genia_service, fake_clock):
+        """Test que en semiabierto un rechazo de nuestra propia cuota no cierra el circuito"""
+        service = make_genia_service(RATE_LIMIT_RPM=1, RATE_LIMIT_MAX_WAIT=0.01)
+        service.circuit_breaker = make_breaker(fake_clock, half_open_max_calls=1)
+        await service.rate_limiter.acquire(0)
+        trip(service.circuit_breaker)
+        fake_clock.now += 10
+
+        with patch.object(service, '_generate_content_with_config') as mock_generate:
+            with pytest.raises(RateLimitExceededError):
+                await service._attempt("Hola", {})
+
+        mock_generate.assert_not_called()
+        assert service.circuit_breaker.state is CircuitState.HALF_OPEN
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_queue_wait_not_counted_as_upstream_latency(self, make_genia_service):
+        """Test que la espera por un hueco local no convierte una llamada rápida en lenta"""
+        service = make_genia_service(MAX_CONCURRENT_REQUESTS=1)
+        service.circuit_breaker = CircuitBreaker(slow_call_seconds=0.05, min_calls=1)
+        response = Mock()
+        response.text = "ok"
+
+        async def hold_slot():
+            async with service._concurrency:
+                await asyncio.sleep(0.1)
+
+        holder = asyncio.ensure_future(hold_slot())
+        await asyncio.sleep(0)
+        with patch.object(service, '_generate_content_with_config', return_value=response):
+            await service._attempt("Hola", {})
+        await holder
+
+        stats = service.circuit_breaker.stats()
+        assert stats["window_calls"] == 1
+        assert stats["slow_call_rate"] == 0.0
@@ -0,0 +1,177 @@
+"""
+Tests para el pool de clientes de Gemini (una API key por cliente).
+"""
+import pytest
+from unittest.mock import Mock, patch
+from google.genai import errors as genai_errors
+from client_pool import ClientPool, PooledClient, parse_api_keys
+from models import QueryRequest
+from retry import RetryPolicy
+from services import GeniaAPIService
+
+
+def throttled_error(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    return genai_errors.APIError(429, {"error": {"message": "quota exceeded"}}, Mock(headers=headers))
+
+
+def make_pool(*weights, **kwargs):
+    clients = [PooledClient(f"key-{i}", f"client-{i}", weight) for i, weight in enumerate(weights, start=1)]
+    return ClientPool(clients, **kwargs)
+
+
+class TestParseApiKeys:
+    """Tests del parseo de las keys configuradas"""
+
+    @pytest.mark.unit
+    def test_primary_first_with_weights_and_no_duplicates(self):
+        """Test que GENIA_API_KEY va primero, con pesos opcionales y sin repetidas"""
+        keys = parse_api_keys("AIza-main", " AIza-b:3, AIza-main ,,AIza-c")
+        assert keys == [("AIza-main", 1.0), ("AIza-b", 3.0), ("AIza-c", 1.0)]
+        assert parse_api_keys(None, "") == []
+
+    @pytest.mark.unit
+    def test_invalid_weight_does_not_leak_key(self):
+        """Test que un peso inválido falla sin incluir la key en el mensaje"""
+        with pytest.raises(ValueError) as exc_info:
+            parse_api_keys(None, "AIza-secret:0")
+        assert "secret" not in str(exc_info.value)
+
+
+class TestClientPool:
+    """Test suite para ClientPool"""
+
+    @pytest.mark.unit
+    def test_least_loaded_round_robin(self):
+        """Test que con carga igual las keys se alternan y se evita la más cargada"""
+        pool = make_pool(1, 1, 1)
+        used = []
+        for _ in range(6):
+            with pool.lease() as entry:
+                used.append(entry.key_id)
+        assert used == ["key-1", "key-2", "key-3"] * 2
+
+        with pool.lease() as busy:
+            assert pool.select() is not busy
+
+    @pytest.mark.unit
+    def test_weighted_by_in_flight(self):
+        """Test que una key con peso 2 admite el doble de llamadas en curso"""
+        pool = make_pool(2, 1)
+        leases = [pool.lease() for _ in range(6)]
+        chosen = [lease.__enter__().key_id for lease in leases]
+        assert chosen.count("key-1") == 4
+        assert chosen.count("key-2") == 2
+        for lease in leases:
+            lease.__exit__(None, None, None)
+        assert all(entry.in_flight == 0 for entry in pool.clients)
+
+    @pytest.mark.unit
+    def test_throttled_key_cools_down(self, fake_clock):
+        """Test que una key con 429 no se elige hasta que termina su enfriamiento"""
+        pool = make_pool(1, 1, clock=fake_clock)
+
+        with pytest.raises(genai_errors.APIError):
+            with pool.lease() as entry:
+                assert entry.key_id == "key-1"
+                raise throttled_error(retry_after=12)
+
+        assert [pool.select().key_id for _ in range(3)] == ["key-2"] * 3
+        stats = pool.stats()["keys"]["key-1"]
+        assert stats["throttled"] == 1
+        assert stats["cooldown_remaining"] == 12
+
+        fake_clock.now += 12
+        used = []
+        for _ in range(2):
+            with pool.lease() as entry:
+                used.append(entry.key_id)
+        assert sorted(used) == ["key-1", "key-2"]
+
+    @pytest.mark.unit
+    def test_consecutive_throttles_back_off(self, fake_clock):
+        """Test que sin Retry-After el enfriamiento se duplica con cada 429 seguido, con tope"""
+        pool = make_pool(1, clock=fake_clock, cooldown_seconds=10, max_cooldown_seconds=25)
+        cooldowns = []
+        for _ in range(3):
+            with pytest.raises(genai_errors.APIError):
+                with pool.lease():
+                    raise throttled_error()
+            cooldowns.append(pool.stats()["keys"]["key-1"]["cooldown_remaining"])
+        assert cooldowns == [10, 20, 25]
+
+        # Con todas las keys en enfriamiento se sigue usando la que antes sale de él
+        assert pool.select().key_id == "key-1"
+        assert pool.exhausted == 3
+
+        with pool.lease():
+            pass
+        assert pool.clients[0].consecutive_throttles == 0
+
+    @pytest.mark.unit
+    def test_per_key_quota(self, fake_clock):
+        """Test que una key que agota su cuota por minuto cede el tráfico a las demás"""
+        pool = make_pool(1, 1, clock=fake_clock, key_tpm=1000)
+
+        with pool.lease() as entry:
+            pass
+        pool.record_usage(entry, 1200)
+        assert [pool.select().key_id for _ in range(2)] == ["key-2", "key-2"]
+        assert pool.stats()["keys"]["key-1"]["tokens_last_minute"] == 1200
+
+        fake_clock.now += 61
+        assert pool.stats()["keys"]["key-1"]["tokens_last_minute"] == 0
+        with pool.lease():
+            pass
+        assert pool.select().key_id == "key-1"
+
+    @pytest.mark.unit
+    def test_empty_pool(self):
+        """Test que un pool sin keys no tiene cliente"""
+        pool = ClientPool.single(None)
+        assert pool.primary is None
+        with pytest.raises(LookupError):
+            pool.select()
+
+
+class TestServiceClientPool:
+    """Tests del pool integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    def test_single_key_keeps_client_attribute(self, genia_service):
+        """Test que con una sola key el servicio expone su cliente como antes"""
+        service = genia_service
+        assert len(service.client_pool) == 1
+        assert service.client is service.client_pool.primary
+
+        replacement = Mock()
+        service.client = replacement
+        assert service.client is replacement
+        del service.client
+        assert service.client is not replacement
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_retry_after_429_uses_another_key(self):
+        """Test que el reintento tras un 429 va a otra key, que queda registrada"""
+        with patch('config.settings.GENIA_API_KEY', 'key-a'), \
+                patch('config.settings.GENIA_API_KEYS', 'key-b'):
+            service = GeniaAPIService()
+        service.cache = None
+        service.retry_policy = RetryPolicy(max_retries=1, base_delay=0.001, max_delay=0.001)
+        first, second = (entry.client for entry in service.client_pool.clients)
+        upstream_response = Mock()
+        upstream_response.text = "ok"
+        upstream_response.usage_metadata = None
+
+        with patch.object(
+            service, '_generate_content_with_config',
+            side_effect=[throttled_error(retry_after=0.001), upstream_response]
+        ) as mock_generate:
+            response = await service.query(QueryRequest(prompt="Hola", quality="fast"))
+
+        assert response.response == "ok"
+        assert [call.args[3] for call in mock_generate.call_args_list] == [first, second]
+        keys = service.get_upstream_stats()["client_pool"]["keys"]
+        assert keys["key-1"]["throttled"] == 1
+        assert keys["key-2"]["requests"] == 1
@@ -0,0 +1,163 @@
+"""
+Tests para el límite de concurrencia adaptativo.
+"""
+import pytest
+import asyncio
+from unittest.mock import Mock, patch
+from google.genai import errors as genai_errors
+from concurrency_limit import (
+    AdaptiveConcurrencyLimiter, AIMDLimit, GradientLimit, create_limit_algorithm
+)
+from services import GeniaAPIService
+
+
+def server_error():
+    return genai_errors.APIError(503, {"error": {"message": "unavailable", "status": "UNAVAILABLE"}}, Mock())
+
+
+class TestAIMDLimit:
+    """Test suite para AIMDLimit"""
+
+    @pytest.mark.unit
+    def test_additive_increase_when_saturated(self):
+        """Test que el límite crece ~1 por ventana de éxitos con el límite en uso"""
+        limit = AIMDLimit(initial=10, rtt_threshold=1.0)
+        for _ in range(10):
+            limit.update(0.1, in_flight=10, dropped=False)
+        assert limit.limit == pytest.approx(11, abs=0.1)
+
+    @pytest.mark.unit
+    def test_no_increase_when_app_limited(self):
+        """Test que no crece si apenas se usa el límite"""
+        limit = AIMDLimit(initial=10)
+        limit.update(0.1, in_flight=2, dropped=False)
+        assert limit.limit == 10
+
+    @pytest.mark.unit
+    def test_multiplicative_decrease_once_per_rtt(self):
+        """Test que una ráfaga de errores reduce el límite una sola vez"""
+        limit = AIMDLimit(initial=20, backoff_ratio=0.5)
+        for _ in range(5):
+            limit.update(1.0, in_flight=20, dropped=True)
+        assert limit.limit == 10
+
+    @pytest.mark.unit
+    def test_slow_call_counts_as_drop(self):
+        """Test que una llamada más lenta que el umbral reduce el límite"""
+        limit = AIMDLimit(initial=20, backoff_ratio=0.5, rtt_threshold=1.0)
+        limit.update(1.5, in_flight=20, dropped=False)
+        assert limit.limit == 10
+
+
+class TestGradientLimit:
+    """Test suite para GradientLimit"""
+
+    @staticmethod
+    def feed_window(limit, rtt, in_flight=None):
+        for _ in range(max(10, int(limit.limit))):
+            limit.update(rtt, in_flight if in_flight is not None else int(limit.limit), False)
+
+    @pytest.mark.unit
+    def test_grows_while_latency_stable(self):
+        """Test que con latencia estable el límite crece"""
+        limit = GradientLimit(initial=10)
+        for _ in range(5):
+            self.feed_window(limit, 0.1)
+        assert limit.limit > 15
+
+    @pytest.mark.unit
+    def test_shrinks_when_latency_rises(self):
+        """Test que si la latencia se dispara el límite baja"""
+        limit = GradientLimit(initial=50)
+        self.feed_window(limit, 0.1)
+        start = limit.limit
+        for _ in range(5):
+            self.feed_window(limit, 0.5)
+        assert limit.limit < start
+        assert limit.reference_rtt == pytest.approx(0.1, rel=0.01)
+
+    @pytest.mark.unit
+    def test_unknown_algorithm(self):
+        """Test que un algoritmo desconocido es un error de configuración"""
+        with pytest.raises(ValueError):
+            create_limit_algorithm("vegas2", 10, 1, 100, 5.0)
+
+
+class TestAdaptiveConcurrencyLimiter:
+    """Test suite para AdaptiveConcurrencyLimiter"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_enforces_limit(self):
+        """Test que nunca hay más llamadas en curso que el límite"""
+        limiter = AdaptiveConcurrencyLimiter(AIMDLimit(initial=3, max_limit=3))
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[call() for _ in range(10)])
+        assert peak == 3
+        assert limiter.in_flight == 0
+        assert limiter.stats()["completed"] == 10
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_transient_error_is_drop_signal(self):
+        """Test que un 503 reduce el límite y queda registrado en el historial"""
+        limiter = AdaptiveConcurrencyLimiter(AIMDLimit(initial=10, backoff_ratio=0.5))
+
+        with pytest.raises(genai_errors.APIError):
+            async with limiter.slot():
+                raise server_error()
+
+        stats = limiter.stats()
+        assert stats["limit"] == 5
+        assert stats["dropped"] == 1
+        assert [entry["limit"] for entry in stats["history"]] == [10, 5]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """Test que cancelar una llamada en espera no pierde huecos"""
+        limiter = AdaptiveConcurrencyLimiter(AIMDLimit(initial=1, max_limit=1))
+        release = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot():
+                await release.wait()
+
+        first = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await first
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert limiter.in_flight == 0
+        assert limiter.stats()["waiting"] == 0
+
+
+class TestServiceAdaptiveConcurrency:
+    """Tests del límite adaptativo integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_generate_goes_through_limiter(self, make_genia_service):
+        """Test que cada llamada a Gemini pasa por el límite adaptativo"""
+        service = make_genia_service(ADAPTIVE_CONCURRENCY_ENABLED=True, ADAPTIVE_CONCURRENCY_ALGORITHM='aimd')
+        response = Mock()
+        response.text = "ok"
+
+        with patch.object(service, '_generate_content_with_config', return_value=response):
+            await service._generate("Hola", {"max_output_tokens": 10})
+
+        stats = service.get_upstream_stats()["adaptive_concurrency"]
+        assert stats["algorithm"] == "aimd"
+        assert stats["completed"] == 1
+        assert stats["in_flight"] == 0
@@ -0,0 +1,236 @@
+"""
+Tests para la propagación del deadline del llamante.
+"""
+import pytest
+import asyncio
+import time
+from unittest.mock import patch
+from google.genai import types
+from deadline import deadline_tracker, ensure_budget, parse_deadline, remaining_budget, request_deadline
+from fair_queue import FairScheduler
+from retry import DeadlineExceededError, RetryPolicy
+from services import GeniaAPIService
+
+
+class TestParseDeadline:
+    """Tests del parseo de las cabeceras de deadline"""
+
+    @pytest.mark.unit
+    def test_absolute_deadline_seconds_and_millis(self):
+        """Test que el epoch absoluto se acepta en segundos o milisegundos"""
+        assert parse_deadline("1002.5", None, now=50.0, wall_now=1000.0) == pytest.approx(52.5)
+        assert parse_deadline("1700000002500", None, now=50.0, wall_now=1700000000.0) == pytest.approx(52.5)
+
+    @pytest.mark.unit
+    def test_relative_timeout(self):
+        """Test de los formatos de presupuesto relativo"""
+        assert parse_deadline(None, "2.5", now=10.0) == pytest.approx(12.5)
+        assert parse_deadline(None, "2s", now=10.0) == pytest.approx(12.0)
+        assert parse_deadline(None, "250ms", now=10.0) == pytest.approx(10.25)
+
+    @pytest.mark.unit
+    def test_strictest_header_wins_and_malformed_ignored(self):
+        """Test que con ambas cabeceras gana la más estricta y lo mal formado se ignora"""
+        assert parse_deadline("1005", "1", now=0.0, wall_now=1000.0) == pytest.approx(1.0)
+        assert parse_deadline("mañana", "pronto", now=0.0) is None
+        assert parse_deadline(None, None) is None
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value", ["nan", "NaN", "inf", "-inf", "Infinity"])
+    def test_non_finite_deadline_ignored(self, value):
+        """Test que nan/inf se ignoran como cualquier otra cabecera mal formada"""
+        assert parse_deadline(value, None, now=0.0, wall_now=1000.0) is None
+        assert parse_deadline(value, "1", now=0.0, wall_now=1000.0) == pytest.approx(1.0)
+        assert parse_deadline(None, "9" * 400, now=0.0) is None
+
+    @pytest.mark.unit
+    def test_ensure_budget(self):
+        """Test que sin presupuesto restante se abandona el trabajo"""
+        assert remaining_budget() is None
+        ensure_budget("test")
+
+        token = request_deadline.set(time.monotonic() - 0.1)
+        try:
+            with pytest.raises(DeadlineExceededError):
+                ensure_budget("test")
+        finally:
+            request_deadline.reset(token)
+
+
+class TestEarliestDeadlineFirst:
+    """Tests del despacho EDF y el descarte en cola"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_dispatch_order_by_deadline(self):
+        """Test que dentro de un tenant se despacha primero el deadline más cercano"""
+        scheduler = FairScheduler(capacity=1)
+        release = asyncio.Event()
+        order = []
+        now = time.monotonic()
+
+        async def holder():
+            async with scheduler.slot("t"):
+                await release.wait()
+
+        async def call(name, deadline):
+            async with scheduler.slot("t", deadline=deadline):
+                order.append(name)
+
+        first = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        calls = [
+            asyncio.ensure_future(call("no_deadline", None)),
+            asyncio.ensure_future(call("late", now + 10)),
+            asyncio.ensure_future(call("soon", now + 5))
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *calls)
+
+        # Sin deadline del llamante cuenta el presupuesto propio (30s por defecto)
+        assert order == ["soon", "late", "no_deadline"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_expired_waiter_leaves_queue(self):
+        """Test que una llamada que vence en cola no llega a ocupar hueco"""
+        scheduler = FairScheduler(capacity=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("t"):
+                await release.wait()
+
+        first = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceededError):
+            async with scheduler.slot("t", deadline=time.monotonic() + 0.02):
+                pass
+
+        release.set()
+        await first
+        stats = scheduler.stats()
+        assert stats["in_flight"] == 0
+        assert stats["queued"] == 0
+        assert stats["tenants"]["t"]["expired"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_already_expired_never_dispatched(self):
+        """Test que un deadline vencido se rechaza aunque haya huecos libres"""
+        scheduler = FairScheduler(capacity=4)
+        with pytest.raises(DeadlineExceededError):
+            async with scheduler.slot("t", deadline=time.monotonic() - 1):
+                pass
+        assert scheduler.in_flight == 0
+
+
+class TestRetryWithCallerDeadline:
+    """Tests del deadline del llamante en la política de reintentos"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_attempt_cut_by_deadline(self):
+        """Test que un intento cortado por el deadline no se reintenta"""
+        policy = RetryPolicy(max_retries=3, attempt_timeout=5)
+        calls = 0
+
+        async def operation():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(10)
+
+        with pytest.raises(DeadlineExceededError):
+            await policy.run(operation, deadline=time.monotonic() + 0.05)
+        assert calls == 1
+        assert policy.deadline_exceeded == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_caller_deadline_never_extends_budget(self):
+        """Test que un deadline lejano no supera el presupuesto propio (total_timeout)"""
+        policy = RetryPolicy(max_retries=0, attempt_timeout=5, total_timeout=0.05)
+
+        async def operation():
+            await asyncio.sleep(10)
+
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            await policy.run(operation, deadline=time.monotonic() + 60)
+        assert time.monotonic() - start < 1
+
+
+class TestServiceDeadline:
+    """Tests del deadline en GeniaAPIService"""
+
+    @pytest.mark.unit
+    def test_remaining_budget_becomes_http_timeout(self):
+        """Test que el presupuesto restante acota el timeout HTTP de la llamada"""
+        config = {"max_output_tokens": 10}
+        assert GeniaAPIService._with_remaining_budget(config) is config
+
+        token = request_deadline.set(time.monotonic() + 2)
+        try:
+            bounded = GeniaAPIService._with_remaining_budget(config)
+        finally:
+            request_deadline.reset(token)
+
+        assert isinstance(bounded["http_options"], types.HttpOptions)
+        assert 1000 < bounded["http_options"].timeout <= 2000
+        assert bounded["max_output_tokens"] == 10
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_expired_request_skips_upstream(self, genia_service):
+        """Test que con el deadline vencido no se llama a Gemini"""
+        service = genia_service
+
+        token = request_deadline.set(time.monotonic() - 0.1)
+        try:
+            with patch.object(service, '_generate_content_with_config') as mock_generate:
+                with pytest.raises(DeadlineExceededError):
+                    await service._generate("Hola", {"max_output_tokens": 10})
+        finally:
+            request_deadline.reset(token)
+        mock_generate.assert_not_called()
+
+
+class TestDeadlineMiddleware:
+    """Tests de las cabeceras de deadline en la app"""
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query')
+    def test_expired_on_arrival_returns_504(self, mock_query, client, sample_query_request):
+        """Test que una petición que llega vencida se descarta sin llamar al servicio"""
+        expired = deadline_tracker.expired_on_arrival
+        response = client.post(
+            "/query",
+            json=sample_query_request.model_dump(),
+            headers={"X-Request-Deadline": str(time.time() - 5)}
+        )
+
+        assert response.status_code == 504
+        assert response.json()["detail"]["error"] == "deadline_exceeded"
+        assert deadline_tracker.expired_on_arrival == expired + 1
+        mock_query.assert_not_called()
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query')
+    def test_deadline_reaches_service(self, mock_query, client, sample_query_request):
+        """Test que el presupuesto de la cabecera llega al servicio y el abandono es 504"""
+        budgets = []
+
+        async def fake_query(request):
+            budgets.append(remaining_budget())
+            raise DeadlineExceededError("Request deadline exceeded after 1.000s in queue")
+
+        mock_query.side_effect = fake_query
+        response = client.post(
+            "/query",
+            json=sample_query_request.model_dump(),
+            headers={"X-Request-Timeout": "1500ms"}
+        )
+
+        assert response.status_code == 504
+        assert 0 < budgets[0] <= 1.5
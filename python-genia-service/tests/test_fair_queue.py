@@ -0,0 +1,229 @@
+"""
+Tests para la cola justa ponderada entre tenants.
+"""
+import pytest
+import asyncio
+import time
+from unittest.mock import Mock, patch
+from models import QueryRequest, QueryResponse
+from retry import DeadlineExceededError
+from fair_queue import (
+    DEFAULT_TENANT, FairScheduler, TenantQueueFullError, current_tenant, normalize_tenant, parse_weights
+)
+
+
+async def hold_and_enqueue(scheduler, tenants):
+    """Ocupar el único hueco, encolar llamadas de `tenants` y devolver el orden de despacho"""
+    order = []
+    release = asyncio.Event()
+
+    async def holder():
+        async with scheduler.slot("holder"):
+            await release.wait()
+
+    async def call(tenant):
+        async with scheduler.slot(tenant):
+            order.append(tenant)
+            await asyncio.sleep(0)
+
+    first = asyncio.ensure_future(holder())
+    await asyncio.sleep(0)
+    calls = [asyncio.ensure_future(call(tenant)) for tenant in tenants]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, *calls)
+    return order
+
+
+class TestTenantHelpers:
+    """Tests de los helpers de tenant y pesos"""
+
+    @pytest.mark.unit
+    def test_parse_weights(self):
+        """Test del formato de pesos por tenant"""
+        assert parse_weights("interactive=4, batch=0.5") == {"interactive": 4.0, "batch": 0.5}
+        assert parse_weights("") == {}
+
+    @pytest.mark.unit
+    def test_parse_weights_invalid(self):
+        """Test que un peso mal formado es un error de configuración"""
+        with pytest.raises(ValueError):
+            parse_weights("interactive")
+        with pytest.raises(ValueError):
+            parse_weights("batch=0")
+
+    @pytest.mark.unit
+    def test_normalize_tenant(self):
+        """Test que sin cabecera se usa el tenant por defecto y el nombre se acota"""
+        assert normalize_tenant(None) == DEFAULT_TENANT
+        assert normalize_tenant("  ") == DEFAULT_TENANT
+        assert len(normalize_tenant("x" * 500)) == 64
+
+
+class TestFairScheduler:
+    """Test suite para FairScheduler"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_free_slot_dispatches_immediately(self):
+        """Test que con huecos libres no hay espera"""
+        scheduler = FairScheduler(capacity=2)
+        async with scheduler.slot("a"):
+            assert scheduler.in_flight == 1
+
+        stats = scheduler.stats()
+        assert stats["in_flight"] == 0
+        assert stats["tenants"]["a"]["dispatched"] == 1
+        assert stats["tenants"]["a"]["wait_seconds"]["buckets"]["0.001"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_weighted_round_robin(self):
+        """Test que con pesos 4:1 el tenant interactivo no espera detrás del lote"""
+        scheduler = FairScheduler(capacity=1, weights={"interactive": 4, "batch": 1})
+        order = await hold_and_enqueue(scheduler, ["batch"] * 10 + ["interactive"] * 8)
+
+        assert order[:10] == ["batch"] + ["interactive"] * 4 + ["batch"] + ["interactive"] * 4
+        assert scheduler.stats()["queued"] == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_equal_weights_alternate(self):
+        """Test que sin pesos configurados los tenants se alternan"""
+        scheduler = FairScheduler(capacity=1)
+        order = await hold_and_enqueue(scheduler, ["a"] * 3 + ["b"] * 3)
+        assert order == ["a", "b", "a", "b", "a", "b"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_per_tenant_queue_limit(self):
+        """Test que una cola llena rechaza solo a su tenant"""
+        scheduler = FairScheduler(capacity=1, max_queue_per_tenant=1)
+        release = asyncio.Event()
+
+        async def call(tenant):
+            async with scheduler.slot(tenant):
+                await release.wait()
+
+        tasks = [asyncio.ensure_future(call(tenant)) for tenant in ("a", "a", "b")]
+        await asyncio.sleep(0)
+
+        with pytest.raises(TenantQueueFullError) as exc_info:
+            async with scheduler.slot("a"):
+                pass
+        assert exc_info.value.tenant == "a"
+        assert exc_info.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert scheduler.stats()["tenants"]["a"]["rejected"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """Test que cancelar una llamada en cola no pierde huecos"""
+        scheduler = FairScheduler(capacity=1)
+        release = asyncio.Event()
+
+        async def holder(tenant):
+            async with scheduler.slot(tenant):
+                await release.wait()
+
+        first = asyncio.ensure_future(holder("a"))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(holder("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await first
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert scheduler.in_flight == 0
+        assert scheduler.stats()["queued"] == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_tenant_from_context(self):
+        """Test que sin tenant explícito se usa el de la petición en curso"""
+        scheduler = FairScheduler(capacity=1)
+        token = current_tenant.set("interactive")
+        try:
+            async with scheduler.slot():
+                pass
+        finally:
+            current_tenant.reset(token)
+        assert "interactive" in scheduler.stats()["tenants"]
+
+
+class TestServiceFairQueue:
+    """Tests de la cola justa integrada en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_queue_wait_does_not_consume_attempt_timeout(self, make_genia_service):
+        """Test que esperar turno más que ATTEMPT_TIMEOUT no corta ni reintenta el intento"""
+        service = make_genia_service(MAX_CONCURRENT_REQUESTS=1, ATTEMPT_TIMEOUT=0.05)
+        response = Mock()
+        response.text = "ok"
+        release = asyncio.Event()
+
+        async def holder():
+            async with service.fair_scheduler.slot("other"):
+                await release.wait()
+
+        held = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        with patch.object(service, '_generate_content_with_config', return_value=response):
+            query = asyncio.ensure_future(service.query(QueryRequest(prompt="Hola")))
+            await asyncio.sleep(0.15)
+            release.set()
+            result = await query
+        await held
+
+        assert result.response == "ok"
+        assert service.retry_policy.retries == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_deadline_in_queue_not_retried_nor_recorded(self, make_genia_service):
+        """Test que vencer esperando turno no se reintenta ni cuenta en el circuit breaker"""
+        service = make_genia_service(MAX_CONCURRENT_REQUESTS=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with service.fair_scheduler.slot("other"):
+                await release.wait()
+
+        held = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceededError):
+            await service.retry_policy.run(
+                lambda: service._attempt("Hola", {}),
+                deadline=time.monotonic() + 0.05,
+                operation_timed=True
+            )
+        release.set()
+        await held
+
+        assert service.retry_policy.retries == 0
+        assert service.circuit_breaker.stats()["window_calls"] == 0
+
+
+class TestTenantMiddleware:
+    """Tests del tenant tomado de la cabecera del gateway"""
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query')
+    def test_header_sets_tenant(self, mock_query, client, sample_query_request):
+        """Test que la cabecera X-Tenant-ID llega al servicio como tenant en curso"""
+        seen = []
+
+        async def fake_query(request):
+            seen.append(current_tenant.get())
+            return QueryResponse(response="ok", tokens_used=1, model="gemini-1.5-flash", processing_time=0.1)
+
+        mock_query.side_effect = fake_query
+        client.post("/query", json=sample_query_request.model_dump(), headers={"X-Tenant-ID": "batch"})
+        client.post("/query", json=sample_query_request.model_dump())
+
+        assert seen == ["batch", DEFAULT_TENANT]
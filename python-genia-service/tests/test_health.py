@@ -0,0 +1,135 @@
+"""
+Tests para la salud de Gemini mantenida en memoria.
+"""
+import pytest
+import asyncio
+from unittest.mock import patch
+from health import UpstreamHealthMonitor
+from services import genia_service
+
+
+def make_monitor(probe=None, **kwargs):
+    calls = []
+
+    async def default_probe():
+        calls.append(1)
+        return True
+
+    monitor = UpstreamHealthMonitor(probe=probe or default_probe, **kwargs)
+    return monitor, calls
+
+
+class TestUpstreamHealthMonitor:
+    """Test suite para UpstreamHealthMonitor"""
+
+    @pytest.mark.unit
+    def test_passive_inference_from_traffic(self):
+        """Test que un éxito marca sano y hacen falta varios fallos seguidos para marcar caído"""
+        monitor, _ = make_monitor(failure_threshold=3)
+        assert monitor.snapshot()["status"] == "unknown"
+        assert not monitor.fresh
+
+        monitor.record_traffic(success=True)
+        assert (monitor.status, monitor.source) == ("healthy", "traffic")
+
+        monitor.record_traffic(success=False, error="APIError: 503")
+        monitor.record_traffic(success=False, error="APIError: 503")
+        assert monitor.status == "healthy"
+        monitor.record_traffic(success=False, error="APIError: 503")
+        assert monitor.status == "unhealthy"
+        assert monitor.snapshot()["last_error"] == "APIError: 503"
+
+        monitor.record_traffic(success=True)
+        assert monitor.status == "healthy"
+        assert monitor.consecutive_failures == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_concurrent_refreshes_share_one_probe(self):
+        """Test que varias comprobaciones simultáneas comparten una sola sonda"""
+        calls = []
+
+        async def slow_probe():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return True
+
+        monitor, _ = make_monitor(probe=slow_probe)
+        results = await asyncio.gather(*(monitor.refresh() for _ in range(5)))
+
+        assert results == ["healthy"] * 5
+        assert len(calls) == 1
+        assert monitor.fresh
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_probe_error_marks_unhealthy(self):
+        """Test que una sonda que falla o vence marca a Gemini como caído"""
+        async def broken_probe():
+            raise ConnectionError("connection refused")
+
+        monitor, _ = make_monitor(probe=broken_probe)
+        assert await monitor.refresh() == "unhealthy"
+        snapshot = monitor.snapshot()
+        assert snapshot["source"] == "probe"
+        assert snapshot["probes_failed"] == 1
+        assert "connection refused" in snapshot["last_error"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_background_probe_skipped_with_recent_traffic(self):
+        """Test que el sondeo en segundo plano no gasta llamadas si el tráfico ya confirma la salud"""
+        monitor, calls = make_monitor(interval=0.02, jitter=0.0)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        probes = len(calls)
+        assert probes >= 1
+
+        for _ in range(5):
+            monitor.record_traffic(success=True)
+            await asyncio.sleep(0.01)
+        assert monitor.probes_skipped >= 1
+
+        await monitor.stop()
+        assert monitor.status == "unknown"
+
+
+class TestHealthEndpoints:
+    """Tests de los endpoints de salud"""
+
+    @pytest.mark.integration
+    def test_liveness(self, client):
+        """Test que liveness responde sin depender de Gemini"""
+        response = client.get("/health/live")
+        assert response.status_code == 200
+        assert response.json()["status"] == "healthy"
+
+    @pytest.mark.integration
+    def test_readiness_follows_upstream_state(self, client):
+        """Test que readiness falla con Gemini marcado como caído o sin cliente"""
+        with patch.object(genia_service, 'client_pool') as pool:
+            pool.primary = object()
+            assert client.get("/health/ready").status_code == 200
+
+            genia_service.health_monitor.record_probe(False)
+            response = client.get("/health/ready")
+            assert response.status_code == 503
+            assert response.json()["detail"]["error"] == "not_ready"
+
+        genia_service.health_monitor.reset()
+        with patch('services.genia_service.client', None):
+            assert client.get("/health/ready").status_code == 503
+
+    @pytest.mark.integration
+    @patch('services.genia_service.health_check')
+    def test_detailed_answers_from_memory(self, mock_health_check, client):
+        """Test que con una observación reciente el health check detallado no sondea Gemini"""
+        genia_service.health_monitor.record_traffic(success=True)
+
+        response = client.get("/health/detailed")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["dependencies"]["google_gemini"] == "healthy"
+        assert data["upstream_health"]["source"] == "traffic"
+        mock_health_check.assert_not_called()
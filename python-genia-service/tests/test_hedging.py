@@ -0,0 +1,147 @@
+"""
+Tests para las peticiones hedged.
+"""
+import pytest
+import asyncio
+from unittest.mock import Mock, patch
+from hedging import HedgePolicy
+from models import QueryRequest
+from services import GeniaAPIService
+
+
+def warmed_policy(latency=0.01, **kwargs):
+    """Política con muestras suficientes para tener umbral"""
+    policy = HedgePolicy(min_samples=5, min_delay=0.0, **kwargs)
+    for _ in range(5):
+        policy.observe(latency)
+    return policy
+
+
+def scripted(delays, results=None):
+    """Operación cuyos intentos sucesivos tardan `delays[i]`; registra cancelaciones"""
+    attempts = []
+    cancelled = []
+
+    async def operation():
+        index = len(attempts)
+        attempts.append(index)
+        try:
+            await asyncio.sleep(delays[index])
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        result = (results or {}).get(index, f"intento-{index}")
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return operation, attempts, cancelled
+
+
+class TestHedgePolicy:
+    """Test suite para HedgePolicy"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_samples(self):
+        """Test que sin historial no se lanza ningún respaldo"""
+        policy = HedgePolicy(min_samples=5)
+        operation, attempts, _ = scripted([0.01])
+
+        assert await policy.run(operation) == "intento-0"
+        assert attempts == [0]
+        assert policy.hedge_delay() is None
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        """Test que el respaldo gana a un primer intento lento, que se cancela"""
+        policy = warmed_policy(budget_percent=100)
+        operation, attempts, cancelled = scripted([1.0, 0.01])
+
+        assert await policy.run(operation) == "intento-1"
+        await asyncio.sleep(0)
+        assert attempts == [0, 1]
+        assert cancelled == [0]
+        assert policy.hedges == 1
+        assert policy.hedge_wins == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_fast_primary_not_hedged(self):
+        """Test que un primer intento rápido no dispara respaldo"""
+        policy = warmed_policy(latency=0.05, budget_percent=100)
+        operation, attempts, _ = scripted([0.001])
+
+        await policy.run(operation)
+        assert attempts == [0]
+        assert policy.hedges == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_budget_limits_hedges(self):
+        """Test que el presupuesto limita la carga extra"""
+        policy = warmed_policy(budget_percent=50)
+
+        for _ in range(4):
+            operation, _, _ = scripted([0.03, 0.001])
+            await policy.run(operation)
+
+        assert policy.hedges == 2
+        assert policy.budget_denied == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_failed_attempt_falls_back_to_other(self):
+        """Test que si un intento falla se espera al otro"""
+        policy = warmed_policy(budget_percent=100)
+        operation, _, _ = scripted([0.03, 0.001], results={1: ValueError("fallo")})
+
+        assert await policy.run(operation) == "intento-0"
+        assert policy.hedge_wins == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_both_attempts_fail(self):
+        """Test que si ambos intentos fallan se propaga el error"""
+        policy = warmed_policy(budget_percent=100)
+        operation, _, _ = scripted(
+            [0.03, 0.001], results={0: ValueError("uno"), 1: ValueError("dos")}
+        )
+
+        with pytest.raises(ValueError):
+            await policy.run(operation)
+
+    @pytest.mark.unit
+    def test_threshold_tracks_percentile(self):
+        """Test que el umbral es el percentil de la ventana"""
+        policy = HedgePolicy(percentile=90, min_samples=10, min_delay=0.0, recompute_every=1)
+        for i in range(1, 101):
+            policy.observe(i / 1000)
+        assert policy.hedge_delay() == pytest.approx(0.091)
+
+
+class TestServiceHedging:
+    """Tests del hedging integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    def test_hedging_disabled_by_default(self):
+        """Test que el hedging está desactivado por defecto"""
+        service = GeniaAPIService()
+        assert service.hedge_policy is None
+        assert service.get_upstream_stats()["hedging"] == {"enabled": False}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_query_uses_hedge_policy(self, make_genia_service):
+        """Test que query pasa cada intento por la política de hedging"""
+        service = make_genia_service(HEDGE_ENABLED=True)
+        upstream_response = Mock()
+        upstream_response.text = "ok"
+
+        with patch.object(service, '_generate_content_with_config', return_value=upstream_response):
+            await service.query(QueryRequest(prompt="Hola", temperature=0.7))
+
+        stats = service.get_upstream_stats()["hedging"]
+        assert stats["calls"] == 1
+        assert stats["samples"] == 1
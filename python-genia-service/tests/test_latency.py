@@ -0,0 +1,165 @@
+"""
+Tests para los histogramas de latencia en memoria (/stats).
+"""
+import random
+import pytest
+from unittest.mock import AsyncMock, patch
+from latency import (
+    BUCKET_COUNT, MAX_MICROSECONDS, OTHER_OPERATION, LatencyHistogram, LatencyRecorder,
+    bucket_index, bucket_upper_bound, latency_recorder
+)
+from metrics import MetricsMiddleware, registry
+
+
+class TestLatencyHistogram:
+    """Test suite para los buckets y el histograma"""
+
+    @pytest.mark.unit
+    def test_bucket_bounds_and_relative_error(self):
+        """Test que cada latencia cae en un bucket cuyo límite superior la acota con error <= 1/64"""
+        for microseconds in list(range(0, 5000)) + [10**5, 123456, 10**6, 10**7, MAX_MICROSECONDS]:
+            index = bucket_index(microseconds)
+            upper = bucket_upper_bound(index)
+            assert 0 <= index < BUCKET_COUNT
+            assert microseconds <= upper
+            assert upper - microseconds <= max(microseconds, 1) / 64
+        assert bucket_index(MAX_MICROSECONDS) == BUCKET_COUNT - 1
+
+    @pytest.mark.unit
+    def test_record_and_reset(self):
+        """Test que el histograma cuenta, acota las latencias fuera de rango y se vacía"""
+        histogram = LatencyHistogram()
+        histogram.record(0.25)
+        histogram.record(-1)
+        histogram.record(1000.0)
+
+        assert histogram.count == 3
+        assert histogram.max == 1000.0
+        assert histogram.counts[0] == 1
+        assert histogram.counts[BUCKET_COUNT - 1] == 1
+
+        histogram.reset()
+        assert histogram.count == 0
+        assert sum(histogram.counts) == 0
+
+
+class TestLatencyRecorder:
+    """Tests de las ventanas deslizantes y el resumen por operación"""
+
+    @pytest.mark.unit
+    def test_percentiles_close_to_exact(self, fake_clock):
+        """Test que los percentiles quedan dentro del error de los buckets"""
+        recorder = LatencyRecorder(clock=fake_clock)
+        generator = random.Random(7)
+        samples = sorted(generator.lognormvariate(-3, 1) for _ in range(10000))
+        for seconds in samples:
+            recorder.record("upstream gemini", seconds)
+
+        window = recorder.stats()["operations"]["upstream gemini"]["1m"]
+
+        for percentile, key in ((50, "p50"), (90, "p90"), (99, "p99"), (99.9, "p99_9")):
+            exact = samples[int(len(samples) * percentile / 100) - 1]
+            assert window[key] == pytest.approx(exact, rel=1 / 50)
+        assert window["max"] == pytest.approx(samples[-1], abs=1e-6)
+
+    @pytest.mark.unit
+    def test_windows_slide_and_expire(self, fake_clock):
+        """Test que cada ventana cuenta solo sus franjas y las antiguas caducan"""
+        fake_clock.now = 1200.0  # inicio de una franja de 20 s
+        recorder = LatencyRecorder(slot_seconds=20, clock=fake_clock)
+
+        recorder.record("health_probe", 0.1)  # t = 0
+        fake_clock.now += 240
+        for _ in range(3):
+            recorder.record("health_probe", 0.2)  # t = 4 min
+        fake_clock.now += 200
+        for _ in range(6):
+            recorder.record("health_probe", 0.3)  # t = 7 min 20 s
+        fake_clock.now += 10
+
+        summary = recorder.stats("health_probe")["operations"]["health_probe"]
+        assert summary["total"] == 10
+        assert summary["1m"]["count"] == 6
+        assert summary["5m"]["count"] == 9
+        assert summary["15m"]["count"] == 10
+        assert summary["1m"]["window_seconds"] == 50.0
+        assert summary["1m"]["throughput_per_second"] == pytest.approx(6 / 50, abs=1e-3)
+        assert summary["5m"]["p50"] == pytest.approx(0.3, rel=1 / 64)
+
+        # Pasados 15 minutos sin registros no queda nada en las ventanas
+        fake_clock.now += 16 * 60
+        summary = recorder.stats()["operations"]["health_probe"]
+        assert [summary[name]["count"] for name in ("1m", "5m", "15m")] == [0, 0, 0]
+        assert "p50" not in summary["15m"]
+
+        # Una franja reutilizada del anillo no arrastra los contadores anteriores
+        recorder.record("health_probe", 0.05)
+        assert recorder.stats()["operations"]["health_probe"]["15m"]["count"] == 1
+
+    @pytest.mark.unit
+    def test_operations_capped(self, fake_clock):
+        """Test que las operaciones por encima del máximo se agrupan en _other"""
+        recorder = LatencyRecorder(max_operations=2, clock=fake_clock)
+        for name in ("a", "b", "c", "d"):
+            recorder.record(name, 0.01)
+
+        operations = recorder.stats()["operations"]
+        assert sorted(operations) == [OTHER_OPERATION, "a", "b"]
+        assert operations[OTHER_OPERATION]["total"] == 2
+        assert recorder.stats("c")["operations"] == {}
+
+
+class TestStatsEndpoint:
+    """Tests del endpoint /stats"""
+
+    @pytest.mark.integration
+    def test_reports_http_routes(self, client):
+        """Test que /stats resume la latencia de las rutas HTTP por plantilla"""
+        for i in range(3):
+            client.delete(f"/prefixes/no-existe-{i}")
+
+        response = client.get("/stats", params={"operation": "http DELETE /prefixes/{name}"})
+
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["percentile_error"] == pytest.approx(1 / 64, abs=1e-4)
+        summary = data["operations"]["http DELETE /prefixes/{name}"]
+        assert summary["1m"]["count"] >= 3
+        assert set(summary["1m"]) >= {"p50", "p90", "p99", "p99_9", "throughput_per_second"}
+        assert not any("no-existe" in name for name in latency_recorder.stats()["operations"])
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_routes_recorded_with_prometheus_disabled(self, fake_clock):
+        """Test que con METRICS_ENABLED desactivado las rutas siguen llegando a /stats"""
+        recorder = LatencyRecorder(clock=fake_clock)
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            pass
+
+        labels = {"method": "GET", "route": "/health", "status": "204"}
+        before = registry.get_sample_value("genia_http_requests_total", labels) or 0.0
+        middleware = MetricsMiddleware(app, known_paths=lambda: ["/health"], recorder=recorder, prometheus=False)
+        await middleware({"type": "http", "method": "GET", "path": "/health"}, None, send)
+
+        assert recorder.stats()["operations"]["http GET /health"]["total"] == 1
+        assert (registry.get_sample_value("genia_http_requests_total", labels) or 0.0) == before
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_health_probe_recorded(self, genia_service):
+        """Test que la sonda de salud del monitor registra su latencia, también si falla"""
+        service = genia_service
+        before = latency_recorder.stats("health_probe")["operations"].get("health_probe", {"total": 0})["total"]
+
+        with patch.object(service, 'health_check', AsyncMock(return_value=True)):
+            assert await service.health_monitor.probe() is True
+        with patch.object(service, 'health_check', AsyncMock(side_effect=RuntimeError("caído"))):
+            with pytest.raises(RuntimeError):
+                await service.health_monitor.probe()
+
+        assert latency_recorder.stats("health_probe")["operations"]["health_probe"]["total"] == before + 2
@@ -0,0 +1,101 @@
+"""
+Tests para el muestreo de logs de acceso y rendimiento.
+"""
+import pytest
+import tempfile
+from pathlib import Path
+from log_sampling import LogSampler, parse_sampling
+from logging_config import log_api_call, log_performance, sampling_stats, setup_logging, shutdown_logging
+
+
+class TestLogSampler:
+    """Test suite para LogSampler"""
+
+    @pytest.mark.unit
+    def test_parse_specs(self):
+        """Test que se aceptan las especificaciones válidas y se rechazan las demás"""
+        assert not parse_sampling("").enabled
+        assert not parse_sampling("1").enabled
+        assert parse_sampling("1/100").every == 100
+        assert parse_sampling("250/s").rate == 250.0
+        assert parse_sampling(" 1 / 10 ").mode == "1/10"
+
+        for spec in ("abc", "2/10", "1/0", "10/m"):
+            with pytest.raises(ValueError):
+                parse_sampling(spec)
+
+    @pytest.mark.unit
+    def test_one_in_n_keeps_first_of_each_group(self):
+        """Test que 1/N escribe el primer registro de cada grupo de N"""
+        sampler = LogSampler(every=5)
+
+        decisions = [sampler.allow() for _ in range(10)]
+
+        assert decisions == [True, False, False, False, False] * 2
+        assert sampler.stats() == {"mode": "1/5", "kept": 2, "suppressed": 8}
+
+    @pytest.mark.unit
+    def test_token_bucket_limits_rate(self, fake_clock):
+        """Test que el cubo de tokens deja pasar R registros por segundo con ráfagas de hasta R"""
+        sampler = LogSampler(rate=2, clock=fake_clock)
+
+        assert [sampler.allow() for _ in range(3)] == [True, True, False]
+        fake_clock.now += 0.5
+        assert [sampler.allow() for _ in range(2)] == [True, False]
+        fake_clock.now += 10
+        assert [sampler.allow() for _ in range(3)] == [True, True, False]
+
+    @pytest.mark.unit
+    def test_report_per_window(self, fake_clock):
+        """Test que el informe de suprimidos sale una vez por ventana y solo si hubo supresiones"""
+        sampler = LogSampler(every=2, clock=fake_clock)
+        for _ in range(6):
+            sampler.allow()
+
+        assert sampler.report(60) is None
+        fake_clock.now += 60
+        assert sampler.report(60) == (3, 3, 60.0)
+        assert sampler.report(60, force=True) is None
+
+
+class TestSampledHelpers:
+    """Tests del muestreo aplicado a log_api_call y log_performance"""
+
+    @pytest.mark.unit
+    def test_errors_and_slow_events_always_written(self):
+        """Test que los errores y los eventos SLOW se escriben siempre y los suprimidos se informan"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            setup_logging(
+                log_level="DEBUG",
+                log_dir=temp_dir,
+                enable_console=False,
+                log_file="sampled.log",
+                use_queue=False,
+                sampling={"api_calls": "1/10", "performance": "1/1000"}
+            )
+            for _ in range(20):
+                log_api_call("GET", "/health", 200, 0.001)
+            log_api_call("POST", "/query", 503, 1.2)
+            log_api_call("POST", "/query", 500, 0.4)
+            for _ in range(5):
+                log_performance("gemini_api_call", 0.5)
+            log_performance("gemini_api_call", 7.5)
+
+            assert sampling_stats()["api_calls"] == {"mode": "1/10", "kept": 2, "suppressed": 18}
+            shutdown_logging()
+
+            lines = (Path(temp_dir) / "sampled.log").read_text(encoding="utf-8").splitlines()
+            assert sum("GET /health" in line for line in lines) == 2
+            assert sum("POST /query" in line for line in lines) == 2
+            assert sum("FAST:" in line for line in lines) == 1
+            assert sum("SLOW:" in line for line in lines) == 1
+            assert any("18 api_calls records suppressed, 2 written" in line for line in lines)
+            assert any("4 performance records suppressed, 1 written" in line for line in lines)
+
+    @pytest.mark.unit
+    def test_sampling_disabled_by_default(self):
+        """Test que sin configuración no se muestrea nada"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            setup_logging(log_dir=temp_dir, enable_console=False, use_queue=False)
+
+            assert sampling_stats() == {}
@@ -2,16 +2,25 @@
 Tests para el sistema de logging configurado
 """
 import pytest
+import json
 import logging
+import queue
 import tempfile
+import threading
+import time
 import os
 from pathlib import Path
+from unittest.mock import patch
 import sys
 
 # Agregar src al path para las importaciones
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from logging_config import setup_logging, get_logger, log_function_call, log_api_call, log_performance
+from logging_config import (
+    setup_logging, get_logger, log_function_call, log_api_call, log_performance,
+    BoundedQueueHandler, FlushingQueueListener, queue_stats, shutdown_logging,
+    Lazy, get_event_logger
+)
 
 
 class TestLoggingConfig:
@@ -165,5 +174,197 @@ class TestLoggingIntegration:
             assert len(log_files) >= 1  # Al menos el archivo principal
 
 
+
+class SlowHandler(logging.Handler):
+    """Handler que tarda en escribir y anota desde qué thread lo hace"""
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.threads.add(threading.current_thread().name)
+        self.messages.append(record.getMessage())
+
+
+class TestLoggingQueue:
+    """Test cases para el logging a través de una cola (QueueHandler/QueueListener)"""
+
+    def test_handlers_run_off_the_calling_thread(self):
+        """Test que con cola el archivo lo escribe el listener y todo queda escrito al cerrar"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = setup_logging(
+                log_level="INFO",
+                log_dir=temp_dir,
+                enable_console=False,
+                enable_file=True,
+                log_file="queued.log",
+                use_queue=True
+            )
+            assert [type(handler) for handler in root.handlers] == [BoundedQueueHandler]
+
+            logger = get_logger("queue_test")
+            for i in range(200):
+                logger.info(f"queued message {i}")
+            shutdown_logging()
+
+            content = (Path(temp_dir) / "queued.log").read_text(encoding="utf-8")
+            assert "queued message 199" in content
+            assert queue_stats() == {"enabled": False}
+
+    def test_shutdown_tolerates_closed_streams(self):
+        """Test que cerrar el logging con la consola ya cerrada (atexit) no lanza ValueError"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            console = open(Path(temp_dir) / "stdout.txt", "w", encoding="utf-8")
+            with patch.object(sys, "stdout", console):
+                setup_logging(log_level="INFO", log_dir=temp_dir, enable_console=True, enable_file=False, use_queue=True)
+            console.close()
+
+            shutdown_logging()
+            assert queue_stats() == {"enabled": False}
+
+    def test_setup_without_queue_attaches_handlers_directly(self):
+        """Test que sin cola los handlers se añaden al logger raíz como antes"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = setup_logging(log_dir=temp_dir, enable_console=True, enable_file=True, use_queue=False)
+
+            assert logging.handlers.RotatingFileHandler in [type(handler) for handler in root.handlers]
+            assert not any(isinstance(handler, BoundedQueueHandler) for handler in root.handlers)
+
+    def test_drop_policy_counts_discarded_records(self):
+        """Test que con la cola llena la política drop descarta y cuenta sin bloquear"""
+        handler = BoundedQueueHandler(queue.Queue(maxsize=2), policy="drop")
+        logger = logging.getLogger("drop_test")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            for i in range(5):
+                logger.warning(f"message {i}")
+        finally:
+            logger.removeHandler(handler)
+
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_block_policy_keeps_every_record(self):
+        """Test que la política block espera al listener y no pierde registros"""
+        slow = SlowHandler(delay=0.001)
+        handler = BoundedQueueHandler(queue.Queue(maxsize=1), policy="block")
+        listener = FlushingQueueListener(handler.queue, slow)
+        logger = logging.getLogger("block_test")
+        logger.propagate = False
+        logger.addHandler(handler)
+        listener.start()
+        try:
+            for i in range(20):
+                logger.info(f"message {i}")
+        finally:
+            logger.removeHandler(handler)
+            listener.stop()
+
+        assert slow.messages == [f"message {i}" for i in range(20)]
+        assert handler.dropped == 0
+        assert threading.current_thread().name not in slow.threads
+
+    def test_unknown_policy_rejected(self):
+        """Test que una política desconocida se rechaza al configurar"""
+        with pytest.raises(ValueError):
+            BoundedQueueHandler(queue.Queue(maxsize=1), policy="overwrite")
+
+
+
+def read_json_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+class TestStructuredLogging:
+    """Test cases para el modo JSON (structlog) y los campos Lazy"""
+
+    def test_json_mode_renders_events_and_stdlib_records(self):
+        """Test que en modo JSON tanto los eventos como los logs de stdlib salen como objetos JSON"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            setup_logging(
+                log_level="INFO",
+                log_dir=temp_dir,
+                enable_console=False,
+                log_file="json.log",
+                use_queue=True,
+                log_format="json"
+            )
+            get_event_logger("json_test").info("query_done", request_id="query_1", tokens=Lazy(len, "abc"))
+            get_logger("json_test").warning("plain %s", "message")
+            shutdown_logging()
+
+            records = read_json_lines(Path(temp_dir) / "json.log")
+            event = next(record for record in records if record["event"] == "query_done")
+            assert event["tokens"] == 3
+            assert event["request_id"] == "query_1"
+            assert (event["logger"], event["level"]) == ("json_test", "info")
+            plain = next(record for record in records if record["event"] == "plain message")
+            assert plain["level"] == "warning"
+            assert plain["timestamp"].endswith("Z")
+
+    def test_disabled_level_skips_lazy_fields(self):
+        """Test que un evento de un nivel desactivado no calcula sus campos Lazy"""
+        calls = []
+
+        def expensive():
+            calls.append(1)
+            return {"big": "dict"}
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            setup_logging(log_level="INFO", log_dir=temp_dir, enable_console=False, use_queue=False)
+            events = get_event_logger("lazy_test")
+
+            events.debug("request_headers", headers=Lazy(expensive))
+            assert calls == []
+
+            events.info("request_headers", headers=Lazy(expensive))
+            assert calls == [1]
+
+    def test_text_mode_renders_key_values(self):
+        """Test que en modo texto los eventos salen como "evento clave=valor" con el formato de siempre"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            setup_logging(
+                log_level="INFO", log_dir=temp_dir, enable_console=False, log_file="text.log", use_queue=False
+            )
+            get_event_logger("text_test").info("query_done", request_id="query_1", tokens=3)
+
+            content = (Path(temp_dir) / "text.log").read_text(encoding="utf-8")
+            assert "| text_test | INFO |" in content
+            assert "query_done request_id=query_1 tokens=3" in content
+
+    def test_helpers_emit_structured_fields(self):
+        """Test que log_api_call y log_performance emiten campos estructurados en modo JSON"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            setup_logging(
+                log_level="INFO",
+                log_dir=temp_dir,
+                enable_console=False,
+                log_file="helpers.log",
+                use_queue=False,
+                log_format="json"
+            )
+            log_api_call("POST", "/query", 503, 1.25)
+            log_performance("gemini_api_call", 6.0, {"model": "gemini-1.5-flash"})
+            log_performance("fast_operation", 0.1)
+
+            records = read_json_lines(Path(temp_dir) / "helpers.log")
+            api_call = next(record for record in records if record["event"] == "api_call")
+            assert (api_call["status_code"], api_call["level"]) == (503, "error")
+            performance = [record for record in records if record["event"] == "performance"]
+            assert len(performance) == 1
+            assert performance[0]["speed"] == "SLOW"
+            assert performance[0]["details"] == {"model": "gemini-1.5-flash"}
+
+    def test_unknown_format_rejected(self):
+        """Test que un formato desconocido se rechaza al configurar"""
+        with pytest.raises(ValueError):
+            setup_logging(enable_file=False, log_format="xml")
+
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
@@ -199,4 +199,145 @@ def test_cors_headers(client):
     """Test que CORS está configurado correctamente"""
     response = client.options("/", headers={"Origin": "http://localhost:3000"})
     # FastAPI testclient no simula completamente CORS, pero podemos verificar que no hay errores
-    assert response.status_code in [200, 405]  # 405 es aceptable para OPTIONS
\ No newline at end of file
+    assert response.status_code in [200, 405]  # 405 es aceptable para OPTIONS
+
+@pytest.mark.unit
+@patch('services.genia_service.query_stream')
+def test_query_stream_endpoint(mock_query_stream, client, sample_query_request):
+    """Test del endpoint de streaming SSE"""
+    async def fake_stream(request):
+        yield {"event": "chunk", "data": {"index": 0, "text": "Hola"}}
+        yield {"event": "done", "data": {"tokens_used": 1, "finish_reason": "stop"}}
+
+    mock_query_stream.side_effect = fake_stream
+
+    response = client.post("/query/stream", json=sample_query_request.model_dump())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'event: chunk\ndata: {"index": 0, "text": "Hola"}' in response.text
+    assert "event: done" in response.text
+
+
+@pytest.mark.unit
+@patch('services.genia_service.query_stream')
+def test_query_stream_endpoint_error_event(mock_query_stream, client, sample_query_request):
+    """Test que un error durante el stream se emite como evento SSE"""
+    async def failing_stream(request):
+        yield {"event": "chunk", "data": {"index": 0, "text": "Hola"}}
+        raise Exception("Gemini desconectado")
+
+    mock_query_stream.side_effect = failing_stream
+
+    response = client.post("/query/stream", json=sample_query_request.model_dump())
+    assert response.status_code == 200
+    assert "event: error" in response.text
+    assert "Gemini desconectado" in response.text
+
+
+@pytest.mark.unit
+def test_query_stream_endpoint_without_client(client, sample_query_request):
+    """Test que el streaming devuelve 500 sin cliente configurado"""
+    with patch('services.genia_service.client', None):
+        response = client.post("/query/stream", json=sample_query_request.model_dump())
+    assert response.status_code == 500
+
+
+@pytest.mark.unit
+@patch('services.genia_service.query')
+def test_query_batch_endpoint_ordered(mock_query, client):
+    """Test del endpoint de lote con resultados en orden"""
+    from models import QueryResponse
+
+    async def fake_query(request):
+        if request.prompt == "falla":
+            raise Exception("error puntual")
+        return QueryResponse(response=f"R: {request.prompt}", tokens_used=1,
+                             model="gemini-1.5-flash", processing_time=0.01)
+
+    mock_query.side_effect = fake_query
+    payload = {"items": [{"prompt": "uno"}, {"prompt": "falla"}, {"prompt": "uno"}], "concurrency": 2}
+
+    response = client.post("/query/batch", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["index"] for r in data["results"]] == [0, 1, 2]
+    assert data["total"] == 3
+    assert data["unique"] == 2
+    assert data["succeeded"] == 2
+    assert data["failed"] == 1
+    assert data["results"][1]["error"]
+
+
+@pytest.mark.unit
+@patch('services.genia_service.query')
+def test_query_batch_endpoint_ndjson(mock_query, client):
+    """Test del endpoint de lote en modo NDJSON"""
+    import json
+    from models import QueryResponse
+
+    async def fake_query(request):
+        return QueryResponse(response="ok", tokens_used=1, model="gemini-1.5-flash", processing_time=0.01)
+
+    mock_query.side_effect = fake_query
+    payload = {"items": [{"prompt": "uno"}, {"prompt": "dos"}]}
+
+    response = client.post("/query/batch?stream=true", json=payload)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert sorted(line["index"] for line in lines) == [0, 1]
+
+
+@pytest.mark.unit
+def test_query_batch_validation_empty(client):
+    """Test validación de lote vacío"""
+    response = client.post("/query/batch", json={"items": []})
+    assert response.status_code == 422
+
+
+@pytest.mark.unit
+def test_upstream_stats_endpoint(client):
+    """Test del endpoint de estadísticas de llamadas a Gemini"""
+    response = client.get("/upstream/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert "attempts_histogram" in data["data"]["retries"]
+
+
+@pytest.mark.unit
+@patch('services.genia_service.query')
+def test_query_endpoint_circuit_open(mock_query, client, sample_query_request):
+    """Test que con el circuito abierto /query responde 503 con Retry-After"""
+    from circuit_breaker import CircuitOpenError
+
+    mock_query.side_effect = CircuitOpenError(retry_after=12.3)
+
+    response = client.post("/query", json=sample_query_request.model_dump())
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "13"
+    assert response.json()["detail"]["error"] == "upstream_unavailable"
+
+
+@pytest.mark.integration
+@patch('services.genia_service.health_check')
+def test_detailed_health_reports_circuit_state(mock_health_check, client):
+    """Test que el health check detallado expone el estado del circuito"""
+    mock_health_check.return_value = True
+
+    response = client.get("/health/detailed")
+    assert response.status_code == 200
+    assert response.json()["circuit_breaker"]["state"] == "closed"
+
+
+@pytest.mark.unit
+@patch('services.genia_service.query')
+def test_query_endpoint_rate_limited(mock_query, client, sample_query_request):
+    """Test que sin cuota a tiempo /query responde 429 con Retry-After"""
+    from rate_limit import RateLimitExceededError
+
+    mock_query.side_effect = RateLimitExceededError("sin cuota", retry_after=4.2)
+
+    response = client.post("/query", json=sample_query_request.model_dump())
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "5"
@@ -0,0 +1,139 @@
+"""
+Tests para las métricas Prometheus (/metrics).
+"""
+import re
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from metrics import registry
+from models import QueryRequest
+from prefix_cache import UnknownPrefixError
+
+
+def sample(name, **labels):
+    return registry.get_sample_value(name, labels) or 0.0
+
+
+class TestMetricsEndpoint:
+    """Tests del endpoint /metrics y del middleware HTTP"""
+
+    @pytest.mark.integration
+    def test_http_latency_labelled_by_route_template(self, client):
+        """Test que la latencia HTTP se etiqueta con la plantilla de la ruta, no con la URL"""
+        labels = {"method": "DELETE", "route": "/prefixes/{name}", "status": "404"}
+        before = sample("genia_http_request_duration_seconds_count", **labels)
+
+        client.delete("/prefixes/no-existe-1")
+        client.delete("/prefixes/no-existe-2")
+
+        assert sample("genia_http_request_duration_seconds_count", **labels) == before + 2
+        body = client.get("/metrics").text
+        assert "no-existe-1" not in body
+        assert "request_id" not in body
+        assert re.search(r"query_\d", body) is None
+
+    @pytest.mark.integration
+    def test_unknown_paths_share_one_label(self, client):
+        """Test que las rutas desconocidas cuentan como unmatched y no crean series nuevas"""
+        labels = {"method": "GET", "route": "unmatched", "status": "404"}
+        before = sample("genia_http_requests_total", **labels)
+
+        for i in range(3):
+            client.get(f"/no-existe/{i}")
+
+        assert sample("genia_http_requests_total", **labels) == before + 3
+        assert "/no-existe/" not in client.get("/metrics").text
+
+    @pytest.mark.integration
+    def test_exposition_format_and_service_state(self, client):
+        """Test que /metrics usa el formato de Prometheus e incluye el estado del servicio"""
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "genia_http_requests_in_flight" in response.text
+        assert "genia_circuit_state" in response.text
+        assert 'genia_response_cache_events_total{event="hits"}' in response.text
+
+    @pytest.mark.integration
+    def test_disabled(self, client):
+        """Test que con las métricas desactivadas /metrics responde 404"""
+        with patch('config.settings.METRICS_ENABLED', False):
+            assert client.get("/metrics").status_code == 404
+
+
+class TestUpstreamMetrics:
+    """Tests de las métricas de las llamadas a Gemini"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_query_records_latency_waits_and_tokens(self, genia_service):
+        """Test que una consulta registra latencia de Gemini, esperas en cola y tokens"""
+        service = genia_service
+        service.cache = None
+        model = service.model_name
+        upstream_response = Mock()
+        upstream_response.text = "respuesta"
+        upstream_response.usage_metadata = Mock(prompt_token_count=7, candidates_token_count=3, total_token_count=10)
+
+        before = {
+            "latency": sample("genia_upstream_request_duration_seconds_count", model=model, outcome="success"),
+            "dispatch": sample("genia_queue_wait_seconds_count", stage="dispatch"),
+            "thread": sample("genia_queue_wait_seconds_count", stage="thread_pool"),
+            "input": sample("genia_upstream_tokens_total", model=model, direction="input"),
+            "output": sample("genia_upstream_tokens_total", model=model, direction="output")
+        }
+
+        with patch.object(service, '_generate_content_with_config', return_value=upstream_response) as mock_generate:
+            await service.query(QueryRequest(prompt="Hola"))
+
+        assert mock_generate.call_args.args[0] == "Hola"
+        assert sample("genia_upstream_request_duration_seconds_count", model=model, outcome="success") == before["latency"] + 1
+        assert sample("genia_queue_wait_seconds_count", stage="dispatch") == before["dispatch"] + 1
+        assert sample("genia_queue_wait_seconds_count", stage="thread_pool") == before["thread"] + 1
+        assert sample("genia_upstream_tokens_total", model=model, direction="input") == before["input"] + 7
+        assert sample("genia_upstream_tokens_total", model=model, direction="output") == before["output"] + 3
+        assert sample("genia_upstream_requests_in_flight", model=model) == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cancelled_call_counted_not_sampled(self, genia_service):
+        """Test que una llamada cancelada (hedge perdedor) no alimenta latencias ni el enrutado"""
+        service = genia_service
+        model = service.model_name
+        started = threading.Event()
+        before = {
+            "cancelled": sample("genia_upstream_requests_cancelled_total", model=model),
+            "latency": sample("genia_upstream_request_duration_seconds_count", model=model, outcome="cancelled")
+        }
+
+        def slow_generate(*args):
+            started.set()
+            time.sleep(0.1)
+
+        with patch.object(service, '_generate_content_with_config', side_effect=slow_generate):
+            call = asyncio.ensure_future(service._generate("Hola", {}))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+
+        assert sample("genia_upstream_requests_cancelled_total", model=model) == before["cancelled"] + 1
+        assert sample("genia_upstream_request_duration_seconds_count", model=model, outcome="cancelled") == before["latency"]
+        assert service.router.stats()["models"][model]["calls"] == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_failed_prefix_bind_does_not_leak_in_flight(self, genia_service):
+        """Test que un fallo al preparar el prefijo no deja la llamada contada como en curso"""
+        service = genia_service
+        model = service.model_name
+
+        with patch.object(service, '_generate_content_with_config') as mock_generate:
+            with pytest.raises(UnknownPrefixError):
+                await service._generate("Hola", {}, prefix="no-existe")
+
+        mock_generate.assert_not_called()
+        assert sample("genia_upstream_requests_in_flight", model=model) == 0
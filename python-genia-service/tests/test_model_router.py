@@ -0,0 +1,151 @@
+"""
+Tests para el enrutado entre modelos Gemini con fallback.
+"""
+import pytest
+from unittest.mock import Mock, patch
+from pydantic import ValidationError
+from google.genai import errors as genai_errors
+from model_router import ModelRouter
+from models import QueryRequest
+from retry import RetryPolicy
+from services import GeniaAPIService
+
+FLASH = "gemini-1.5-flash"
+PRO = "gemini-1.5-pro"
+
+
+def make_router(**kwargs):
+    options = dict(primary=FLASH, secondary=PRO, long_prompt_tokens=1000, long_output_tokens=4096, health_window=5)
+    options.update(kwargs)
+    return ModelRouter(**options)
+
+
+class TestModelRouter:
+    """Test suite para ModelRouter"""
+
+    @pytest.mark.unit
+    def test_default_route_is_primary_with_fallback(self):
+        """Test que por defecto se usa el primario y el secundario queda de fallback"""
+        decision = make_router().route(prompt_tokens=10, max_tokens=256)
+        assert (decision.model, decision.fallback, decision.reason) == (FLASH, PRO, "default")
+        assert decision.model_for_attempt(1) == FLASH
+        assert decision.model_for_attempt(2) == PRO
+
+    @pytest.mark.unit
+    def test_request_shape_and_quality_hint(self):
+        """Test del enrutado por pista de calidad, prompt largo y max_tokens"""
+        router = make_router()
+        assert router.route(10, 256, quality="high").model == PRO
+        assert router.route(5000, 256, quality="fast").model == FLASH
+        assert router.route(5000, 256).reason == "long_prompt"
+        assert router.route(10, 8192).reason == "long_output"
+
+    @pytest.mark.unit
+    def test_single_model_never_falls_back(self):
+        """Test que sin modelo secundario todo va al primario"""
+        router = ModelRouter(primary=FLASH, secondary="")
+        decision = router.route(10, 8192, quality="high")
+        assert (decision.model, decision.fallback) == (FLASH, None)
+        assert decision.model_for_attempt(3) == FLASH
+
+    @pytest.mark.unit
+    def test_failing_primary_diverts_and_probes(self):
+        """Test que con el primario fallando se desvía al secundario, con sondeos"""
+        router = make_router(probe_every=4)
+        for _ in range(5):
+            router.observe(FLASH, 0.1, failed=True)
+        assert router.is_degraded(FLASH)
+
+        models = [router.route(10, 256).model for _ in range(8)]
+        assert models.count(PRO) == 6
+        assert models.count(FLASH) == 2
+
+        stats = router.stats()["models"]
+        assert stats[PRO]["routed"] == {"degraded": 6}
+        assert stats[FLASH]["routed"] == {"probe": 2}
+
+    @pytest.mark.unit
+    def test_latency_slo_breach_is_degraded(self):
+        """Test que un p95 por encima del SLO también degrada al modelo"""
+        router = make_router(latency_slo=1.0)
+        for latency in (0.2, 0.3, 3.0, 4.0, 5.0):
+            router.observe(FLASH, latency, failed=False)
+
+        assert router.is_degraded(FLASH)
+        stats = router.stats()["models"][FLASH]
+        assert stats["latency_p50"] == 3.0
+        assert stats["recent_latency_p95"] == 5.0
+        assert stats["recent_error_rate"] == 0
+
+    @pytest.mark.unit
+    def test_both_degraded_keeps_preference(self):
+        """Test que si ambos están degradados no se desvía"""
+        router = make_router()
+        for _ in range(5):
+            router.observe(FLASH, 0.1, failed=True)
+            router.observe(PRO, 0.1, failed=True)
+        assert router.route(10, 256).model == FLASH
+
+    @pytest.mark.unit
+    def test_invalid_quality_hint_rejected(self):
+        """Test que una pista de calidad desconocida no pasa la validación"""
+        assert QueryRequest(prompt="Hola", quality="high").quality.value == "high"
+        with pytest.raises(ValidationError):
+            QueryRequest(prompt="Hola", quality="ultra")
+
+
+class TestServiceRouting:
+    """Tests del enrutado integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_retry_falls_back_to_secondary(self, make_genia_service):
+        """Test que si el primario falla el reintento va al secundario"""
+        service = make_genia_service(GEMINI_SECONDARY_MODEL=PRO)
+        service.cache = None
+        service.retry_policy = RetryPolicy(max_retries=1, base_delay=0.001, max_delay=0.001)
+        upstream_response = Mock()
+        upstream_response.text = "Respuesta del secundario"
+        unavailable = genai_errors.APIError(503, {"error": {"message": "unavailable"}}, Mock())
+
+        with patch.object(
+            service, '_generate_content_with_config',
+            side_effect=[unavailable, upstream_response]
+        ) as mock_generate:
+            response = await service.query(QueryRequest(prompt="Hola"))
+
+        assert [call.args[2] for call in mock_generate.call_args_list] == [FLASH, PRO]
+        assert response.model == PRO
+        routing = service.get_upstream_stats()["routing"]["models"]
+        assert routing[FLASH]["failures"] == 1
+        assert routing[PRO]["fallbacks"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_quality_hint_selects_secondary(self, make_genia_service):
+        """Test que quality=high envía la consulta al modelo secundario"""
+        service = make_genia_service(GEMINI_SECONDARY_MODEL=PRO)
+        upstream_response = Mock()
+        upstream_response.text = "ok"
+
+        with patch.object(service, '_generate_content_with_config', return_value=upstream_response):
+            response = await service.query(QueryRequest(prompt="Hola", quality="high"))
+
+        assert response.model == PRO
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cache_keyed_by_routed_model(self, make_genia_service):
+        """Test que una consulta desviada al secundario no recibe la respuesta cacheada del primario"""
+        service = make_genia_service(GEMINI_SECONDARY_MODEL=PRO)
+        upstream_response = Mock()
+        upstream_response.text = "ok"
+
+        with patch.object(service, '_generate_content_with_config', return_value=upstream_response) as mock_generate:
+            first = await service.query(QueryRequest(prompt="Hola", temperature=0))
+            for _ in range(service.router.health[FLASH]._outcomes.maxlen):
+                service.router.observe(FLASH, 0.1, failed=True)
+            second = await service.query(QueryRequest(prompt="Hola", temperature=0))
+
+        assert (first.model, second.model) == (FLASH, PRO)
+        assert mock_generate.call_count == 2
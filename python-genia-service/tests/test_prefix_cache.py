@@ -0,0 +1,273 @@
+"""
+Tests para el registro de prefijos cacheados en Gemini (cached content).
+"""
+import pytest
+import asyncio
+from unittest.mock import Mock, patch
+from cache import request_fingerprint
+from models import QueryRequest
+from prefix_cache import (
+    CREATE_RETRY_SECONDS, BaseCachedContentBackend, PrefixCacheRegistry, UnknownPrefixError
+)
+from services import GeniaAPIService, genia_service
+
+INSTRUCTIONS = "Eres un asistente de soporte. Responde siempre en español. " * 50
+
+
+class FakeCachedContentBackend(BaseCachedContentBackend):
+    """Backend local: registra las operaciones en lugar de llamar a Gemini"""
+
+    def __init__(self, fail_create=False, delay=0.0):
+        self.fail_create = fail_create
+        self.delay = delay
+        self.created = []
+        self.refreshed = []
+        self.deleted = []
+
+    async def create(self, client, model, content, ttl_seconds, display_name):
+        await asyncio.sleep(self.delay)
+        if self.fail_create:
+            raise RuntimeError("Cached content is too small")
+        self.created.append((model, content))
+        return f"cachedContents/{len(self.created)}"
+
+    async def refresh(self, client, handle, ttl_seconds):
+        self.refreshed.append(handle)
+
+    async def delete(self, client, handle):
+        self.deleted.append(handle)
+
+
+def make_registry(backend=None, **kwargs):
+    backend = backend or FakeCachedContentBackend()
+    return PrefixCacheRegistry(backend, **kwargs), backend
+
+
+class TestPrefixCacheRegistry:
+    """Test suite para PrefixCacheRegistry"""
+
+    @pytest.mark.unit
+    def test_incomplete_backend_rejected(self):
+        """Test que un backend sin todos los métodos de la interfaz no se puede instanciar"""
+        class CreateOnlyBackend(BaseCachedContentBackend):
+            async def create(self, client, model, content, ttl_seconds, display_name):
+                return "cachedContents/1"
+
+        with pytest.raises(TypeError):
+            CreateOnlyBackend()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_prefix_cached_once_and_reused(self):
+        """Test que el prefijo se cachea una vez por modelo y key y después se reutiliza"""
+        registry, backend = make_registry()
+        entry = await registry.register("soporte", INSTRUCTIONS)
+
+        bindings = [await registry.bind("soporte", "gemini-1.5-flash", "client", "key-1") for _ in range(3)]
+        await registry.bind("soporte", "gemini-1.5-pro", "client", "key-1")
+
+        assert [binding.cached_content for binding in bindings] == ["cachedContents/1"] * 3
+        assert backend.created == [("gemini-1.5-flash", INSTRUCTIONS), ("gemini-1.5-pro", INSTRUCTIONS)]
+        assert bindings[0].apply({"temperature": 0.2}) == {"temperature": 0.2, "cached_content": "cachedContents/1"}
+        stats = registry.stats()
+        assert stats["cached_calls"] == 4
+        assert stats["handles"] == 2
+        assert stats["bytes_saved"] == 4 * entry.size_bytes
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_concurrent_first_use_creates_once(self):
+        """Test que varias consultas simultáneas comparten la creación del handle"""
+        registry, backend = make_registry(FakeCachedContentBackend(delay=0.01))
+        await registry.register("soporte", INSTRUCTIONS)
+
+        bindings = await asyncio.gather(*(registry.bind("soporte", "m", "client") for _ in range(5)))
+
+        assert len(backend.created) == 1
+        assert {binding.cached_content for binding in bindings} == {"cachedContents/1"}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cancelled_creation_deletes_orphan_handle(self):
+        """Test que si el único interesado se cancela, el cached content creado se borra"""
+        registry, backend = make_registry(FakeCachedContentBackend(delay=0.05))
+        entry = await registry.register("soporte", INSTRUCTIONS)
+
+        waiter = asyncio.ensure_future(registry.bind("soporte", "m", "client"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.1)
+
+        assert backend.created == [("m", INSTRUCTIONS)]
+        assert backend.deleted == ["cachedContents/1"]
+        assert entry.handles == {}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_ttl_refresh_and_recreate(self, fake_clock):
+        """Test que el TTL se renueva antes de caducar y un handle caducado se recrea"""
+        registry, backend = make_registry(ttl_seconds=600, refresh_margin=60, clock=fake_clock)
+        await registry.register("soporte", INSTRUCTIONS)
+        await registry.bind("soporte", "m", "client")
+
+        fake_clock.now += 500
+        await registry.bind("soporte", "m", "client")
+        assert backend.refreshed == []
+
+        fake_clock.now += 50
+        await registry.bind("soporte", "m", "client")
+        assert backend.refreshed == ["cachedContents/1"]
+
+        fake_clock.now += 601
+        binding = await registry.bind("soporte", "m", "client")
+        assert binding.cached_content == "cachedContents/2"
+        assert registry.stats()["refreshes"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_lru_eviction_deletes_handles(self):
+        """Test que al superar el máximo se expulsa el prefijo menos usado y se borra su handle"""
+        registry, backend = make_registry(max_entries=2)
+        await registry.register("a", INSTRUCTIONS)
+        await registry.register("b", INSTRUCTIONS + "b")
+        await registry.bind("a", "m", "client")
+        await registry.bind("b", "m", "client")
+        await registry.bind("a", "m", "client")
+
+        await registry.register("c", INSTRUCTIONS + "c")
+
+        assert [info["name"] for info in registry.list()] == ["a", "c"]
+        assert backend.deleted == ["cachedContents/2"]
+        assert registry.stats()["evictions"] == 1
+        with pytest.raises(UnknownPrefixError):
+            registry.get("b")
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_uncacheable_prefix_sent_inline(self, fake_clock):
+        """Test que si Gemini no cachea el prefijo se envía completo y no se reintenta enseguida"""
+        registry, backend = make_registry(FakeCachedContentBackend(fail_create=True), clock=fake_clock)
+        await registry.register("soporte", INSTRUCTIONS)
+
+        binding = await registry.bind("soporte", "m", "client")
+        assert binding.apply(None) == {"system_instruction": INSTRUCTIONS}
+
+        backend.fail_create = False
+        await registry.bind("soporte", "m", "client")
+        assert backend.created == []
+
+        fake_clock.now += CREATE_RETRY_SECONDS
+        assert (await registry.bind("soporte", "m", "client")).cached_content == "cachedContents/1"
+        assert registry.stats()["inline"] == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_short_prefix_and_bytes_sent(self):
+        """Test que un prefijo por debajo del mínimo se envía completo y cuenta en los bytes enviados"""
+        registry, backend = make_registry(min_tokens=100_000)
+        await registry.register("corto", "Responde en español.")
+
+        binding = await registry.bind("corto", "m", "client")
+        registry.record_sent("Hola", binding)
+        registry.record_sent("Hola")
+
+        assert backend.created == []
+        assert registry.stats()["bytes_sent"] == len("Hola") * 2 + len("Responde en español.".encode("utf-8"))
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_replacing_prefix_changes_fingerprint(self):
+        """Test que reemplazar el contenido borra los handles y cambia la huella de caché"""
+        registry, backend = make_registry()
+        request = QueryRequest(prompt="Hola", prefix="soporte")
+        first = await registry.register("soporte", INSTRUCTIONS)
+        await registry.bind("soporte", "m", "client")
+
+        second = await registry.register("soporte", INSTRUCTIONS + " Sé breve.")
+
+        assert backend.deleted == ["cachedContents/1"]
+        assert request_fingerprint("m", request, first.digest) != request_fingerprint("m", request, second.digest)
+
+
+class TestServicePrefixCache:
+    """Tests del caché de prefijos integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_query_sends_only_suffix_with_handle(self, make_genia_service):
+        """Test que la consulta envía el prompt y el handle, no el prefijo"""
+        service = make_genia_service(PREFIX_CACHE_MIN_TOKENS=0)
+        service.cache = None
+        backend = FakeCachedContentBackend()
+        service.prefix_cache.backend = backend
+        await service.prefix_cache.register("soporte", INSTRUCTIONS)
+        upstream_response = Mock()
+        upstream_response.text = "ok"
+
+        with patch.object(service, '_generate_content_with_config', return_value=upstream_response) as mock_generate:
+            for prompt in ("Hola", "Adiós"):
+                await service.query(QueryRequest(prompt=prompt, prefix="soporte", quality="fast"))
+
+        configs = [call.args[1] for call in mock_generate.call_args_list]
+        assert [config["cached_content"] for config in configs] == ["cachedContents/1"] * 2
+        assert all("system_instruction" not in config for config in configs)
+        assert len(backend.created) == 1
+        stats = service.get_upstream_stats()["prefix_cache"]
+        assert stats["bytes_sent"] == len("Hola") + len("Adiós".encode("utf-8"))
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_unknown_prefix_rejected_before_upstream(self, genia_service):
+        """Test que un prefijo no registrado falla sin llamar a Gemini"""
+        service = genia_service
+
+        with patch.object(service, '_generate_content_with_config') as mock_generate:
+            with pytest.raises(UnknownPrefixError):
+                await service.query(QueryRequest(prompt="Hola", prefix="no-existe"))
+        mock_generate.assert_not_called()
+
+
+class TestPrefixEndpoints:
+    """Tests de los endpoints de prefijos"""
+
+    @pytest.mark.integration
+    def test_register_list_and_delete(self, client):
+        """Test del ciclo registrar, listar y borrar un prefijo"""
+        response = client.post("/prefixes", json={"name": "soporte-v1", "content": INSTRUCTIONS})
+        assert response.status_code == 201
+        assert response.json()["size_bytes"] == len(INSTRUCTIONS.encode("utf-8"))
+
+        names = [item["name"] for item in client.get("/prefixes").json()["data"]["prefixes"]]
+        assert "soporte-v1" in names
+
+        assert client.delete("/prefixes/soporte-v1").status_code == 204
+        assert client.delete("/prefixes/soporte-v1").status_code == 404
+        assert len(genia_service.prefix_cache) == 0
+
+    @pytest.mark.integration
+    def test_invalid_prefix_name_rejected(self, client):
+        """Test que un nombre de prefijo inválido no pasa la validación"""
+        response = client.post("/prefixes", json={"name": "con espacios", "content": INSTRUCTIONS})
+        assert response.status_code == 422
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query')
+    def test_query_with_unknown_prefix_returns_400(self, mock_query, client):
+        """Test que una consulta con un prefijo no registrado recibe 400"""
+        mock_query.side_effect = UnknownPrefixError("no-existe")
+        response = client.post("/query", json={"prompt": "Hola", "prefix": "no-existe"})
+
+        assert response.status_code == 400
+        assert response.json()["detail"]["error"] == "unknown_prefix"
+
+    @pytest.mark.integration
+    @patch('services.genia_service.query_stream')
+    def test_stream_with_unknown_prefix_returns_400(self, mock_query_stream, client):
+        """Test que /query/stream rechaza un prefijo no registrado con 400, como /query"""
+        response = client.post("/query/stream", json={"prompt": "Hola", "prefix": "no-existe"})
+
+        assert response.status_code == 400
+        assert response.json()["detail"]["error"] == "unknown_prefix"
+        mock_query_stream.assert_not_called()
@@ -0,0 +1,214 @@
+"""
+Tests para el limitador de cuota RPM/TPM.
+"""
+import pytest
+import asyncio
+import time
+import threading
+from unittest.mock import Mock, patch
+from rate_limit import (
+    TokenBuckets, MemoryBucketStore, FileBucketStore,
+    UpstreamRateLimiter, RateLimitExceededError
+)
+from services import GeniaAPIService
+
+
+class TestTokenBuckets:
+    """Tests de la aritmética de los buckets"""
+
+    @pytest.mark.unit
+    def test_take_consumes_both_buckets(self):
+        """Test que una llamada consume una petición y sus tokens"""
+        buckets = TokenBuckets(rpm=60, tpm=1000)
+        state, wait = buckets.take((60.0, 1000.0, 0.0), 0.0, 300)
+        assert wait == 0.0
+        assert state[:2] == (59.0, 700.0)
+
+    @pytest.mark.unit
+    def test_wait_until_tokens_refill(self):
+        """Test que sin tokens suficientes se calcula la espera sin consumir"""
+        buckets = TokenBuckets(rpm=60, tpm=600)
+        state, wait = buckets.take((60.0, 100.0, 0.0), 0.0, 200)
+        assert wait == pytest.approx(10.0)  # faltan 100 tokens a 10 tokens/s
+        assert state[:2] == (60.0, 100.0)
+
+        state, wait = buckets.take(state, 10.0, 200)
+        assert wait == 0.0
+
+    @pytest.mark.unit
+    def test_unlimited_bucket_ignored(self):
+        """Test que un límite 0 no restringe"""
+        buckets = TokenBuckets(rpm=0, tpm=100)
+        state, wait = buckets.take((0.0, 100.0, 0.0), 0.0, 50)
+        assert wait == 0.0
+
+    @pytest.mark.unit
+    def test_oversized_request_capped_to_capacity(self):
+        """Test que una petición mayor que el bucket no espera para siempre"""
+        buckets = TokenBuckets(rpm=0, tpm=100)
+        _, wait = buckets.take((0.0, 100.0, 0.0), 0.0, 10_000)
+        assert wait == 0.0
+
+    @pytest.mark.unit
+    def test_memory_store_refund(self):
+        """Test que los tokens no usados vuelven al bucket"""
+        store = MemoryBucketStore(TokenBuckets(rpm=0, tpm=1000), clock=lambda: 0.0)
+        store.take(800)
+        store.refund(500)
+        assert store.levels()[1] == 700.0
+
+    @pytest.mark.unit
+    def test_negative_refund_charges_overuse(self):
+        """Test que un ajuste negativo carga los tokens usados de más"""
+        store = MemoryBucketStore(TokenBuckets(rpm=0, tpm=1000), clock=lambda: 0.0)
+        store.take(100)
+        store.refund(-300)
+        assert store.levels()[1] == 600.0
+
+
+class TestFileBucketStore:
+    """Tests del estado compartido en archivo"""
+
+    @pytest.mark.unit
+    def test_state_shared_between_instances(self, tmp_path):
+        """Test que dos instancias (procesos) comparten la misma cuota"""
+        path = str(tmp_path / "quota.bin")
+        first = FileBucketStore(TokenBuckets(rpm=2, tpm=0), path)
+        second = FileBucketStore(TokenBuckets(rpm=2, tpm=0), path)
+
+        assert first.take(0) == 0.0
+        assert second.take(0) == 0.0
+        assert first.take(0) > 0
+        first.close()
+        second.close()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_file_operations_run_off_event_loop(self, tmp_path):
+        """Test que flock/pread del archivo no bloquean el event loop"""
+        limiter = UpstreamRateLimiter(rpm=60, tpm=1000, state_file=str(tmp_path / "quota.bin"))
+        loop_thread = threading.get_ident()
+        threads = []
+        take = limiter.store.take
+
+        def tracked_take(tokens):
+            threads.append(threading.get_ident())
+            return take(tokens)
+
+        limiter.store.take = tracked_take
+        await limiter.acquire(10)
+        assert threads and loop_thread not in threads
+        limiter.store.close()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stats_do_not_take_file_lock(self, tmp_path):
+        """Test que stats() (desde el event loop) no toma el flock del archivo"""
+        limiter = UpstreamRateLimiter(rpm=60, tpm=1000, state_file=str(tmp_path / "quota.bin"))
+        await limiter.acquire(100)
+
+        limiter.store._update = lambda change: pytest.fail("stats() took the file lock")
+        stats = limiter.stats()
+        assert stats["available_requests"] == pytest.approx(59, abs=0.1)
+        assert stats["available_tokens"] == pytest.approx(900, abs=1)
+        limiter.store.close()
+
+
+class TestUpstreamRateLimiter:
+    """Tests de la admisión con cola"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_waits_for_quota_instead_of_failing(self):
+        """Test que sin cuota la llamada espera y luego pasa"""
+        limiter = UpstreamRateLimiter(rpm=600, max_wait=1.0)  # 10 peticiones/s
+        limiter.store = MemoryBucketStore(TokenBuckets(rpm=600, tpm=0))
+        limiter.store._state = (0.0, 0.0, time.monotonic())
+
+        start = time.monotonic()
+        await limiter.acquire(10)
+        assert 0.05 < time.monotonic() - start < 0.5
+        assert limiter.delayed == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_rejects_when_wait_exceeds_limit(self):
+        """Test que se rechaza si la cuota no llegaría a tiempo"""
+        limiter = UpstreamRateLimiter(rpm=1, max_wait=0.5)
+        await limiter.acquire(1)
+
+        start = time.monotonic()
+        with pytest.raises(RateLimitExceededError) as exc_info:
+            await limiter.acquire(1)
+        assert time.monotonic() - start < 0.1
+        assert exc_info.value.retry_after > 50
+        assert limiter.rejected == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_queue_is_bounded(self):
+        """Test que la cola de espera está acotada"""
+        limiter = UpstreamRateLimiter(rpm=60, max_queue=2, max_wait=5.0)
+        limiter.store._state = (0.0, 0.0, time.monotonic())
+
+        waiters = [asyncio.ensure_future(limiter.acquire(1)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceededError):
+            await limiter.acquire(1)
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert limiter.stats()["waiting"] == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_fifo_admission(self):
+        """Test que las llamadas en cola se admiten en orden de llegada"""
+        limiter = UpstreamRateLimiter(rpm=1200, max_wait=2.0)  # 20 peticiones/s
+        limiter.store._state = (0.0, 0.0, time.monotonic())
+        order = []
+
+        async def caller(i):
+            await limiter.acquire(1)
+            order.append(i)
+
+        await asyncio.gather(*[caller(i) for i in range(4)])
+        assert order == [0, 1, 2, 3]
+
+
+class TestServiceRateLimit:
+    """Tests del limitador integrado en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_generate_reserves_and_refunds_tokens(self, make_genia_service):
+        """Test que se reserva prompt + max_tokens y se devuelve lo no usado"""
+        service = make_genia_service(RATE_LIMIT_TPM=10_000)
+        response = Mock()
+        response.text = "ok"
+        response.usage_metadata = Mock(prompt_token_count=5, candidates_token_count=10, total_token_count=15)
+
+        with patch.object(service, '_generate_content_with_config', return_value=response):
+            await service._generate("Hola", {"max_output_tokens": 1000})
+
+        assert service.rate_limiter.stats()["available_tokens"] == pytest.approx(10_000 - 15, abs=1)
+        assert service.get_upstream_stats()["rate_limit"]["admitted"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_failed_call_refunds_reservation(self, make_genia_service):
+        """Test que una llamada fallida devuelve toda su reserva TPM"""
+        service = make_genia_service(RATE_LIMIT_TPM=10_000)
+
+        with patch.object(service, '_generate_content_with_config', side_effect=ValueError("boom")):
+            with pytest.raises(ValueError):
+                await service._generate("Hola", {"max_output_tokens": 1000})
+
+        assert service.rate_limiter.stats()["available_tokens"] == pytest.approx(10_000, abs=1)
+
+    @pytest.mark.unit
+    def test_rate_limit_disabled_by_default(self):
+        """Test que sin RPM/TPM configurados no hay limitador"""
+        service = GeniaAPIService()
+        assert service.rate_limiter is None
@@ -0,0 +1,225 @@
+"""
+Tests para la política de reintentos con deadline.
+"""
+import pytest
+import asyncio
+import time
+from unittest.mock import Mock, patch
+from google.genai import errors as genai_errors
+from retry import (
+    RetryPolicy, UpstreamTimeoutError, DeadlineExceededError,
+    is_retryable, retry_after_seconds
+)
+from models import QueryRequest
+from services import GeniaAPIService
+
+
+def api_error(code, details=None, headers=None):
+    """Crear un APIError de google-genai con código y cabeceras dadas"""
+    response = Mock()
+    response.headers = headers or {}
+    return genai_errors.APIError(code, details or {"error": {"message": "fallo", "status": "X"}}, response)
+
+
+def flaky(failures, result="ok"):
+    """Operación que falla con los errores dados y luego devuelve `result`"""
+    pending = list(failures)
+    calls = []
+
+    async def operation():
+        calls.append(time.monotonic())
+        if pending:
+            raise pending.pop(0)
+        return result
+
+    return operation, calls
+
+
+class TestRetryClassification:
+    """Tests de clasificación de errores y Retry-After"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("code,expected", [
+        (429, True), (503, True), (500, True), (504, True), (400, False), (403, False), (404, False)
+    ])
+    def test_api_error_codes(self, code, expected):
+        """Test que solo los códigos transitorios se reintentan"""
+        assert is_retryable(api_error(code)) is expected
+
+    @pytest.mark.unit
+    def test_network_and_timeout_errors_retryable(self):
+        """Test que timeouts y errores de red se reintentan"""
+        assert is_retryable(UpstreamTimeoutError("t"))
+        assert is_retryable(ConnectionError("reset"))
+        assert not is_retryable(ValueError("bad request"))
+        assert not is_retryable(Exception("API timeout"))
+
+    @pytest.mark.unit
+    def test_retry_after_header(self):
+        """Test lectura de la cabecera Retry-After"""
+        assert retry_after_seconds(api_error(429, headers={"retry-after": "2"})) == 2.0
+
+    @pytest.mark.unit
+    def test_retry_info_delay(self):
+        """Test lectura de RetryInfo.retryDelay en el cuerpo del error"""
+        details = {"error": {"code": 429, "details": [
+            {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1.5s"}
+        ]}}
+        assert retry_after_seconds(api_error(429, details=details)) == 1.5
+        assert retry_after_seconds(api_error(429)) is None
+
+
+class TestRetryPolicy:
+    """Tests de RetryPolicy"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors_then_succeeds(self):
+        """Test que 429/503 se reintentan hasta obtener respuesta"""
+        policy = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01)
+        operation, calls = flaky([api_error(429), api_error(503)])
+
+        assert await policy.run(operation) == "ok"
+        assert len(calls) == 3
+        stats = policy.stats()
+        assert stats["retries"] == 2
+        assert stats["attempts_histogram"] == {3: 1}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_non_retryable_error_fails_immediately(self):
+        """Test que un 400 no se reintenta"""
+        policy = RetryPolicy(max_retries=3, base_delay=0.001)
+        operation, calls = flaky([api_error(400)])
+
+        with pytest.raises(genai_errors.APIError):
+            await policy.run(operation)
+        assert len(calls) == 1
+        assert policy.retries == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_retries_exhausted(self):
+        """Test que se propaga el último error al agotar los reintentos"""
+        policy = RetryPolicy(max_retries=2, base_delay=0.001, max_delay=0.001)
+        operation, calls = flaky([api_error(503)] * 5)
+
+        with pytest.raises(genai_errors.APIError):
+            await policy.run(operation)
+        assert len(calls) == 3
+        assert policy.exhausted == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_attempt_timeout(self):
+        """Test que un intento colgado se corta y se reintenta"""
+        policy = RetryPolicy(max_retries=1, attempt_timeout=0.05, base_delay=0.001)
+        attempts = 0
+
+        async def operation():
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                await asyncio.sleep(10)
+            return "ok"
+
+        assert await policy.run(operation) == "ok"
+        assert attempts == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_operation_timed_only_cut_by_deadline(self):
+        """Test que si el intento aplica su propio timeout, aquí solo lo corta el deadline"""
+        policy = RetryPolicy(max_retries=1, attempt_timeout=0.01, base_delay=0.001)
+        attempts = 0
+
+        async def operation():
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        assert await policy.run(operation, operation_timed=True) == "ok"
+        with pytest.raises(DeadlineExceededError):
+            await policy.run(operation, deadline=time.monotonic() + 0.02, operation_timed=True)
+        assert attempts == 2
+        assert policy.retries == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_backoff_never_exceeds_deadline(self):
+        """Test que no se espera un Retry-After que sobrepasa el deadline"""
+        policy = RetryPolicy(max_retries=3, total_timeout=0.2)
+        operation, calls = flaky([api_error(429, headers={"retry-after": "5"})])
+
+        start = time.monotonic()
+        with pytest.raises(genai_errors.APIError):
+            await policy.run(operation)
+        assert time.monotonic() - start < 0.1
+        assert len(calls) == 1
+        assert policy.deadline_exceeded == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_expired_deadline(self):
+        """Test que con el deadline vencido no se hace ningún intento"""
+        policy = RetryPolicy()
+        operation, calls = flaky([])
+
+        with pytest.raises(DeadlineExceededError):
+            await policy.run(operation, deadline=time.monotonic() - 1)
+        assert calls == []
+
+    @pytest.mark.unit
+    def test_backoff_full_jitter_bounds(self):
+        """Test que el backoff crece exponencialmente con tope"""
+        policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+        error = api_error(503)
+        assert all(0 <= policy.backoff(1, error) <= 0.5 for _ in range(50))
+        assert all(0 <= policy.backoff(5, error) <= 2.0 for _ in range(50))
+
+
+class TestServiceRetries:
+    """Tests de los reintentos integrados en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_query_retries_rate_limited_call(self, genia_service):
+        """Test que query reintenta un 429 y devuelve la respuesta"""
+        service = genia_service
+        upstream_response = Mock()
+        upstream_response.text = "Respuesta tras reintento"
+        service.retry_policy = RetryPolicy(max_retries=2, base_delay=0.001, max_delay=0.001)
+
+        with patch.object(
+            service, '_generate_content_with_config',
+            side_effect=[api_error(429), upstream_response]
+        ) as mock_generate:
+            response = await service.query(QueryRequest(prompt="Hola", temperature=0.7))
+
+        assert mock_generate.call_count == 2
+        assert response.response == "Respuesta tras reintento"
+        assert service.get_upstream_stats()["retries"]["retries"] == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_slow_gemini_call_times_out_and_retries(self, genia_service):
+        """Test que una llamada que ya salió y supera ATTEMPT_TIMEOUT se reintenta"""
+        service = genia_service
+        upstream_response = Mock()
+        upstream_response.text = "Respuesta tras timeout"
+        service.retry_policy = RetryPolicy(max_retries=1, attempt_timeout=0.05, base_delay=0.001, max_delay=0.001)
+        calls = []
+
+        def generate(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                time.sleep(0.2)
+            return upstream_response
+
+        with patch.object(service, '_generate_content_with_config', side_effect=generate):
+            response = await service.query(QueryRequest(prompt="Hola"))
+
+        assert len(calls) == 2
+        assert response.response == "Respuesta tras timeout"
+        assert service.get_upstream_stats()["retries"]["retries"] == 1
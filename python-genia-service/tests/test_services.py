@@ -5,7 +5,9 @@ import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 from services import GeniaAPIService
 from models import QueryRequest, QueryResponse
+from google.genai import errors as genai_errors
 import asyncio
+import threading
 
 
 class TestGeniaAPIService:
@@ -115,6 +117,23 @@ class TestGeniaAPIService:
         
         assert "Google Gemini API error" in str(excinfo.value)
         assert "API timeout" in str(excinfo.value)
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    @patch('services.GeniaAPIService._generate_content_with_config')
+    async def test_query_without_text(self, mock_generate, service_with_api_key, sample_query_request, mock_google_client):
+        """Test que una respuesta sin texto (MAX_TOKENS, bloqueo de seguridad) no es un error"""
+        mock_response = MagicMock()
+        mock_response.text = None
+        mock_response.usage_metadata = None
+        mock_response.candidates = [MagicMock(finish_reason="SAFETY")]
+        mock_generate.return_value = mock_response
+        service_with_api_key.client = mock_google_client
+
+        response = await service_with_api_key.query(sample_query_request)
+
+        assert response.response == ""
+        assert response.finish_reason == "safety"
     
     @pytest.mark.unit
     @pytest.mark.asyncio
@@ -256,4 +275,381 @@ class TestGeniaAPIServiceIntegration:
         assert len(responses) == 5
         for i, response in enumerate(responses):
             assert f"Pregunta {i}" in response.response
-            assert response.tokens_used > 0
\ No newline at end of file
+            assert response.tokens_used > 0
+
+class TestClientBackends:
+    """Tests para los backends async y thread del cliente de Gemini"""
+
+    @pytest.fixture
+    def service(self, genia_service):
+        return genia_service
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_async_backend_uses_aio_client(self, service, sample_query_request):
+        """Test que el backend async usa client.aio sin pasar por threads"""
+        mock_response = MagicMock()
+        mock_response.text = "Respuesta async"
+        service.client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        service.backend = "async"
+
+        response = await service.query(sample_query_request)
+
+        assert response.response == "Respuesta async"
+        service.client.aio.models.generate_content.assert_awaited_once()
+        service.client.models.generate_content.assert_not_called()
+        assert service._executor is None
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_thread_backend_uses_dedicated_executor(self, service, sample_query_request):
+        """Test que el backend thread usa un pool propio y close() lo libera"""
+        service.backend = "thread"
+
+        response = await service.query(sample_query_request)
+
+        assert response.response == service.client.models.generate_content.return_value.text
+        assert service._executor is not None
+        service.close()
+        assert service._executor is None
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_semaphore_limits_concurrency(self, service):
+        """Test que la concurrencia la limita el semáforo configurado"""
+        service.backend = "async"
+        service._concurrency = asyncio.Semaphore(2)
+        active = 0
+        peak = 0
+
+        async def slow_generate(**kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            response = MagicMock()
+            response.text = "ok"
+            return response
+
+        service.client.aio.models.generate_content = slow_generate
+        requests = [QueryRequest(prompt=f"Pregunta {i}") for i in range(6)]
+        await asyncio.gather(*[service.query(r) for r in requests])
+
+        assert peak == 2
+
+    @pytest.mark.unit
+    def test_model_info_reports_backend(self, service):
+        """Test que get_model_info informa backend y concurrencia"""
+        info = service.get_model_info()
+        assert info["client_backend"] == service.backend
+        assert info["max_concurrency"] == service.max_concurrency
+
+
+class FakeChunk:
+    """Fragmento falso de generate_content_stream"""
+
+    def __init__(self, text, finish_reason=None):
+        self.text = text
+        self.candidates = [MagicMock(finish_reason=finish_reason)] if finish_reason else None
+
+
+class TestQueryStream:
+    """Tests para query_stream contra un stream falso local"""
+
+    @pytest.fixture
+    def service(self, genia_service):
+        return genia_service
+
+    @staticmethod
+    def fake_chunks():
+        return [FakeChunk("Hola "), FakeChunk(""), FakeChunk("mundo"), FakeChunk("!", finish_reason="STOP")]
+
+    async def collect(self, service, request):
+        return [event async for event in service.query_stream(request)]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_async_backend(self, service, sample_query_request):
+        """Test streaming con el backend async"""
+        chunks = self.fake_chunks()
+
+        async def fake_stream():
+            for chunk in chunks:
+                yield chunk
+
+        service.backend = "async"
+        service.client.aio.models.generate_content_stream = AsyncMock(return_value=fake_stream())
+
+        events = await self.collect(service, sample_query_request)
+
+        assert [e["data"]["text"] for e in events if e["event"] == "chunk"] == ["Hola ", "mundo", "!"]
+        done = events[-1]
+        assert done["event"] == "done"
+        assert done["data"]["finish_reason"] == "stop"
+        assert done["data"]["chunks"] == 3
+        assert done["data"]["tokens_used"] >= 1
+        assert done["data"]["time_to_first_token"] is not None
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_thread_backend(self, service, sample_query_request):
+        """Test streaming con el backend thread y cola acotada"""
+        service.backend = "thread"
+        service.client.models.generate_content_stream.return_value = iter(self.fake_chunks())
+
+        events = await self.collect(service, sample_query_request)
+
+        assert "".join(e["data"]["text"] for e in events if e["event"] == "chunk") == "Hola mundo!"
+        assert events[-1]["event"] == "done"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_thread_backend_error(self, service, sample_query_request):
+        """Test que un error del stream síncrono llega al consumidor"""
+        def failing_stream():
+            yield FakeChunk("parcial")
+            raise RuntimeError("stream cortado")
+
+        service.backend = "thread"
+        service.client.models.generate_content_stream.return_value = failing_stream()
+
+        with pytest.raises(RuntimeError, match="stream cortado"):
+            await self.collect(service, sample_query_request)
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_consumer_leaves_early(self, service, sample_query_request):
+        """Test que si el consumidor se va, el productor no queda bloqueado"""
+        with patch('config.settings.STREAM_BUFFER_CHUNKS', 1):
+            service.backend = "thread"
+            service.client.models.generate_content_stream.return_value = iter(
+                [FakeChunk(f"parte {i}") for i in range(50)]
+            )
+            stream = service.query_stream(sample_query_request)
+            first = await stream.__anext__()
+            await stream.aclose()
+
+        assert first["data"]["text"] == "parte 0"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_disconnect_releases_slot_while_upstream_blocks(self, service, sample_query_request):
+        """Test que al irse el consumidor se libera el hueco sin esperar al siguiente fragmento"""
+        release = threading.Event()
+
+        def blocking_stream():
+            yield FakeChunk("parte 0")
+            release.wait(5)
+            yield FakeChunk("parte 1")
+
+        service.backend = "thread"
+        service.client.models.generate_content_stream.return_value = blocking_stream()
+        free_slots = service._concurrency._value
+        try:
+            stream = service.query_stream(sample_query_request)
+            await stream.__anext__()
+            await asyncio.wait_for(stream.aclose(), timeout=1)
+
+            assert service._concurrency._value == free_slots
+            assert service.circuit_breaker.stats()["window_calls"] == 0
+        finally:
+            release.set()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_failure_reported_to_breaker_and_health(self, service, sample_query_request):
+        """Test que un fallo transitorio del stream cuenta para el circuito y la salud de Gemini"""
+        def failing_stream():
+            yield FakeChunk("parcial")
+            raise genai_errors.APIError(503, {"error": {"message": "unavailable"}}, MagicMock())
+
+        service.backend = "thread"
+        service.client.models.generate_content_stream.return_value = failing_stream()
+
+        with pytest.raises(genai_errors.APIError):
+            await self.collect(service, sample_query_request)
+
+        circuit = service.circuit_breaker.stats()
+        assert circuit["window_calls"] == 1
+        assert circuit["failure_rate"] == 1.0
+        health = service.health_monitor.snapshot()
+        assert health["consecutive_failures"] == 1
+        assert "unavailable" in health["last_error"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stream_without_client_fails(self, service_without_client, sample_query_request):
+        """Test que el streaming falla sin cliente configurado"""
+        with pytest.raises(Exception, match="not configured"):
+            await self.collect(service_without_client, sample_query_request)
+
+    @pytest.fixture
+    def service_without_client(self):
+        with patch('config.settings.GENIA_API_KEY', None):
+            return GeniaAPIService()
+
+
+class TestQueryBatch:
+    """Tests para query_batch"""
+
+    @pytest.fixture
+    def service(self, genia_service):
+        return genia_service
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_batch_dedupes_and_isolates_errors(self, service):
+        """Test que el lote deduplica y aísla errores por consulta"""
+        calls = []
+
+        async def fake_query(request):
+            calls.append(request.prompt)
+            if request.prompt == "falla":
+                raise Exception("error puntual")
+            return QueryResponse(response=f"R: {request.prompt}", tokens_used=1,
+                                 model="gemini-1.5-flash", processing_time=0.01)
+
+        requests = [QueryRequest(prompt=p) for p in ["a", "b", "a", "falla"]]
+        with patch.object(service, "query", side_effect=fake_query):
+            results = [r async for r in service.query_batch(requests)]
+
+        assert sorted(calls) == ["a", "b", "falla"]
+        by_index = {r.index: r for r in results}
+        assert len(by_index) == 4
+        assert by_index[0].response.response == by_index[2].response.response == "R: a"
+        assert by_index[3].success is False
+        assert "error puntual" in by_index[3].error
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_batch_respects_concurrency(self, service):
+        """Test que el lote respeta el límite de concurrencia"""
+        active = 0
+        peak = 0
+
+        async def fake_query(request):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return QueryResponse(response="ok", tokens_used=1, model="gemini-1.5-flash", processing_time=0.01)
+
+        requests = [QueryRequest(prompt=f"Pregunta {i}") for i in range(10)]
+        with patch.object(service, "query", side_effect=fake_query):
+            results = [r async for r in service.query_batch(requests, concurrency=3)]
+
+        assert len(results) == 10
+        assert peak == 3
+
+
+class RecordingModels:
+    """Superficie falsa de client.models que registra la configuración recibida"""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, model, contents, config=None):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        response = MagicMock()
+        response.text = "OK"
+        response.usage_metadata = None
+        return response
+
+
+class RecordingAsyncModels(RecordingModels):
+    """Superficie falsa de client.aio.models"""
+
+    async def generate_content(self, model, contents, config=None):
+        return RecordingModels.generate_content(self, model, contents, config)
+
+
+class RecordingClient:
+    """Cliente falso con superficies síncrona y asíncrona"""
+
+    def __init__(self):
+        self.models = RecordingModels()
+        self.aio = MagicMock()
+        self.aio.models = RecordingAsyncModels()
+
+
+class TestGenerationConfigPassThrough:
+    """Tests que verifican que los límites de generación llegan a Gemini"""
+
+    @pytest.fixture
+    def service(self, genia_service):
+        genia_service.client = RecordingClient()
+        return genia_service
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("backend", ["thread", "async"])
+    @pytest.mark.asyncio
+    async def test_query_forwards_typed_config(self, service, backend):
+        """Test que query envía un GenerateContentConfig con los límites del request"""
+        from google.genai import types
+        service.backend = backend
+        request = QueryRequest(prompt="Test", max_tokens=123, temperature=0.2, top_p=0.8, top_k=20)
+
+        await service.query(request)
+
+        models = service.client.aio.models if backend == "async" else service.client.models
+        config = models.calls[0]["config"]
+        assert isinstance(config, types.GenerateContentConfig)
+        assert config.max_output_tokens == 123
+        assert config.temperature == 0.2
+        assert config.top_p == 0.8
+        assert config.top_k == 20
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_health_check_limits_output_tokens(self, service):
+        """Test que el health check pide pocos tokens de salida"""
+        service.backend = "thread"
+
+        assert await service.health_check() is True
+
+        config = service.client.models.calls[0]["config"]
+        assert config.max_output_tokens == 16
+        assert config.temperature == 0.0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_health_check_empty_text_is_healthy(self, service):
+        """Test que una respuesta vacía por MAX_TOKENS cuenta como Gemini disponible"""
+        service.backend = "async"
+        response = MagicMock(text="")
+        service.client.aio.models.generate_content = AsyncMock(return_value=response)
+
+        assert await service.health_check() is True
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_health_check_bypasses_admission_layers(self, service):
+        """Test que la sonda no pasa por el limitador de cuota ni la cola justa"""
+        service.backend = "thread"
+        service.rate_limiter = MagicMock()
+        service.fair_scheduler = MagicMock()
+
+        assert await service.health_check() is True
+
+        service.rate_limiter.acquire.assert_not_called()
+        service.fair_scheduler.slot.assert_not_called()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_probe_failure_sets_last_error(self, service):
+        """Test que el motivo de un fallo de la sonda llega a last_error del monitor"""
+        service.backend = "async"
+        service.client.aio.models.generate_content = AsyncMock(side_effect=ConnectionError("connection refused"))
+
+        assert await service.health_check() is False
+        await service.health_monitor.refresh()
+
+        assert "connection refused" in service.health_monitor.snapshot()["last_error"]
+
+    @pytest.mark.unit
+    def test_empty_config_is_none(self):
+        """Test que una configuración vacía no se envía"""
+        assert GeniaAPIService._to_generate_content_config(None) is None
+        assert GeniaAPIService._to_generate_content_config({}) is None
@@ -0,0 +1,215 @@
+"""
+Tests para la coalescencia single-flight.
+"""
+import pytest
+import asyncio
+import time
+from unittest.mock import patch
+from singleflight import SingleFlight
+from deadline import request_deadline
+from fair_queue import current_tenant
+from retry import DeadlineExceededError
+from models import QueryRequest, QueryResponse
+from services import GeniaAPIService
+
+
+class TestSingleFlight:
+    """Test suite para SingleFlight"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test que llamadas concurrentes comparten una sola ejecución"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "resultado"
+
+        results = await asyncio.gather(*[flight.do("k", upstream) for _ in range(10)])
+
+        assert calls == 1
+        assert results == ["resultado"] * 10
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 9}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_different_keys_run_separately(self):
+        """Test que claves distintas no se agrupan"""
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        await asyncio.gather(flight.do("a", upstream), flight.do("b", upstream))
+        assert flight.leaders == 2
+        assert flight.coalesced == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_error_propagates_to_all_waiters(self):
+        """Test que el error de la llamada compartida llega a todos"""
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise ValueError("fallo upstream")
+
+        results = await asyncio.gather(
+            *[flight.do("k", upstream) for _ in range(3)], return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+        assert flight.in_flight() == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_waiter_cancellation_does_not_cancel_shared_call(self):
+        """Test que cancelar un interesado no cancela la llamada de los demás"""
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        first = asyncio.ensure_future(flight.do("k", upstream))
+        second = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert await second == "ok"
+        assert first.cancelled()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_last_waiter_cancellation_cancels_shared_call(self):
+        """Test que si se cancela el último interesado se cancela la llamada"""
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(flight.do("k", upstream))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert cancelled.is_set()
+        assert flight.in_flight() == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_leader_deadline_does_not_bound_followers(self):
+        """Test que el deadline corto del primero no corta la espera de uno con deadline largo"""
+        flight = SingleFlight()
+        seen_deadlines = []
+
+        async def upstream():
+            seen_deadlines.append(request_deadline.get())
+            await asyncio.sleep(0.1)
+            return "ok"
+
+        async def waiter(budget):
+            token = request_deadline.set(time.monotonic() + budget)
+            try:
+                return await flight.do("k", upstream)
+            finally:
+                request_deadline.reset(token)
+
+        results = await asyncio.gather(waiter(0.02), waiter(5.0), return_exceptions=True)
+
+        assert isinstance(results[0], DeadlineExceededError)
+        assert results[1] == "ok"
+        assert seen_deadlines == [None]
+        assert flight.leaders == 1
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_last_waiter_deadline_cancels_shared_call(self):
+        """Test que si vence el deadline del único interesado se cancela la llamada"""
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        token = request_deadline.set(time.monotonic() + 0.02)
+        try:
+            with pytest.raises(DeadlineExceededError):
+                await flight.do("k", upstream)
+        finally:
+            request_deadline.reset(token)
+        await asyncio.sleep(0)
+
+        assert cancelled.is_set()
+        assert flight.in_flight() == 0
+
+
+class TestServiceSingleFlight:
+    """Tests de la coalescencia integrada en GeniaAPIService"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_identical_queries_coalesced(self, genia_service):
+        """Test que consultas idénticas concurrentes hacen una sola llamada"""
+        service = genia_service
+        service.single_flight = SingleFlight()
+        request = QueryRequest(prompt="Botón popular", temperature=0.7)
+        calls = 0
+
+        async def fake_upstream(req, decision):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return QueryResponse(response="ok", tokens_used=1, model="gemini-1.5-flash", processing_time=0.05)
+
+        with patch.object(service, "_query_upstream", side_effect=fake_upstream):
+            responses = await asyncio.gather(*[service.query(request) for _ in range(5)])
+
+        assert calls == 1
+        assert all(r.response == "ok" for r in responses)
+        assert service.get_single_flight_stats()["coalesced"] == 4
+
+    @pytest.mark.unit
+    def test_single_flight_stats_disabled(self, make_genia_service):
+        """Test estadísticas con single-flight deshabilitado"""
+        service = make_genia_service(SINGLE_FLIGHT_ENABLED=False)
+        assert service.get_single_flight_stats() == {"enabled": False}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_tenants_not_coalesced(self, genia_service):
+        """Test que consultas idénticas de tenants distintos no comparten llamada"""
+        service = genia_service
+        service.single_flight = SingleFlight()
+        request = QueryRequest(prompt="Botón popular", temperature=0.7)
+        tenants = []
+
+        async def fake_upstream(req, decision):
+            tenants.append(current_tenant.get())
+            await asyncio.sleep(0.05)
+            return QueryResponse(response="ok", tokens_used=1, model="gemini-1.5-flash", processing_time=0.05)
+
+        async def query_as(tenant):
+            current_tenant.set(tenant)
+            return await service.query(request)
+
+        with patch.object(service, "_query_upstream", side_effect=fake_upstream):
+            await asyncio.gather(query_as("tenant-a"), query_as("tenant-a"), query_as("tenant-b"))
+
+        assert sorted(tenants) == ["tenant-a", "tenant-b"]
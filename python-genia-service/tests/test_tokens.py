@@ -0,0 +1,152 @@
+"""
+Tests para el conteo local de tokens.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from tokens import TokenCounter, count_tokens
+from services import GeniaAPIService
+
+
+class FakeEncoding:
+    """Codificación falsa: un token por palabra"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_ordinary(self, text):
+        self.calls += 1
+        return text.split()
+
+
+def counter_with_fake_encoding(**kwargs) -> TokenCounter:
+    counter = TokenCounter(**kwargs)
+    counter._encoding = FakeEncoding()
+    counter._encoding_loaded = True
+    return counter
+
+
+class TestTokenCounter:
+    """Test suite para TokenCounter"""
+
+    @pytest.mark.unit
+    def test_heuristic_without_encoding(self):
+        """Test heurística por caracteres cuando no hay tokenizador"""
+        counter = TokenCounter(encoding_name=None)
+        assert counter.warm_up() is False
+        assert counter.count("") == 0
+        assert counter.count("abcd") == 1
+        assert counter.count("abcde") == 2
+        assert counter.stats()["tokenizer"] == "heuristic"
+
+    @pytest.mark.unit
+    def test_failed_encoding_load_falls_back_once(self):
+        """Test que un fallo al cargar tiktoken cae a la heurística una sola vez"""
+        counter = TokenCounter(encoding_name="no-existe")
+        with patch("tiktoken.get_encoding", side_effect=ValueError("sin red")) as mock_get:
+            assert counter.count("abcdefgh") == 2
+            assert counter.count("otro texto") >= 1
+        assert mock_get.call_count == 1
+
+    @pytest.mark.unit
+    def test_encoding_used_for_short_text(self):
+        """Test que los textos cortos se cuentan completos con el tokenizador"""
+        counter = counter_with_fake_encoding()
+        assert counter.count("uno dos tres") == 3
+        assert counter.stats()["tokenizer"] == "cl100k_base"
+
+    @pytest.mark.unit
+    def test_long_text_is_sampled(self):
+        """Test que los textos largos se cuentan por muestreo"""
+        counter = counter_with_fake_encoding(sample_chars=300)
+        text = "abcd " * 10000  # 50000 caracteres, 10000 palabras
+        tokens = counter.count(text)
+        assert 9000 <= tokens <= 11000
+        assert counter._encoding.calls == 3
+
+    @pytest.mark.unit
+    def test_lru_cache_hits_and_eviction(self):
+        """Test de la caché LRU de conteos"""
+        counter = counter_with_fake_encoding(cache_size=2)
+        counter.count("a b")
+        counter.count("a b")
+        counter.count("c d")
+        counter.count("e f")
+
+        stats = counter.stats()
+        assert stats["cache_hits"] == 1
+        assert stats["cache_misses"] == 3
+        assert stats["cache_entries"] == 2
+        assert counter._encoding.calls == 3
+
+    @pytest.mark.unit
+    def test_count_uncached_does_not_fill_cache(self):
+        """Test que count_uncached no usa la caché"""
+        counter = counter_with_fake_encoding()
+        assert counter.count_uncached("uno dos") == 2
+        assert counter.count_uncached("") == 0
+        assert counter.stats()["cache_entries"] == 0
+
+    @pytest.mark.unit
+    def test_global_count_tokens(self):
+        """Test del helper global"""
+        assert count_tokens("Hola mundo") >= 1
+
+
+class TestServiceTokenUsage:
+    """Tests del conteo de tokens en GeniaAPIService"""
+
+    @pytest.fixture
+    def service(self, genia_service):
+        return genia_service
+
+    @pytest.mark.unit
+    def test_usage_metadata_preferred(self, service):
+        """Test que se usan los tokens reales de usage_metadata"""
+        response = MagicMock()
+        response.usage_metadata.prompt_token_count = 12
+        response.usage_metadata.candidates_token_count = 30
+        response.usage_metadata.total_token_count = 45
+
+        usage = service._token_usage(response, "prompt", "texto")
+        assert usage == {"prompt_tokens": 12, "output_tokens": 30, "total_tokens": 45,
+                         "token_source": "usage_metadata"}
+
+    @pytest.mark.unit
+    def test_usage_metadata_without_total(self, service):
+        """Test que sin total_token_count se suma prompt + salida"""
+        response = MagicMock()
+        response.usage_metadata.prompt_token_count = 12
+        response.usage_metadata.candidates_token_count = 30
+        response.usage_metadata.total_token_count = None
+
+        assert service._token_usage(response, "prompt", "texto")["total_tokens"] == 42
+
+    @pytest.mark.unit
+    def test_estimated_when_metadata_missing(self, service):
+        """Test que sin usage_metadata se estima localmente"""
+        response = MagicMock()
+        response.usage_metadata = None
+
+        usage = service._token_usage(response, "¿Qué es la IA?", "Una respuesta")
+        assert usage["token_source"] == "estimated"
+        assert usage["total_tokens"] == usage["prompt_tokens"] + usage["output_tokens"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    @patch('services.GeniaAPIService._generate_content_with_config')
+    async def test_query_reports_usage(self, mock_generate, service, sample_query_request, mock_google_client):
+        """Test que QueryResponse informa los tokens de usage_metadata"""
+        mock_response = MagicMock()
+        mock_response.text = "Respuesta"
+        mock_response.usage_metadata.prompt_token_count = 8
+        mock_response.usage_metadata.candidates_token_count = 3
+        mock_response.usage_metadata.total_token_count = 11
+        mock_generate.return_value = mock_response
+        service.client = mock_google_client
+
+        response = await service.query(sample_query_request)
+
+        assert response.tokens_used == 3
+        assert response.prompt_tokens == 8
+        assert response.total_tokens == 11
+        assert response.token_source == "usage_metadata"